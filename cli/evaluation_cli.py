@@ -1,6 +1,8 @@
 import argparse
 import json
 from lib.evaluation import evaluate_command
+from lib.encoders import set_default_encoder_backend
+from lib.search_utils import ENCODER_BACKENDS, DEFAULT_ENCODER_BACKEND
 
 
 def main():
@@ -11,8 +13,15 @@ def main():
         default=5,
         help="Number of results to evaluate (k for precision@k, recall@k)",
     )
+    parser.add_argument(
+        "--backend",
+        choices=ENCODER_BACKENDS,
+        default=DEFAULT_ENCODER_BACKEND,
+        help="Runtime of the sentence encoder, defaults to $ENCODER_BACKEND or torch",
+    )
 
     args = parser.parse_args()
+    set_default_encoder_backend(args.backend)
     result = evaluate_command(args.limit)
 
     print(f"k={args.limit}\n")
@@ -25,6 +34,8 @@ def main():
         print(f"    - Retrieved: {", ".join(res["retrieved"])}")
         print(f"    - Relevant: {", ".join(res["relevant"])}")
         print()
+    cache = result["query_cache"]
+    print(f"Query embedding cache: {cache['hits']} hits, {cache['disk_hits']} disk hits, {cache['misses']} misses")
 
 if __name__ == "__main__":
     main()
@@ -5,15 +5,28 @@ from lib.hybrid_search import (
     normalize,
     weighted_search_command,
     rrf_search_command,
+    latency_report_command,
+    fusion_report_command,
 )
+from lib.encoders import set_default_encoder_backend
 from lib.search_utils import (
     DEFAULT_SEARCH_LIMIT,
     ALPHA_CONSTANT_HYBRID,
     K_CONSTANT_RRF,
+    HYBRID_LEG_TIMEOUT,
+    ENCODER_BACKENDS,
+    DEFAULT_ENCODER_BACKEND,
 )
 
+def add_leg_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--sequential", action="store_true", help="Run the BM25 and semantic legs one after the other")
+    parser.add_argument("--leg-timeout", type=float, default=HYBRID_LEG_TIMEOUT, help="Seconds a leg may take before results come from the other leg alone")
+    parser.add_argument("--timing", action="store_true", help="Print the time each leg took and how many of its results fusion read")
+    parser.add_argument("--exhaustive", action="store_true", help="Fuse every limit * 500 results of both legs instead of stopping once the top results are settled")
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Hybrid Search CLI")
+    parser.add_argument("--backend", choices=ENCODER_BACKENDS, default=DEFAULT_ENCODER_BACKEND, help="Runtime of the sentence encoder, defaults to $ENCODER_BACKEND or torch")
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
 
     normalize_parser = subparsers.add_parser("normalize", help="Normalize a list of scores to match semantic scores")
@@ -23,6 +36,7 @@ def main() -> None:
     weighted_search_parser.add_argument("query", type=str, help="The query to search the documents")
     weighted_search_parser.add_argument("--alpha", type=float, nargs="?", default=ALPHA_CONSTANT_HYBRID, help="The alpha constant to use in the search")
     weighted_search_parser.add_argument("--limit", type=int, nargs="?", default=DEFAULT_SEARCH_LIMIT, help="Limit the number of results returned")
+    add_leg_arguments(weighted_search_parser)
     
     rrf_search_parser = subparsers.add_parser("rrf-search", help="Seach using Reciprical Rank Fusion")
     rrf_search_parser.add_argument("query", type=str, help="The query to search the documents")
@@ -31,8 +45,19 @@ def main() -> None:
     rrf_search_parser.add_argument("--enhance", type=str, choices=["spell", "rewrite", "expand"], help="Query enhancement method")
     rrf_search_parser.add_argument("--rerank-method", type=str, choices=["individual", "batch", "cross_encoder"], help="Rerank method")
     rrf_search_parser.add_argument("--evaluate", action="store_true", help="Evaluate the search results using an LLM")
+    add_leg_arguments(rrf_search_parser)
     
+    latency_report_parser = subparsers.add_parser("latency_report", help="Time loading, warmup and hot RRF queries of a resident engine")
+    latency_report_parser.add_argument("--k", type=int, default=K_CONSTANT_RRF, help="The k constant of RRF")
+    latency_report_parser.add_argument("--limit", type=int, default=DEFAULT_SEARCH_LIMIT, help="Limit the number of results returned")
+
+    fusion_report_parser = subparsers.add_parser("fusion_report", help="Compare adaptive with exhaustive fusion on the golden queries")
+    fusion_report_parser.add_argument("--k", type=int, default=K_CONSTANT_RRF, help="The k constant of RRF")
+    fusion_report_parser.add_argument("--alpha", type=float, default=ALPHA_CONSTANT_HYBRID, help="The alpha constant of weighted search")
+    fusion_report_parser.add_argument("--limit", type=int, default=DEFAULT_SEARCH_LIMIT, help="Limit the number of results returned")
+
     args = parser.parse_args()
+    set_default_encoder_backend(args.backend)
 
     match args.command:
         case "normalize":
@@ -40,9 +65,17 @@ def main() -> None:
             for score in scores:
                 print(f"* {score:.4f}")
         case "weighted-search":
-            weighted_search_command(args.query, args.alpha, args.limit)
+            weighted_search_command(args.query, args.alpha, args.limit, not args.sequential, args.leg_timeout, args.timing, not args.exhaustive)
         case "rrf-search":
-            rrf_search_command(args.query, args.k, args.limit, args.enhance, args.rerank_method, args.evaluate)  
+            rrf_search_command(args.query, args.k, args.limit, args.enhance, args.rerank_method, args.evaluate, not args.sequential, args.leg_timeout, args.timing, not args.exhaustive)  
+        case "latency_report":
+            report = latency_report_command(args.k, args.limit)
+            print(f"load {report['load_ms']:.1f}ms, warmup {report['warmup_ms']:.1f}ms, reload check {report['reload_check_ms']:.3f}ms")
+            for mode, row in report["modes"].items():
+                print(f"{report['queries']} hot {mode} queries: p50 {row['p50_ms']:.2f}ms, p99 {row['p99_ms']:.2f}ms (bm25 p99 {row['bm25_p99_ms']:.2f}ms, semantic p99 {row['semantic_p99_ms']:.2f}ms)")
+        case "fusion_report":
+            for row in fusion_report_command(args.k, args.alpha, args.limit):
+                print(f"{row['method']}: identical {row['identical']}, results read {row['exhaustive_read']:.0f} -> {row['adaptive_read']:.0f}, {row['exhaustive_ms']:.2f}ms -> {row['adaptive_ms']:.2f}ms per query")
         case _:
             parser.print_help()
 
@@ -8,9 +8,19 @@ from lib.keyword_search import (
     bm25_idf_command,
     bm25_tf_command,
     bm25search_command,
+    bm25search_pruned_command,
+    bm25search_batch_command,
+    bench_bm25_command,
+    index_report_command,
+    upsert_command,
+    delete_command,
+    merge_command,
+    spell_command,
 )
+from lib.title_completion import suggest_command
+from lib.sharded_search import build_shards_command, sharded_search_command
 
-from lib.search_utils import BM25_K1, BM25_B, DEFAULT_SEARCH_LIMIT, load_movies
+from lib.search_utils import BM25_K1, BM25_B, DEFAULT_SEARCH_LIMIT, DEFAULT_IMPACT_BITS, BENCHMARK_LIMITS, DEFAULT_BUILD_WORKERS, DEFAULT_SHARDS, load_movies
 
 import argparse
 
@@ -20,7 +30,13 @@ def main() -> None:
     parser = argparse.ArgumentParser(description="Keyword Search CLI")
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
 
-    subparsers.add_parser("build", help="Build Inverted Index of Movies")
+    build_parser = subparsers.add_parser("build", help="Build Inverted Index of Movies")
+    build_parser.add_argument("--impacts", action="store_true", help="Precompute BM25 impacts for pruned search")
+    build_parser.add_argument("--workers", type=int, default=DEFAULT_BUILD_WORKERS, help="Number of tokenizer processes")
+    build_parser.add_argument("--positions", action="store_true", help="Store token positions for phrase and proximity queries")
+    build_parser.add_argument("--fields", action="store_true", help="Store per field statistics for BM25F scoring")
+    build_parser.add_argument("--compress", action="store_true", help="Delta encode and bit-pack the postings")
+    build_parser.add_argument("--quantize-bits", type=int, nargs="?", const=DEFAULT_IMPACT_BITS, default=0, help="Store impacts as ints with this many bits")
     
     search_parser = subparsers.add_parser("search", help="Search movies using BM25")
     search_parser.add_argument("query", type=str, help="Search query")
@@ -48,16 +64,60 @@ def main() -> None:
     bm25_tf_parser.add_argument("b", type=float, nargs='?', default=BM25_B, help="Tunable BM25 B parameter for length normalization")
     
     bm25search_parser = subparsers.add_parser("bm25search", help="Search movies using full BM25 scoring")
-    bm25search_parser.add_argument("query", type=str, help="Search query")
+    bm25search_parser.add_argument("query", type=str, help='Search query, "quoted words" match as a phrase and "quoted words"~N within N positions')
     bm25search_parser.add_argument("--limit", type=int, nargs="?", default=DEFAULT_SEARCH_LIMIT, help="Set limit of Documents Scores: Default 5")
+    bm25search_parser.add_argument("--no-typos", action="store_true", help="Don't expand unknown tokens to nearby vocabulary terms")
+    bm25search_parser.add_argument("--fields", action="store_true", help="Score with BM25F, title and description weighted separately")
+    bm25search_parser.add_argument("--pruned", action="store_true", help="Use MaxScore top-k pruning over precomputed impacts")
+
+    bm25batch_parser = subparsers.add_parser("bm25batch", help="Run every query in a file through BM25 as one batch")
+    bm25batch_parser.add_argument("path", type=str, help="Text file with one query per line")
+    bm25batch_parser.add_argument("--limit", type=int, nargs="?", default=DEFAULT_SEARCH_LIMIT, help="Set limit of Documents Scores: Default 5")
+
+    bench_parser = subparsers.add_parser("bench", help="Compare pruned and exhaustive BM25 latency on the golden dataset queries")
+    bench_parser.add_argument("--limits", type=int, nargs="*", default=list(BENCHMARK_LIMITS), help="Result limits to benchmark")
+
+    spell_parser = subparsers.add_parser("spell", help="Show the vocabulary terms a misspelled word expands to")
+    spell_parser.add_argument("word", type=str, help="Word to look up")
+
+    shardbuild_parser = subparsers.add_parser("shardbuild", help="Build the index as shards split by doc id")
+    shardbuild_parser.add_argument("--shards", type=int, default=DEFAULT_SHARDS, help="Number of shards")
+    shardbuild_parser.add_argument("--workers", type=int, default=1, help="Number of tokenizer processes per shard")
+    shardbuild_parser.add_argument("--positions", action="store_true", help="Store token positions for phrase and proximity queries")
+    shardbuild_parser.add_argument("--fields", action="store_true", help="Store per field statistics for BM25F scoring")
+
+    shardsearch_parser = subparsers.add_parser("shardsearch", help="Search every shard in its own process and merge the top results")
+    shardsearch_parser.add_argument("query", type=str, help="Search query")
+    shardsearch_parser.add_argument("--limit", type=int, nargs="?", default=DEFAULT_SEARCH_LIMIT, help="Set limit of Documents Scores: Default 5")
+    shardsearch_parser.add_argument("--no-typos", action="store_true", help="Don't expand unknown tokens to nearby vocabulary terms")
+    shardsearch_parser.add_argument("--fields", action="store_true", help="Score with BM25F, title and description weighted separately")
+
+    suggest_parser = subparsers.add_parser("suggest", help="Complete a movie title from its first letters")
+    suggest_parser.add_argument("prefix", type=str, help="Start of the title or of any word in it")
+    suggest_parser.add_argument("--limit", type=int, nargs="?", default=DEFAULT_SEARCH_LIMIT, help="Set limit of suggestions: Default 5")
+
+    upsert_parser = subparsers.add_parser("upsert", help="Add or replace movies without rebuilding the index")
+    upsert_parser.add_argument("path", type=str, help="JSON file with a movie, a list of movies or a movies.json style object")
+
+    delete_parser = subparsers.add_parser("delete", help="Remove movies from the index")
+    delete_parser.add_argument("doc_ids", type=int, nargs="+", help="Document IDs to delete")
+
+    merge_parser = subparsers.add_parser("merge", help="Merge delta segments and tombstones into one segment")
+    merge_parser.add_argument("--compress", action="store_true", default=None, help="Delta encode and bit-pack the merged postings")
+    merge_parser.add_argument("--impacts", action="store_true", help="Precompute BM25 impacts for pruned search")
+    merge_parser.add_argument("--quantize-bits", type=int, nargs="?", const=DEFAULT_IMPACT_BITS, default=0, help="Store impacts as ints with this many bits")
+
+    subparsers.add_parser("report", help="Compare index size and latency of pickle, segment and compressed segment formats")
 
     args = parser.parse_args()
 
     match args.command:
         case "build":
             print("Building inverted index...")
-            build_command()
+            report = build_command(args.impacts or args.quantize_bits > 0, args.quantize_bits, args.compress, args.workers, args.positions, args.fields)
             print("Inverted index built successfully.")
+            print(f"{report['docs']} docs in {report['seconds']:.2f}s ({report['docs_per_sec']:.0f} docs/sec) with {report['workers']} workers")
+            print(f"Peak memory: {report['peak_rss_kib'] / 1024:.1f} MiB main, {report['peak_worker_rss_kib'] / 1024:.1f} MiB largest worker")
         case "search":
             print(f'Searching for: {args.query}')
             results = search_command(args.query)
@@ -81,9 +141,48 @@ def main() -> None:
             result = bm25_tf_command(args.doc_id, args.term, args.k1, args.b)
             print(f"BM25 TF score of '{args.term}' in document '{args.doc_id}': {result:.2f}")
         case "bm25search":
-            results = bm25search_command(args.query, args.limit)
+            if args.pruned and args.fields:
+                parser.error("--pruned scores with precomputed BM25 impacts and can't be combined with --fields")
+            if args.pruned:
+                results = bm25search_pruned_command(args.query, args.limit, not args.no_typos)
+            else:
+                results = bm25search_command(args.query, args.limit, not args.no_typos, args.fields)
             for i, res in enumerate(results, 1):
                 print(f"{i}. ({res["id"]}) {res["title"]} - Score: {res["score"]:.2f}")
+        case "bm25batch":
+            queries, results, elapsed = bm25search_batch_command(args.path, args.limit)
+            for query, scored in zip(queries, results):
+                print(f"{query}: " + ", ".join(f"({res['id']}) {res['title']} {res['score']:.2f}" for res in scored))
+            print(f"{len(queries)} queries in {elapsed:.1f}ms ({elapsed / max(len(queries), 1):.3f}ms/query)")
+        case "bench":
+            for row in bench_bm25_command(tuple(args.limits)):
+                print(f"k={row['limit']}: exhaustive {row['exhaustive_ms']:.2f}ms, pruned {row['pruned_ms']:.2f}ms, overlap {row['overlap']:.3f} over {row['queries']} queries")
+        case "spell":
+            for term, distance in spell_command(args.word):
+                print(f"{term} (edit distance {distance})")
+        case "shardbuild":
+            count = build_shards_command(args.shards, args.workers, args.positions, args.fields)
+            print(f"Built {count} shards")
+        case "shardsearch":
+            results = sharded_search_command(args.query, args.limit, not args.no_typos, args.fields)
+            for i, res in enumerate(results, 1):
+                print(f"{i}. ({res['id']}) {res['title']} - Score: {res['score']:.2f}")
+        case "suggest":
+            for i, res in enumerate(suggest_command(args.prefix, args.limit), 1):
+                print(f"{i}. {res['title']} ID: {res['id']}")
+        case "upsert":
+            count, elapsed = upsert_command(args.path)
+            print(f"Upserted {count} movies in {elapsed:.1f}ms")
+        case "delete":
+            count, elapsed = delete_command(args.doc_ids)
+            print(f"Deleted {count} movies in {elapsed:.1f}ms")
+        case "merge":
+            count = merge_command(args.compress, args.impacts or args.quantize_bits > 0, args.quantize_bits)
+            print(f"Merged {count} segments into one")
+        case "report":
+            for row in index_report_command():
+                query = "n/a" if row["query_ms"] is None else f"{row['query_ms']:.2f}ms"
+                print(f"{row['format']}: {row['disk_bytes'] / 1024:.1f} KiB on disk, load {row['load_ms']:.2f}ms, {row['memory_bytes'] / 1024:.1f} KiB peak heap on load, query {query}")
         case _:
             parser.print_help()
 
@@ -1,10 +1,9 @@
 from .search_utils import (
-    load_movies,
     DEFAULT_SEARCH_LIMIT,
     K_CONSTANT_RRF,
 )
 from .hybrid_search import (
-    HybridSearch,
+    hybrid_engine,
 )
 
 from gemini import (
@@ -15,8 +14,7 @@ from gemini import (
 )
 
 def rag_command(query: str):
-    movies = load_movies()
-    rrf_search = HybridSearch(movies)
+    rrf_search = hybrid_engine()
     rrf_results = rrf_search.rrf_search(query, K_CONSTANT_RRF, DEFAULT_SEARCH_LIMIT)
     rag_response = augmented_results(query, rrf_results)
     print("Search Results:")
@@ -28,8 +26,7 @@ def rag_command(query: str):
     print(rag_response)
 
 def summarize_command(query: str, limit: int = DEFAULT_SEARCH_LIMIT):
-    movies = load_movies()
-    rrf_search = HybridSearch(movies)
+    rrf_search = hybrid_engine()
     rrf_results = rrf_search.rrf_search(query, K_CONSTANT_RRF, DEFAULT_SEARCH_LIMIT)
     summary = summarize_results(query, rrf_results)
     print("Search Results:")
@@ -41,8 +38,7 @@ def summarize_command(query: str, limit: int = DEFAULT_SEARCH_LIMIT):
     print(summary)
 
 def citation_command(query: str, limit: int = DEFAULT_SEARCH_LIMIT):
-    movies = load_movies()
-    rrf_search = HybridSearch(movies)
+    rrf_search = hybrid_engine()
     rrf_results = rrf_search.rrf_search(query, K_CONSTANT_RRF, DEFAULT_SEARCH_LIMIT)
     cite_result = cite_results(query, rrf_results)
     print("Search Results:")
@@ -54,8 +50,7 @@ def citation_command(query: str, limit: int = DEFAULT_SEARCH_LIMIT):
     print(cite_result)
 
 def question_command(query: str, limit: int = DEFAULT_SEARCH_LIMIT):
-    movies = load_movies()
-    rrf_search = HybridSearch(movies)
+    rrf_search = hybrid_engine()
     rrf_results = rrf_search.rrf_search(query, K_CONSTANT_RRF, DEFAULT_SEARCH_LIMIT)
     answer = question_results(query, rrf_results)
     print("Search Results:")
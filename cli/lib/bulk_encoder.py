@@ -0,0 +1,166 @@
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+
+from .search_utils import (
+    DEFAULT_ENCODE_WORKERS,
+    BULK_BATCH_TOKENS,
+    BULK_MAX_BATCH,
+    BULK_CHECKPOINT_EVERY,
+    BULK_STREAM_WINDOW,
+)
+from .vector_index import normalize_embeddings
+
+
+def estimate_tokens(text: str) -> int:
+    #word count stands in for the tokenizer, it only has to order texts and size batches
+    return max(len(text.split()), 1)
+
+
+def plan_batches(texts: list[str], rows: list[int], batch_tokens: int = BULK_BATCH_TOKENS, max_batch: int = BULK_MAX_BATCH) -> list[list[int]]:
+    #rows sorted by length so a batch pads to similar lengths, each batch holds about batch_tokens padded tokens
+    order = sorted(rows, key=lambda row: estimate_tokens(texts[row]))
+    batches, batch, longest = [], [], 0
+    for row in order:
+        length = estimate_tokens(texts[row])
+        if batch and (max(longest, length) * (len(batch) + 1) > batch_tokens or len(batch) == max_batch):
+            batches.append(batch)
+            batch, longest = [], 0
+        batch.append(row)
+        longest = max(longest, length)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def stream_batches(items, done: np.ndarray, window: int = BULK_STREAM_WINDOW, batch_tokens: int = BULK_BATCH_TOKENS, max_batch: int = BULK_MAX_BATCH):
+    #(row, text) pairs in, (rows, texts) batches out for the rows not yet done, planned a window
+    #at a time so only window texts are held however long the stream is
+    pending = []
+    for row, text in items:
+        if done[row]:
+            continue
+        pending.append((row, text))
+        if len(pending) == window:
+            yield from _window_batches(pending, batch_tokens, max_batch)
+            pending = []
+    yield from _window_batches(pending, batch_tokens, max_batch)
+
+
+def _window_batches(pending: list[tuple[int, str]], batch_tokens: int, max_batch: int):
+    texts = [text for _, text in pending]
+    for batch in plan_batches(texts, list(range(len(pending))), batch_tokens, max_batch):
+        yield [pending[i][0] for i in batch], [texts[i] for i in batch]
+
+
+_worker_model = None
+
+def _load_encoder_worker(model_name: str, backend: str, threads: int):
+    #pool initializer, every worker gets its own model and a share of the cores
+    global _worker_model
+    import torch
+    from .encoders import load_encoder
+    torch.set_num_threads(threads)
+    _worker_model = load_encoder(model_name, backend)
+
+
+def _encode_batch(texts: list[str]) -> np.ndarray:
+    return normalize_embeddings(_worker_model.encode(texts, batch_size=len(texts), show_progress_bar=False))
+
+
+def _worker_dimensions() -> int:
+    return _worker_model.get_sentence_embedding_dimension()
+
+
+def open_output(path: str, rows: int, dimensions: int, job: str) -> tuple[np.ndarray, np.ndarray]:
+    #preallocated .npy matrix and its done mask, reopened when an interrupted run of the same job left them behind
+    checkpoint_path, done_path = f"{path}.checkpoint.json", f"{path}.done.npy"
+    if os.path.exists(checkpoint_path) and os.path.exists(path) and os.path.exists(done_path):
+        with open(checkpoint_path, "r") as f:
+            checkpoint = json.load(f)
+        if checkpoint == {"job": job, "rows": rows, "dimensions": dimensions}:
+            return np.lib.format.open_memmap(path, mode="r+"), np.lib.format.open_memmap(done_path, mode="r+")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    output = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(rows, dimensions))
+    done = np.lib.format.open_memmap(done_path, mode="w+", dtype=np.bool_, shape=(rows,))
+    with open(checkpoint_path, "w") as f:
+        json.dump({"job": job, "rows": rows, "dimensions": dimensions}, f)
+    return output, done
+
+
+def close_output(path: str, output: np.ndarray):
+    #the matrix is complete, the checkpoint files go
+    output.flush()
+    for name in (f"{path}.checkpoint.json", f"{path}.done.npy"):
+        if os.path.exists(name):
+            os.remove(name)
+
+
+class BulkEncoder:
+    #length sorted, token budgeted batches, encoded in process or on a pool and written straight into the output rows
+    def __init__(self, model_name: str, model=None, workers: int = DEFAULT_ENCODE_WORKERS, batch_tokens: int = BULK_BATCH_TOKENS, max_batch: int = BULK_MAX_BATCH, backend: str = "torch"):
+        self.model_name = model_name
+        self.backend = backend
+        self.model = model #used in process when workers is 1
+        self.workers = workers
+        self.batch_tokens = batch_tokens
+        self.max_batch = max_batch
+        self.pool = None
+
+    def __enter__(self) -> "BulkEncoder":
+        if self.workers > 1:
+            threads = max((os.cpu_count() or 1) // self.workers, 1)
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_load_encoder_worker, initargs=(self.model_name, self.backend, threads))
+        return self
+
+    def __exit__(self, *exc):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    def dimensions(self) -> int:
+        if self.pool is not None:
+            return self.pool.submit(_worker_dimensions).result()
+        return self.model.get_sentence_embedding_dimension()
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        return normalize_embeddings(self.model.encode(texts, batch_size=len(texts), show_progress_bar=False))
+
+    def encode_into(self, texts: list[str | None], output: np.ndarray, done: np.ndarray) -> int:
+        #fills every row not yet marked done, texts of done rows may be None
+        return self.encode_stream(enumerate(texts), output, done)
+
+    def encode_stream(self, items, output: np.ndarray, done: np.ndarray) -> int:
+        #fills the rows of (row, text) pairs not yet marked done, returns how many texts were encoded
+        batches = stream_batches(items, done, batch_tokens=self.batch_tokens, max_batch=self.max_batch)
+        written, encoded = 0, 0
+
+        def store(batch, embeddings):
+            nonlocal written, encoded
+            output[batch] = embeddings
+            done[batch] = True
+            written += 1
+            encoded += len(batch)
+            if written % BULK_CHECKPOINT_EVERY == 0:
+                #rows are flushed before the mask that claims them
+                output.flush()
+                done.flush()
+
+        if self.pool is None:
+            for batch, texts in batches:
+                store(batch, self._encode(texts))
+        else:
+            #a bounded number of batches in flight keeps finished results, and the stream, from piling up
+            running = {}
+            for batch, texts in batches:
+                if len(running) == 2 * self.workers:
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        store(running.pop(future), future.result())
+                running[self.pool.submit(_encode_batch, texts)] = batch
+            for future, batch in running.items():
+                store(batch, future.result())
+        output.flush()
+        done.flush()
+        return encoded
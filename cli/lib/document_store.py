@@ -0,0 +1,102 @@
+import os
+import json
+import shutil
+import numpy as np
+
+from .index_segment import load_array, string_at, string_table, swap_directory
+from .search_utils import (
+    CACHE_DIR,
+    DATA_PATH,
+    INDEX_FIELDS,
+    load_movies,
+)
+
+DOCUMENTS_META = "documents.json"
+#  ids: row - movie id, in the order the documents were given
+#  id_order: rows sorted by movie id, for id lookups
+#  <field> / <field>_offsets: string table of every text field, row aligned
+
+
+class DocumentStore:
+    #columnar movies on disk, a row only becomes a dict when it's asked for
+    def __init__(self, arrays: dict[str, np.ndarray], meta: dict):
+        self.arrays = arrays
+        self.meta = meta
+        self.fields = meta["fields"]
+        self.ids = arrays["ids"]
+        self.id_order = arrays["id_order"]
+
+    @classmethod
+    def from_documents(cls, documents: list[dict], fields: tuple[str, ...] = INDEX_FIELDS) -> "DocumentStore":
+        documents = list(documents)
+        arrays = {"ids": np.array([doc["id"] for doc in documents], dtype=np.int64)}
+        arrays["id_order"] = np.argsort(arrays["ids"], kind="stable")
+        for field in fields:
+            arrays[field], arrays[f"{field}_offsets"] = string_table([doc[field].encode() for doc in documents])
+        return cls(arrays, {"fields": list(fields), "count": len(documents)})
+
+    @classmethod
+    def open(cls, directory: str) -> "DocumentStore":
+        with open(os.path.join(directory, DOCUMENTS_META), "r") as f:
+            meta = json.load(f)
+        names = ["ids", "id_order"] + [name for field in meta["fields"] for name in (field, f"{field}_offsets")]
+        return cls({name: load_array(os.path.join(directory, f"{name}.npy")) for name in names}, meta)
+
+    @classmethod
+    def load_or_create(cls, directory: str | None = None) -> "DocumentStore":
+        #the shared movies store, rebuilt whenever movies.json changes
+        directory = directory or os.path.join(CACHE_DIR, "documents")
+        source_mtime = os.path.getmtime(DATA_PATH)
+        if os.path.exists(os.path.join(directory, DOCUMENTS_META)):
+            store = cls.open(directory)
+            if store.meta.get("source_mtime") == source_mtime:
+                return store
+        store = cls.from_documents(load_movies())
+        store.meta["source_mtime"] = source_mtime
+        store.save(directory)
+        return cls.open(directory)
+
+    def save(self, directory: str):
+        #staged and swapped in, another process may have the old files mapped
+        staging = f"{directory}.tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        for name, array in self.arrays.items():
+            np.save(os.path.join(staging, f"{name}.npy"), np.ascontiguousarray(array))
+        with open(os.path.join(staging, DOCUMENTS_META), "w") as f:
+            json.dump(self.meta, f)
+        swap_directory(staging, directory)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, row: int) -> dict:
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        doc = {"id": int(self.ids[row])}
+        for field in self.fields:
+            doc[field] = self.text(row, field)
+        return doc
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    def text(self, row: int, field: str) -> str:
+        return string_at(self.arrays[field], self.arrays[f"{field}_offsets"], row).decode()
+
+    def row_of(self, doc_id: int) -> int | None:
+        i = int(np.searchsorted(self.ids, doc_id, sorter=self.id_order))
+        if i < len(self.id_order) and self.ids[self.id_order[i]] == doc_id:
+            return int(self.id_order[i])
+        return None
+
+    def get(self, doc_id: int) -> dict | None:
+        row = self.row_of(doc_id)
+        return None if row is None else self[row]
+
+
+def load_documents() -> DocumentStore:
+    return DocumentStore.load_or_create()
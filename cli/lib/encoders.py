@@ -0,0 +1,65 @@
+import os
+from sentence_transformers import SentenceTransformer
+
+from .search_utils import (
+    CACHE_DIR,
+    DEFAULT_ENCODER_BACKEND,
+    ENCODER_BACKENDS,
+    ONNX_QUANTIZATION_CONFIG,
+)
+
+#  torch: the model as published, run by PyTorch
+#  onnx: the same weights exported to ONNX and run by ONNX Runtime
+#  onnx-int8: the ONNX export with dynamically quantized int8 weights, for CPU only query nodes
+_default_backend = DEFAULT_ENCODER_BACKEND
+
+
+def set_default_encoder_backend(backend: str):
+    #the CLIs' --backend, every search built afterwards without an explicit backend uses it
+    global _default_backend
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Unknown encoder backend {backend}")
+    _default_backend = backend
+
+
+def default_encoder_backend() -> str:
+    return _default_backend
+
+
+def encoder_id(model_name: str, backend: str) -> str:
+    #names the vectors a model and backend produce, so caches never mix backends
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+
+def quantized_onnx_dir(model_name: str, config: str = ONNX_QUANTIZATION_CONFIG) -> str:
+    return os.path.join(CACHE_DIR, "onnx", f"{model_name.replace('/', '__')}_qint8_{config}")
+
+
+def quantized_onnx_file(config: str = ONNX_QUANTIZATION_CONFIG) -> str:
+    return f"onnx/model_qint8_{config}.onnx"
+
+
+def export_quantized_onnx(model_name: str, config: str = ONNX_QUANTIZATION_CONFIG) -> str:
+    #exported once into the cache, config picks the int8 kernels (arm64, avx2, avx512, avx512_vnni)
+    directory = quantized_onnx_dir(model_name, config)
+    if os.path.exists(os.path.join(directory, quantized_onnx_file(config))):
+        return directory
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+    model = SentenceTransformer(model_name, backend="onnx")
+    model.save(directory)
+    export_dynamic_quantized_onnx_model(model, config, directory, file_suffix=f"qint8_{config}")
+    return directory
+
+
+def load_encoder(model_name: str, backend: str | None = None) -> SentenceTransformer:
+    backend = backend or default_encoder_backend()
+    match backend:
+        case "torch":
+            return SentenceTransformer(model_name)
+        case "onnx":
+            return SentenceTransformer(model_name, backend="onnx")
+        case "onnx-int8":
+            directory = export_quantized_onnx(model_name)
+            return SentenceTransformer(directory, backend="onnx", model_kwargs={"file_name": quantized_onnx_file()})
+        case _:
+            raise ValueError(f"Unknown encoder backend {backend}")
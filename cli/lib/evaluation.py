@@ -1,10 +1,9 @@
 from rapidfuzz import fuzz
-from lib.hybrid_search import HybridSearch
+from lib.hybrid_search import hybrid_engine
 from lib.search_utils import (
-    load_movies,
     load_golden_dataset,
 )
-from lib.semantic_search import SemanticSearch
+from lib.query_cache import default_query_cache
 
 def is_close_match(a: str, b: str, threshold: int = 80) -> bool:
     return fuzz.token_set_ratio(a, b) >= threshold
@@ -47,13 +46,11 @@ def recall_at_k(retrieved_docs: list[str], relevant_docs: set[str], k: int = 5,
     return len(matched_relevant) / len(relevant_docs) if relevant_docs else 0.0
 """
 def evaluate_command(limit: int = 5) -> dict:
-    movies = load_movies()
     golden_data = load_golden_dataset()
     test_cases = golden_data["test_cases"]
 
-    semantic_search = SemanticSearch()
-    semantic_search.load_or_create_embeddings(movies)
-    hybrid_search = HybridSearch(movies)
+    hybrid_search = hybrid_engine()
+    hybrid_search.warmup()
 
     total_precision = 0
     results_by_query = {}
@@ -82,4 +79,5 @@ def evaluate_command(limit: int = 5) -> dict:
         "test_cases_count": len(test_cases),
         "limit": limit,
         "results": results_by_query,
+        "query_cache": default_query_cache().stats(),
     }
@@ -0,0 +1,461 @@
+import os
+import json
+import shutil
+from bisect import bisect_left
+from collections import defaultdict
+
+import numpy as np
+
+SEGMENT_META = "segment.json"
+POSTINGS_BLOCK_SIZE = 128
+
+#array name - contents, every array is one .npy file opened with mmap
+#  terms: utf-8 bytes of every term, sorted by bytes
+#  term_offsets: start of term i in terms, n_terms + 1 entries
+#  postings_offsets: start of term i's postings, n_terms + 1 entries
+#  postings: (doc row, tf) pairs, rows ascending within a term (uncompressed segments)
+#  block_offsets: start of term i in the block table, n_terms + 1 entries (compressed segments)
+#  block_bases: first doc row of each block, doubles as a skip list
+#  block_widths: bits per row delta and per tf - 1 for each block
+#  block_data_offsets: start of each block in packed, n_blocks + 1 entries
+#  packed: bit-packed row deltas followed by bit-packed tfs, byte aligned per block
+#  doc_ids: row - movie id, ascending
+#  doc_lengths: row - token count
+#  impacts / max_impacts: precomputed bm25 per posting and per term maximum
+#  position_offsets: start of term i in positions, n_terms + 1 entries (positional segments)
+#  positions: token positions of every posting in posting order, the first one absolute and
+#    the rest as gaps within the posting, a posting's count is its tf
+#  delete_keys / delete_key_offsets: sorted string table of every term's deletion variants
+#  delete_offsets / delete_terms: term ids that produce variant i (symspell style typo lookup)
+#  field_tfs: per posting tf in each of meta["fields"], in posting order (field segments)
+#  field_lengths: row - token count of each field
+SEGMENT_ARRAYS = (
+    "terms",
+    "term_offsets",
+    "postings_offsets",
+    "postings",
+    "block_offsets",
+    "block_bases",
+    "block_widths",
+    "block_data_offsets",
+    "packed",
+    "doc_ids",
+    "doc_lengths",
+    "impacts",
+    "max_impacts",
+    "position_offsets",
+    "positions",
+    "delete_keys",
+    "delete_key_offsets",
+    "delete_offsets",
+    "delete_terms",
+    "field_tfs",
+    "field_lengths",
+)
+#opened on the first query that needs them instead of with the segment
+LAZY_ARRAYS = ("position_offsets", "positions", "delete_keys", "delete_key_offsets", "delete_offsets", "delete_terms")
+
+
+def load_array(path: str) -> np.ndarray:
+    #still backed by the mapping, a plain ndarray view just skips np.memmap's python level indexing
+    return np.load(path, mmap_mode="r").view(np.ndarray)
+
+
+def swap_directory(staging: str, directory: str):
+    #the live set is renamed aside rather than deleted before the staged one takes its name, a crash in
+    #between leaves it whole under .old, processes mapping its files keep them until they close
+    retired = f"{directory}.old"
+    shutil.rmtree(retired, ignore_errors=True)
+    if os.path.exists(directory):
+        os.replace(directory, retired)
+    os.replace(staging, directory)
+    shutil.rmtree(retired, ignore_errors=True)
+
+
+def string_at(blob: np.ndarray, offsets: np.ndarray, i: int) -> bytes:
+    return blob[offsets[i]:offsets[i + 1]].tobytes()
+
+
+def lower_bound(blob: np.ndarray, offsets: np.ndarray, value: bytes) -> int:
+    #binary search straight over a mmap'd string table, nothing is materialized
+    return bisect_left(range(len(offsets) - 1), value, key=lambda j: string_at(blob, offsets, j))
+
+
+def find_string(blob: np.ndarray, offsets: np.ndarray, value: bytes) -> int | None:
+    i = lower_bound(blob, offsets, value)
+    if i < len(offsets) - 1 and string_at(blob, offsets, i) == value:
+        return i
+    return None
+
+
+def string_table(values: list[bytes]) -> tuple[np.ndarray, np.ndarray]:
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in values])
+    return np.frombuffer(b"".join(values), dtype=np.uint8), offsets
+
+
+def deletion_variants(word: str, max_distance: int, prefix_length: int) -> set[str]:
+    #every string reachable from the word's prefix by up to max_distance deletions
+    word = word[:prefix_length]
+    variants = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {variant[:i] + variant[i + 1:] for variant in frontier for i in range(len(variant))}
+        variants |= frontier
+    return variants
+
+
+def pack_bits(values: np.ndarray, width: int) -> bytes:
+    if width == 0 or len(values) == 0:
+        return b""
+    shifts = np.arange(width - 1, -1, -1, dtype=np.uint64)
+    bits = (values.astype(np.uint64)[:, None] >> shifts) & 1
+    return np.packbits(bits.astype(np.uint8).ravel()).tobytes()
+
+
+def unpack_bits(data: np.ndarray, count: int, width: int) -> np.ndarray:
+    if width == 0 or count == 0:
+        return np.zeros(count, dtype=np.uint32)
+    bits = np.unpackbits(data, count=count * width).reshape(count, width)
+    weights = np.left_shift(1, np.arange(width - 1, -1, -1, dtype=np.uint64))
+    return (bits @ weights).astype(np.uint32)
+
+
+def posting_starts(tfs: np.ndarray) -> np.ndarray:
+    counts = tfs.astype(np.int64)
+    return np.cumsum(counts) - counts
+
+
+def take_positions(positions: np.ndarray, tfs: np.ndarray, index: np.ndarray) -> np.ndarray:
+    #flat positions of the postings picked by index, in that order
+    counts = tfs[index].astype(np.int64)
+    begin = np.repeat(posting_starts(tfs)[index], counts)
+    within = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+    return positions[begin + within]
+
+
+def positions_to_gaps(positions: np.ndarray, tfs: np.ndarray) -> np.ndarray:
+    gaps = positions.astype(np.int64)
+    gaps[1:] -= positions[:-1]
+    starts = posting_starts(tfs)
+    gaps[starts] = positions[starts]
+    return gaps
+
+
+def gaps_to_positions(gaps: np.ndarray, tfs: np.ndarray) -> np.ndarray:
+    totals = np.cumsum(gaps, dtype=np.int64)
+    carried = np.concatenate(([0], totals))[posting_starts(tfs)]
+    return totals - np.repeat(carried, tfs.astype(np.int64))
+
+
+def encode_block(rows: np.ndarray, tfs: np.ndarray) -> tuple[int, int, bytes]:
+    #first row is kept in block_bases, the rest are deltas from their predecessor
+    deltas = np.diff(rows)
+    tf_values = tfs - 1
+    delta_width = int(deltas.max()).bit_length() if len(deltas) else 0
+    tf_width = int(tf_values.max()).bit_length()
+    return delta_width, tf_width, pack_bits(deltas, delta_width) + pack_bits(tf_values, tf_width)
+
+
+def decode_block(base: int, count: int, delta_width: int, tf_width: int, data: np.ndarray) -> np.ndarray:
+    delta_bytes = ((count - 1) * delta_width + 7) // 8
+    postings = np.empty((count, 2), dtype=np.uint32)
+    postings[0, 0] = base
+    postings[1:, 0] = unpack_bits(data[:delta_bytes], count - 1, delta_width)
+    np.cumsum(postings[:, 0], out=postings[:, 0])
+    postings[:, 1] = unpack_bits(data[delta_bytes:], count, tf_width) + 1
+    return postings
+
+
+class IndexSegment:
+    def __init__(self, arrays: dict[str, np.ndarray], meta: dict):
+        self.arrays = arrays
+        self.meta = meta
+        self.terms = arrays["terms"]
+        self.term_offsets = arrays["term_offsets"]
+        self.postings_offsets = arrays["postings_offsets"]
+        self.doc_ids = arrays["doc_ids"]
+        self.doc_lengths = arrays["doc_lengths"]
+        self.impacts = arrays.get("impacts")
+        self.max_impacts = arrays.get("max_impacts")
+        self.compressed = bool(meta.get("compressed"))
+        self.has_positions = bool(meta.get("positions"))
+        self.fields = meta.get("fields")
+        self.field_lengths = arrays.get("field_lengths")
+        self.directory = None
+        self.term_count = len(self.term_offsets) - 1
+        self.doc_count = len(self.doc_ids)
+
+    @classmethod
+    def from_postings(cls, postings: dict[str, dict[int, int]], doc_lengths: dict[int, int], compress: bool = False,
+                      positions: dict[str, dict[int, list[int]]] | None = None, fields=None) -> "IndexSegment":
+        #postings: term - {movie id: tf}, positions: term - {movie id: ascending token positions}
+        #fields: (field names, term - {movie id: tf per field}, movie id - length per field)
+        doc_ids = np.array(sorted(doc_lengths), dtype=np.int64)
+        rows = {doc_id: row for row, doc_id in enumerate(doc_ids.tolist())}
+        lengths = np.array([doc_lengths[doc_id] for doc_id in doc_ids.tolist()], dtype=np.uint32)
+        field_names, field_tfs, field_lengths = fields if fields is not None else (None, None, None)
+        term_postings = []
+        for encoded, term in sorted((term.encode(), term) for term in postings):
+            block = sorted((rows[doc_id], tf, doc_id) for doc_id, tf in postings[term].items())
+            term_positions = None
+            if positions is not None:
+                term_positions = np.array([p for _, _, doc_id in block for p in positions[term][doc_id]], dtype=np.int64)
+            width = 2 + (len(field_names) if fields is not None else 0)
+            if fields is not None:
+                block = [(row, tf, *field_tfs[term][doc_id]) for row, tf, doc_id in block]
+            else:
+                block = [(row, tf) for row, tf, _ in block]
+            term_postings.append((encoded, np.array(block, dtype=np.uint32).reshape(-1, width), term_positions))
+        if fields is not None:
+            field_lengths = np.array([field_lengths[doc_id] for doc_id in doc_ids.tolist()], dtype=np.uint32).reshape(-1, len(field_names))
+            fields = (field_names, field_lengths)
+        return cls.assemble(term_postings, doc_ids, lengths, compress, fields)
+
+    @classmethod
+    def merge(cls, segments: list["IndexSegment"], live_rows: list[np.ndarray | None] | None = None, compress: bool = False) -> "IndexSegment":
+        #live_rows: per segment boolean mask over its rows, None keeps them all
+        #live doc ids must be disjoint across segments
+        if live_rows is None:
+            live_rows = [None] * len(segments)
+        kept_ids, kept_lengths, kept_field_lengths = [], [], []
+        for segment, live in zip(segments, live_rows):
+            kept_ids.append(segment.doc_ids if live is None else segment.doc_ids[live])
+            kept_lengths.append(segment.doc_lengths if live is None else segment.doc_lengths[live])
+            if segment.fields is not None:
+                kept_field_lengths.append(segment.field_lengths if live is None else segment.field_lengths[live])
+        doc_ids = np.concatenate(kept_ids).astype(np.int64) if segments else np.empty(0, dtype=np.int64)
+        lengths = np.concatenate(kept_lengths).astype(np.uint32) if segments else np.empty(0, dtype=np.uint32)
+        order = np.argsort(doc_ids, kind="stable")
+        doc_ids, lengths = doc_ids[order], lengths[order]
+
+        with_positions = bool(segments) and all(segment.has_positions for segment in segments)
+        #field tfs ride along as extra posting columns when every segment has the same fields
+        with_fields = bool(segments) and segments[0].fields is not None and all(segment.fields == segments[0].fields for segment in segments)
+        fields = None
+        if with_fields:
+            fields = (segments[0].fields, np.concatenate(kept_field_lengths).astype(np.uint32)[order])
+        row_maps = []
+        sources = defaultdict(list) #term bytes - [(segment index, term id)]
+        for i, (segment, live) in enumerate(zip(segments, live_rows)):
+            row_map = np.searchsorted(doc_ids, segment.doc_ids).astype(np.int64)
+            if live is not None:
+                row_map[~live] = -1
+            row_maps.append(row_map)
+            for term_id in range(segment.term_count):
+                sources[segment._term_bytes(term_id)].append((i, term_id))
+
+        term_postings = []
+        for encoded in sorted(sources):
+            parts, position_parts = [], []
+            for i, term_id in sources[encoded]:
+                postings = segments[i].term_postings(term_id)
+                rows = row_maps[i][postings[:, 0]]
+                keep = np.flatnonzero(rows >= 0)
+                columns = [rows[keep], postings[keep, 1]]
+                if with_fields:
+                    columns.append(segments[i].term_field_tfs(term_id)[keep])
+                parts.append(np.column_stack(columns).astype(np.uint32))
+                if with_positions:
+                    position_parts.append(take_positions(segments[i].term_positions(term_id), postings[:, 1], keep))
+            block = np.concatenate(parts)
+            if len(block) == 0:
+                continue
+            term_positions = np.concatenate(position_parts) if with_positions else None
+            if len(parts) > 1:
+                order = np.argsort(block[:, 0], kind="stable")
+                if with_positions:
+                    term_positions = take_positions(term_positions, block[:, 1], order)
+                block = block[order]
+            term_postings.append((encoded, block, term_positions))
+        return cls.assemble(term_postings, doc_ids, lengths, compress, fields)
+
+    @classmethod
+    def assemble(cls, term_postings: list[tuple[bytes, np.ndarray]], doc_ids: np.ndarray, lengths: np.ndarray, compress: bool = False,
+                 fields: tuple[list[str], np.ndarray] | None = None) -> "IndexSegment":
+        #term_postings: (utf-8 term, (row, tf, field tfs...) array, absolute positions or None) sorted by term bytes
+        #fields: (field names, row - length per field)
+        term_offsets = np.zeros(len(term_postings) + 1, dtype=np.int64)
+        postings_offsets = np.zeros(len(term_postings) + 1, dtype=np.int64)
+        for i, (encoded, block, _) in enumerate(term_postings):
+            term_offsets[i + 1] = term_offsets[i] + len(encoded)
+            postings_offsets[i + 1] = postings_offsets[i] + len(block)
+        width = 2 + (len(fields[0]) if fields is not None else 0)
+        postings = np.empty((0, width), dtype=np.uint32)
+        if term_postings:
+            postings = np.concatenate([block for _, block, _ in term_postings]).astype(np.uint32)
+        arrays = {
+            "terms": np.frombuffer(b"".join(encoded for encoded, _, _ in term_postings), dtype=np.uint8),
+            "term_offsets": term_offsets,
+            "postings_offsets": postings_offsets,
+            "postings": np.ascontiguousarray(postings[:, :2]),
+            "doc_ids": doc_ids,
+            "doc_lengths": lengths,
+        }
+        meta = {"total_length": int(lengths.sum())}
+        if fields is not None:
+            field_tfs = postings[:, 2:]
+            #a word rarely repeats 65k times in one field
+            dtype = np.uint16 if len(field_tfs) == 0 or field_tfs.max() <= np.iinfo(np.uint16).max else np.uint32
+            arrays["field_tfs"] = field_tfs.astype(dtype)
+            arrays["field_lengths"] = fields[1]
+            meta["fields"] = list(fields[0])
+        if term_postings and all(term_positions is not None for _, _, term_positions in term_postings):
+            gaps = [positions_to_gaps(term_positions, block[:, 1]) for _, block, term_positions in term_postings]
+            position_offsets = np.zeros(len(term_postings) + 1, dtype=np.int64)
+            position_offsets[1:] = np.cumsum([len(term_gaps) for term_gaps in gaps])
+            gaps = np.concatenate(gaps)
+            #gaps inside one short movie description almost always fit in 16 bits
+            dtype = np.uint16 if len(gaps) == 0 or gaps.max() <= np.iinfo(np.uint16).max else np.uint32
+            arrays["position_offsets"] = position_offsets
+            arrays["positions"] = gaps.astype(dtype)
+            meta["positions"] = True
+        segment = cls(arrays, meta)
+        if compress:
+            segment.compress()
+        return segment
+
+    @classmethod
+    def open(cls, directory: str) -> "IndexSegment":
+        with open(os.path.join(directory, SEGMENT_META), "r") as f:
+            meta = json.load(f)
+        arrays = {}
+        for name in SEGMENT_ARRAYS:
+            path = os.path.join(directory, f"{name}.npy")
+            if name not in LAZY_ARRAYS and os.path.exists(path):
+                arrays[name] = load_array(path)
+        segment = cls(arrays, meta)
+        segment.directory = directory
+        return segment
+
+    def _array(self, name: str) -> np.ndarray:
+        if name not in self.arrays:
+            self.arrays[name] = load_array(os.path.join(self.directory, f"{name}.npy"))
+        return self.arrays[name]
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        if self.directory is not None:
+            for name in LAZY_ARRAYS:
+                if os.path.exists(os.path.join(self.directory, f"{name}.npy")):
+                    self._array(name)
+        for name in SEGMENT_ARRAYS:
+            path = os.path.join(directory, f"{name}.npy")
+            if name in self.arrays:
+                np.save(path, np.ascontiguousarray(self.arrays[name]))
+            elif os.path.exists(path):
+                os.remove(path)
+        #meta goes last so a segment without it is never opened half written
+        with open(os.path.join(directory, SEGMENT_META), "w") as f:
+            json.dump(self.meta, f)
+
+    def compress(self):
+        #delta + bit-packed blocks of POSTINGS_BLOCK_SIZE postings, widths chosen per block
+        if self.compressed:
+            return
+        postings = self.arrays.pop("postings")
+        block_offsets = [0]
+        bases, widths, data_offsets, packed = [], [], [0], []
+        for term_id in range(self.term_count):
+            start, end = self.postings_offsets[term_id], self.postings_offsets[term_id + 1]
+            for block_start in range(start, end, POSTINGS_BLOCK_SIZE):
+                block = postings[block_start:min(block_start + POSTINGS_BLOCK_SIZE, end)]
+                delta_width, tf_width, data = encode_block(block[:, 0], block[:, 1])
+                bases.append(block[0, 0])
+                widths.append((delta_width, tf_width))
+                packed.append(data)
+                data_offsets.append(data_offsets[-1] + len(data))
+            block_offsets.append(len(bases))
+        self.arrays["block_offsets"] = np.array(block_offsets, dtype=np.int64)
+        self.arrays["block_bases"] = np.array(bases, dtype=np.uint32)
+        self.arrays["block_widths"] = np.array(widths, dtype=np.uint8).reshape(-1, 2)
+        self.arrays["block_data_offsets"] = np.array(data_offsets, dtype=np.int64)
+        self.arrays["packed"] = np.frombuffer(b"".join(packed), dtype=np.uint8)
+        self.meta["compressed"] = True
+        self.compressed = True
+
+    def set_impacts(self, impacts: np.ndarray, max_impacts: np.ndarray, impact_scale: float | None):
+        self.impacts = self.arrays["impacts"] = impacts
+        self.max_impacts = self.arrays["max_impacts"] = max_impacts
+        self.meta["impact_scale"] = impact_scale
+
+    def term(self, term_id: int) -> str:
+        return self._term_bytes(term_id).decode()
+
+    def find(self, term: str) -> int | None:
+        return find_string(self.terms, self.term_offsets, term.encode())
+
+    def _term_bytes(self, term_id: int) -> bytes:
+        return string_at(self.terms, self.term_offsets, term_id)
+
+    def build_deletes(self, max_distance: int, prefix_length: int):
+        variants = defaultdict(list) #variant bytes - term ids
+        for term_id in range(self.term_count):
+            for variant in deletion_variants(self.term(term_id), max_distance, prefix_length):
+                variants[variant.encode()].append(term_id)
+        keys = sorted(variants)
+        self.arrays["delete_keys"], self.arrays["delete_key_offsets"] = string_table(keys)
+        self.arrays["delete_offsets"] = np.zeros(len(keys) + 1, dtype=np.int64)
+        self.arrays["delete_offsets"][1:] = np.cumsum([len(variants[key]) for key in keys])
+        term_ids = [term_id for key in keys for term_id in variants[key]]
+        self.arrays["delete_terms"] = np.array(term_ids, dtype=np.int32)
+        self.meta["deletes"] = {"max_distance": max_distance, "prefix_length": prefix_length}
+
+    def delete_candidates(self, word: str) -> set[str]:
+        #terms sharing a deletion variant with word, still to be checked against the real distance
+        if not self.meta.get("deletes"):
+            return set()
+        settings = self.meta["deletes"]
+        keys, key_offsets = self._array("delete_keys"), self._array("delete_key_offsets")
+        delete_offsets, delete_terms = self._array("delete_offsets"), self._array("delete_terms")
+        candidates = set()
+        for variant in deletion_variants(word, settings["max_distance"], settings["prefix_length"]):
+            key = find_string(keys, key_offsets, variant.encode())
+            if key is not None:
+                for term_id in delete_terms[delete_offsets[key]:delete_offsets[key + 1]].tolist():
+                    candidates.add(self.term(term_id))
+        return candidates
+
+    def term_postings(self, term_id: int) -> np.ndarray:
+        start, end = self.postings_offsets[term_id], self.postings_offsets[term_id + 1]
+        if not self.compressed:
+            return self.arrays["postings"][start:end]
+        first_block, last_block = self.arrays["block_offsets"][term_id], self.arrays["block_offsets"][term_id + 1]
+        decoded = [self.decode_block(block_id, min(POSTINGS_BLOCK_SIZE, end - start - i * POSTINGS_BLOCK_SIZE))
+                   for i, block_id in enumerate(range(first_block, last_block))]
+        if not decoded:
+            return np.empty((0, 2), dtype=np.uint32)
+        return np.concatenate(decoded)
+
+    def decode_block(self, block_id: int, count: int) -> np.ndarray:
+        data_offsets = self.arrays["block_data_offsets"]
+        delta_width, tf_width = self.arrays["block_widths"][block_id]
+        data = self.arrays["packed"][data_offsets[block_id]:data_offsets[block_id + 1]]
+        return decode_block(int(self.arrays["block_bases"][block_id]), count, int(delta_width), int(tf_width), data)
+
+    def term_field_tfs(self, term_id: int) -> np.ndarray:
+        #stored unpacked and in posting order, so compressed segments slice it the same way
+        start, end = self.postings_offsets[term_id], self.postings_offsets[term_id + 1]
+        return self.arrays["field_tfs"][start:end]
+
+    def term_positions(self, term_id: int) -> np.ndarray:
+        #absolute positions aligned with term_postings, each posting contributes tf of them
+        position_offsets = self._array("position_offsets")
+        gaps = self._array("positions")[position_offsets[term_id]:position_offsets[term_id + 1]]
+        return gaps_to_positions(gaps, self.term_postings(term_id)[:, 1])
+
+    def term_impacts(self, term_id: int) -> np.ndarray:
+        start, end = self.postings_offsets[term_id], self.postings_offsets[term_id + 1]
+        return self.impacts[start:end]
+
+    def doc_frequency(self, term_id: int) -> int:
+        return int(self.postings_offsets[term_id + 1] - self.postings_offsets[term_id])
+
+    def row_of(self, doc_id: int) -> int | None:
+        row = int(np.searchsorted(self.doc_ids, doc_id))
+        if row < self.doc_count and self.doc_ids[row] == doc_id:
+            return row
+        return None
+
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self.arrays.values())
@@ -1,21 +1,53 @@
 import os
-import string
+import re
+import json
+import shutil
+import secrets
 import pickle
 import math
+import heapq
+import time
+import tempfile
+import tracemalloc
+import resource
+from concurrent.futures import ProcessPoolExecutor
+from bisect import bisect_left, bisect_right
+import numpy as np
 from nltk.stem import PorterStemmer
 
 from collections import defaultdict, Counter
 
+from .index_segment import IndexSegment, SEGMENT_META, take_positions
+from .title_completion import TitleCompleter
+from .document_store import DocumentStore
+from .result_cursor import ResultCursor
 from .search_utils import (
     CACHE_DIR,
     DEFAULT_SEARCH_LIMIT,
     BM25_K1,
     BM25_B,
+    BENCHMARK_LIMITS,
+    DEFAULT_BUILD_WORKERS,
+    MAX_DELTA_SEGMENTS,
+    TYPO_MAX_DISTANCE,
+    TYPO_PREFIX_LENGTH,
+    TYPO_MIN_LENGTH,
+    TYPO_MAX_EXPANSIONS,
+    BATCH_SCORE_CELLS,
+    INDEX_FIELDS,
+    BM25F_BOOSTS,
+    BM25F_B,
+    SCORE_PRECISION,
     load_movies,
+    load_golden_dataset,
     load_stop_words,
+    process_text,
     format_search_result, 
 )
 
+INDEX_MANIFEST = "manifest.json"
+DOCUMENTS_DIR = "documents"
+
 def search_command(query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
     inverted_index = InvertedIndex()
     inverted_index.load()
@@ -27,7 +59,7 @@ def search_command(query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
             if id in seen:
                 continue
             seen.add(id)
-            doc = inverted_index.docmap[id]
+            doc = inverted_index.document(id)
             if not doc:
                 continue
             results.append(doc)
@@ -35,90 +67,491 @@ def search_command(query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
                 return results
     return results
 
-def process_text(text: str) -> list[str]:
-    text = text.lower()
-    text = text.translate(str.maketrans("", "", string.punctuation))
-    return text
+class Analyzer:
+    #stop words are read once and every distinct word is stemmed once per process
+    def __init__(self, stop_words: list[str] | None = None):
+        if stop_words is None:
+            stop_words = load_stop_words()
+        self.stop_words = frozenset(stop_words)
+        self.stemmer = PorterStemmer()
+        self.stem_cache: dict[str, str] = {}
+
+    def stem(self, word: str) -> str:
+        stem = self.stem_cache.get(word)
+        if stem is None:
+            stem = self.stem_cache[word] = self.stemmer.stem(word)
+        return stem
+
+    def tokenize(self, text: str) -> list[str]:
+        stemmed_words = []
+        for word in process_text(text).split():
+            if word not in self.stop_words:
+                stemmed_words.append(self.stem(word))
+        return stemmed_words
+
+    def tokenize_positions(self, text: str) -> list[tuple[str, int]]:
+        #positions count stop words too, so "lord of the rings" keeps its gaps
+        stemmed_words = []
+        for position, word in enumerate(process_text(text).split()):
+            if word not in self.stop_words:
+                stemmed_words.append((self.stem(word), position))
+        return stemmed_words
+
+_analyzer: Analyzer | None = None
+
+def get_analyzer() -> Analyzer:
+    global _analyzer
+    if _analyzer is None:
+        _analyzer = Analyzer()
+    return _analyzer
+
+def tokenize_text(text: str) -> list[str]:
+    return get_analyzer().tokenize(text)
+
+PHRASE_PATTERN = re.compile(r'"([^"]+)"(?:~(\d+))?')
+
+def parse_query(query: str) -> tuple[list[str], list[tuple[list[tuple[str, int]], int | None]]]:
+    #"quoted words" must appear as a phrase, "quoted words"~n within n extra positions in any order
+    #every quoted token is still scored as a bag of words
+    analyzer = get_analyzer()
+    constraints = []
+    for match in PHRASE_PATTERN.finditer(query):
+        terms = analyzer.tokenize_positions(match.group(1))
+        if len(terms) > 1:
+            slop = int(match.group(2)) if match.group(2) is not None else None
+            constraints.append((terms, slop))
+    tokens = analyzer.tokenize(PHRASE_PATTERN.sub(lambda match: f" {match.group(1)} ", query))
+    return tokens, constraints
+
+def gallop(values: list[int], target: int, low: int) -> int:
+    #first index from low on whose value is >= target, probing 1, 2, 4... ahead before bisecting
+    if low >= len(values) or values[low] >= target:
+        return low
+    step = 1
+    while True:
+        probe = low + step
+        if probe >= len(values) or values[probe] >= target:
+            return bisect_left(values, target, low + 1, min(probe, len(values)))
+        low = probe
+        step *= 2
+
+def intersect_sorted(lists: list[list[int]]) -> list[int]:
+    #drive from the shortest list, gallop through the longer ones
+    lists = sorted(lists, key=len)
+    cursors = [0] * len(lists)
+    result = []
+    for value in lists[0]:
+        for i in range(1, len(lists)):
+            cursors[i] = gallop(lists[i], value, cursors[i])
+            if cursors[i] == len(lists[i]):
+                return result
+            if lists[i][cursors[i]] != value:
+                break
+        else:
+            result.append(value)
+    return result
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    #optimal string alignment distance, anything past max_distance comes back as max_distance + 1
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    before_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before_previous[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        before_previous, previous = previous, current
+    return min(previous[-1], max_distance + 1)
+
+def closest_terms(token: str, candidates: set[str], doc_frequency, max_distance: int | None = None, limit: int = TYPO_MAX_EXPANSIONS) -> list[tuple[str, int]]:
+    #closest in-vocabulary terms by edit distance, most frequent first among equals
+    if max_distance is None:
+        max_distance = 1 if len(token) <= 4 else TYPO_MAX_DISTANCE
+    scored = []
+    for term in candidates:
+        distance = edit_distance(token, term, max_distance)
+        if distance <= max_distance:
+            term_doc_frequency = doc_frequency(term)
+            if term_doc_frequency:
+                scored.append((distance, -term_doc_frequency, term))
+    scored.sort()
+    closest = [entry for entry in scored if entry[0] == scored[0][0]] if scored else []
+    return [(term, distance) for distance, _, term in closest[:limit]]
 
-def has_matching_token(query_tokens: list[str], title_tokens: list[str]) -> bool:
-    for query_token in query_tokens:
-        for title_token in title_tokens:
-            if query_token in title_token:
+def weigh_query(tokens: list[str], doc_frequency, expand=None) -> dict[str, float]:
+    #query tf per token, with expand set unknown tokens are replaced by its (term, distance)
+    #expansions at 1 / (1 + distance)
+    weights = defaultdict(float)
+    for token, count in Counter(tokens).items():
+        if expand is not None and len(token) >= TYPO_MIN_LENGTH and doc_frequency(token) == 0:
+            for term, distance in expand(token):
+                weights[term] += count / (1 + distance)
+        else:
+            weights[token] += count
+    return weights
+
+def matches_phrase(positions: dict[str, set[int]], terms: list[tuple[str, int]]) -> bool:
+    first_token, first_position = terms[0]
+    for start in positions[first_token]:
+        if all(start + position - first_position in positions[token] for token, position in terms[1:]):
+            return True
+    return False
+
+def within_window(positions: dict[str, list[int]], window: int) -> bool:
+    #sliding window over every occurrence, true once a span <= window holds each token
+    events = sorted((position, token) for token, token_positions in positions.items() for position in token_positions)
+    counts = Counter()
+    covered = 0
+    left = 0
+    for position, token in events:
+        counts[token] += 1
+        if counts[token] == 1:
+            covered += 1
+        while covered == len(positions):
+            if position - events[left][0] <= window:
                 return True
+            left_token = events[left][1]
+            counts[left_token] -= 1
+            if counts[left_token] == 0:
+                covered -= 1
+            left += 1
     return False
 
-def tokenize_text(text: str) -> list[str]:
-    text = process_text(text)
-    tokens = text.split()
-    valid_tokens = []
-    for token in tokens:
-        if token:
-            valid_tokens.append(token)
-    stop_words = load_stop_words()
-    filtered_words = []
-    for word in valid_tokens:
-        if word not in stop_words:
-            filtered_words.append(word)
-    stemmer = PorterStemmer()
-    stemmed_words = []
-    for word in filtered_words:
-        stemmed_words.append(stemmer.stem(word))
-    return stemmed_words
+def collect_postings(movies: list[dict], with_positions: bool = False, with_fields: bool = False):
+    #returns (token - {doc id: tf}, doc id - length, token - {doc id: positions} or None,
+    #(INDEX_FIELDS, token - {doc id: tf per field}, doc id - length per field) or None)
+    analyzer = get_analyzer()
+    postings = defaultdict(dict)
+    positions = defaultdict(lambda: defaultdict(list)) if with_positions else None
+    field_tfs = defaultdict(dict) if with_fields else None
+    field_lengths = {} if with_fields else None
+    doc_lengths = {}
+    for movie in movies:
+        doc_id = movie["id"]
+        doc_description = " ".join(movie[field] for field in INDEX_FIELDS)
+        tokens = analyzer.tokenize_positions(doc_description)
+        doc_lengths[doc_id] = len(tokens)
+        for token, tf in Counter(token for token, _ in tokens).items():
+            postings[token][doc_id] = tf
+        if with_positions:
+            for token, position in tokens:
+                positions[token][doc_id].append(position)
+        if with_fields:
+            #positions count words, so the word count of each field marks where the next one starts
+            field_ends = np.cumsum([len(process_text(movie[field]).split()) for field in INDEX_FIELDS]).tolist()
+            counts = defaultdict(lambda: [0] * len(INDEX_FIELDS))
+            for token, position in tokens:
+                counts[token][bisect_right(field_ends, position)] += 1
+            for token, token_counts in counts.items():
+                field_tfs[token][doc_id] = token_counts
+            field_lengths[doc_id] = [sum(token_counts[i] for token_counts in counts.values()) for i in range(len(INDEX_FIELDS))]
+    fields = (INDEX_FIELDS, field_tfs, field_lengths) if with_fields else None
+    return postings, doc_lengths, positions, fields
+
+def _build_partial_segment(movies: list[dict], directory: str, with_positions: bool = False, with_fields: bool = False) -> str:
+    #runs in a pool worker, the analyzer and its stem cache live as long as the worker
+    postings, doc_lengths, positions, fields = collect_postings(movies, with_positions, with_fields)
+    IndexSegment.from_postings(postings, doc_lengths, positions=positions, fields=fields).save(directory)
+    return directory
+
+def build_segment(movies: list[dict], workers: int = 1, compress: bool = False, with_positions: bool = False, with_fields: bool = False) -> IndexSegment:
+    if workers <= 1 or len(movies) < workers:
+        postings, doc_lengths, positions, fields = collect_postings(movies, with_positions, with_fields)
+        return IndexSegment.from_postings(postings, doc_lengths, compress, positions, fields)
+    shard_size = math.ceil(len(movies) / workers)
+    shards = [movies[i:i + shard_size] for i in range(0, len(movies), shard_size)]
+    with tempfile.TemporaryDirectory() as build_dir:
+        directories = [os.path.join(build_dir, f"part_{i}") for i in range(len(shards))]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_build_partial_segment, shards, directories, [with_positions] * len(shards), [with_fields] * len(shards)))
+        partials = [IndexSegment.open(directory) for directory in directories]
+        return IndexSegment.merge(partials, compress=compress)
+
+class BM25Matrix:
+    #term-major (CSC) bm25 weights of every live document, rows follow ascending doc id
+    def __init__(self, doc_ids: np.ndarray, columns: dict[str, int], indptr: np.ndarray, rows: np.ndarray, weights: np.ndarray):
+        self.doc_ids = doc_ids
+        self.columns = columns
+        self.indptr = indptr
+        self.rows = rows
+        self.weights = weights
+
+    def doc_frequency(self, token: str) -> int:
+        column = self.columns.get(token)
+        return 0 if column is None else int(self.indptr[column + 1] - self.indptr[column])
+
+    def score_batch(self, query_weights: list[dict[str, float]]) -> np.ndarray:
+        #one bincount over query * N + row fills a dense (queries, N) score block, terms are
+        #added in query order so every score matches the one-query-at-a-time path bit for bit
+        doc_count = len(self.doc_ids)
+        keys, values = [], []
+        for i, weights in enumerate(query_weights):
+            for token, query_tf in weights.items():
+                column = self.columns.get(token)
+                if column is None:
+                    continue
+                start, end = self.indptr[column], self.indptr[column + 1]
+                keys.append(self.rows[start:end] + i * doc_count)
+                values.append(self.weights[start:end] * query_tf)
+        if not keys:
+            return np.zeros((len(query_weights), doc_count))
+        scores = np.bincount(np.concatenate(keys), weights=np.concatenate(values), minlength=len(query_weights) * doc_count)
+        return scores.reshape(len(query_weights), doc_count)
 
 class InvertedIndex:
-    def __init__(self):
-        self.index = defaultdict(set) #token (strings) -set of doc ids
-        self.docmap: dict[int, dict] = {} #doc ID (int) - full document object
-        self.term_frequencies = defaultdict(Counter) #doc id (int) - counter object (term: frequency)
-        self.doc_lengths = defaultdict(int)
-        self.index_path = os.path.join(CACHE_DIR, "index.pkl")
-        self.docmap_path = os.path.join(CACHE_DIR, "docmap.pkl")
-        self.doc_lengths_path = os.path.join(CACHE_DIR, "doc_lengths.pkl")
-        self.term_frequencies_path = os.path.join(CACHE_DIR, "term_frequencies.pkl")
-
-    def __add_document(self, doc_id: int, text: str):
-        tokens = tokenize_text(text)
-        self.doc_lengths[doc_id] = len(tokens)
-        for token in set(tokens):
-            self.index[token].add(doc_id)
-        self.term_frequencies[doc_id].update(tokens)
-    
+    def __init__(self, index_dir: str | None = None):
+        self.segments: list[IndexSegment] = [] #base segment first, then delta segments by generation
+        self.live_rows: list[np.ndarray | None] = [] #per segment mask of rows not shadowed or deleted
+        self.tombstones: dict[int, int] = {} #doc id - generation, versions in older segments are dead
+        self.next_generation = 0
+        self._documents: dict[str, DocumentStore] = {} #segment name - its documents in row order
+        self._matrix: BM25Matrix | None = None
+        self.fields: list[str] | None = None #set when every segment stores per field tfs
+        self.field_totals = None #live token count per field
+        self.field_boosts = dict(BM25F_BOOSTS)
+        self.field_b = dict(BM25F_B)
+        self._field_weights: list[np.ndarray] | None = None
+        self.doc_count = 0
+        self.total_length = 0
+        self.avg_doc_length = None
+        self.global_doc_frequencies: dict[str, int] | None = None #set on shards scoring with collection wide stats
+        self.index_dir = index_dir or os.path.join(CACHE_DIR, "index")
+        self.index_path = os.path.join(self.index_dir, INDEX_MANIFEST)
+
+    def segment_documents(self, segment: IndexSegment) -> DocumentStore:
+        #mapped on first use, only the rows of returned results are ever decoded
+        name = segment.meta["name"]
+        if name not in self._documents:
+            self._documents[name] = DocumentStore.open(os.path.join(self.index_dir, name, DOCUMENTS_DIR))
+        return self._documents[name]
+
+    def document(self, doc_id: int) -> dict | None:
+        located = self._locate(doc_id)
+        if located is None:
+            return None
+        segment, row = located
+        return self.segment_documents(segment)[row]
+
     def __get_avg_doc_length(self) -> float:
-        total_length = 0
-        for doc_length in self.doc_lengths.values():
-            total_length += doc_length
-        if total_length == 0:
+        #cached per index, reset whenever the segments change
+        if self.avg_doc_length is not None:
+            return self.avg_doc_length
+        self.avg_doc_length = self.__compute_avg_doc_length()
+        return self.avg_doc_length
+
+    def __compute_avg_doc_length(self) -> float:
+        if self.total_length == 0:
             return 0.0
-        return total_length / len(self.doc_lengths)
+        return self.total_length / self.doc_count
+
+    def _set_segments(self, segments: list[IndexSegment]):
+        #N and total length only count live rows so bm25 stays exact across deltas
+        self.segments = segments
+        self.live_rows = []
+        self.doc_count = 0
+        self.total_length = 0
+        for segment in segments:
+            generation = segment.meta.get("generation", 0)
+            live = None
+            if self.tombstones:
+                dead = [self.tombstones.get(doc_id, -1) > generation for doc_id in segment.doc_ids.tolist()]
+                if any(dead):
+                    live = ~np.array(dead, dtype=bool)
+            self.live_rows.append(live)
+            lengths = segment.doc_lengths if live is None else segment.doc_lengths[live]
+            self.doc_count += len(lengths)
+            self.total_length += int(lengths.sum())
+        self.avg_doc_length = None
+        self._matrix = None
+        self.fields = None
+        self._field_weights = None
+        if segments and all(segment.fields is not None and segment.fields == segments[0].fields for segment in segments):
+            self.fields = segments[0].fields
+            self.field_totals = np.zeros(len(self.fields))
+            for segment, live in zip(segments, self.live_rows):
+                field_lengths = segment.field_lengths if live is None else segment.field_lengths[live]
+                self.field_totals += field_lengths.sum(axis=0)
+
+    def _single_token(self, term: str) -> str:
+        tokens = tokenize_text(term)
+        if len(tokens) != 1:
+            raise ValueError("term must be a single token")
+        return tokens[0]
+
+    def _term_postings(self, token: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        #live (doc id, tf, doc length) for a token across every segment, doc ids ascending
+        parts = []
+        for segment, live in zip(self.segments, self.live_rows):
+            term_id = segment.find(token)
+            if term_id is None:
+                continue
+            postings = segment.term_postings(term_id)
+            if live is not None:
+                postings = postings[live[postings[:, 0]]]
+            rows = postings[:, 0]
+            parts.append((segment.doc_ids[rows], postings[:, 1], segment.doc_lengths[rows]))
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint32)
+        if len(parts) == 1:
+            return parts[0]
+        doc_ids, tfs, lengths = (np.concatenate(column) for column in zip(*parts))
+        order = np.argsort(doc_ids, kind="stable")
+        return doc_ids[order], tfs[order], lengths[order]
+
+    def set_field_weights(self, boosts: dict[str, float] | None = None, field_b: dict[str, float] | None = None):
+        if boosts is not None:
+            self.field_boosts.update(boosts)
+        if field_b is not None:
+            self.field_b.update(field_b)
+        self._field_weights = None
+
+    def field_weights(self) -> list[np.ndarray]:
+        #per segment row: boost / length normalization of every field, computed once per set of segments
+        #so a BM25F query only takes a weighted sum over each posting's field tfs
+        if self.fields is None:
+            raise ValueError("Index has no field statistics, rebuild it with --fields.")
+        if self._field_weights is not None:
+            return self._field_weights
+        boost = np.array([self.field_boosts[field] for field in self.fields])
+        b = np.array([self.field_b[field] for field in self.fields])
+        avg_field_lengths = self.field_totals / max(self.doc_count, 1)
+        avg_field_lengths[avg_field_lengths == 0] = 1.0
+        self._field_weights = [boost / (1 - b + b * (segment.field_lengths / avg_field_lengths)) for segment in self.segments]
+        return self._field_weights
+
+    def _term_pseudo_tfs(self, token: str) -> tuple[np.ndarray, np.ndarray]:
+        #live (doc id, BM25F pseudo tf) for a token across every segment, doc ids ascending
+        parts = []
+        for segment, live, weights in zip(self.segments, self.live_rows, self.field_weights()):
+            term_id = segment.find(token)
+            if term_id is None:
+                continue
+            rows = segment.term_postings(term_id)[:, 0]
+            field_tfs = segment.term_field_tfs(term_id)
+            if live is not None:
+                keep = live[rows]
+                rows, field_tfs = rows[keep], field_tfs[keep]
+            parts.append((segment.doc_ids[rows], (field_tfs * weights[rows]).sum(axis=1)))
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        if len(parts) == 1:
+            return parts[0]
+        doc_ids, pseudo_tfs = (np.concatenate(column) for column in zip(*parts))
+        order = np.argsort(doc_ids, kind="stable")
+        return doc_ids[order], pseudo_tfs[order]
+
+    def _term_positions(self, token: str) -> tuple[np.ndarray, np.ndarray, np.ndarray] | None:
+        #live (doc ids, position offsets, positions) across segments, None without positional postings
+        parts = []
+        for segment, live in zip(self.segments, self.live_rows):
+            if not segment.has_positions:
+                return None
+            term_id = segment.find(token)
+            if term_id is None:
+                continue
+            postings = segment.term_postings(term_id)
+            positions = segment.term_positions(term_id)
+            keep = np.arange(len(postings)) if live is None else np.flatnonzero(live[postings[:, 0]])
+            parts.append((segment.doc_ids[postings[keep, 0]], postings[keep, 1], take_positions(positions, postings[:, 1], keep)))
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int64)
+        doc_ids, tfs, positions = (np.concatenate(column) for column in zip(*parts))
+        if len(parts) > 1:
+            order = np.argsort(doc_ids, kind="stable")
+            positions = take_positions(positions, tfs, order)
+            doc_ids, tfs = doc_ids[order], tfs[order]
+        offsets = np.concatenate(([0], np.cumsum(tfs, dtype=np.int64)))
+        return doc_ids, offsets, positions
+
+    def _match_constraints(self, constraints: list[tuple[list[tuple[str, int]], int | None]]) -> list[int] | None:
+        #doc ids meeting every phrase / proximity constraint, None if positions weren't indexed
+        allowed = None
+        for terms, slop in constraints:
+            tokens = list(dict.fromkeys(token for token, _ in terms))
+            postings = {}
+            for token in tokens:
+                term_positions = self._term_positions(token)
+                if term_positions is None:
+                    return None
+                doc_ids, offsets, positions = term_positions
+                postings[token] = (doc_ids.tolist(), offsets, positions)
+            candidates = [postings[token][0] for token in tokens]
+            if allowed is not None:
+                candidates.append(allowed)
+            matched = []
+            for doc_id in intersect_sorted(candidates):
+                doc_positions = {}
+                for token in tokens:
+                    doc_ids, offsets, positions = postings[token]
+                    i = bisect_left(doc_ids, doc_id)
+                    doc_positions[token] = positions[offsets[i]:offsets[i + 1]].tolist()
+                if slop is None:
+                    found = matches_phrase({token: set(p) for token, p in doc_positions.items()}, terms)
+                else:
+                    found = within_window(doc_positions, terms[-1][1] - terms[0][1] + slop)
+                if found:
+                    matched.append(doc_id)
+            allowed = matched
+        return allowed
+
+    def _doc_frequency(self, token: str) -> int:
+        return len(self._term_postings(token)[0])
+
+    def typo_candidates(self, token: str) -> set[str]:
+        candidates = set()
+        for segment in self.segments:
+            candidates |= segment.delete_candidates(token)
+        return candidates
+
+    def expand_term(self, token: str, max_distance: int | None = None, limit: int = TYPO_MAX_EXPANSIONS, doc_frequency=None) -> list[tuple[str, int]]:
+        doc_frequency = doc_frequency or self._doc_frequency
+        return closest_terms(token, self.typo_candidates(token), doc_frequency, max_distance, limit)
+
+    def _query_weights(self, tokens: list[str], typo_tolerance: bool = True, doc_frequency=None) -> dict[str, float]:
+        doc_frequency = doc_frequency or self._doc_frequency
+        expand = lambda token: self.expand_term(token, doc_frequency=doc_frequency)
+        return weigh_query(tokens, doc_frequency, expand if typo_tolerance else None)
+
+    def _locate(self, doc_id: int) -> tuple[IndexSegment, int] | None:
+        for segment, live in zip(reversed(self.segments), reversed(self.live_rows)):
+            row = segment.row_of(doc_id)
+            if row is not None and (live is None or live[row]):
+                return segment, row
+        return None
 
     def get_documents(self, term: str):
         term = term.lower()
-        doc_ids = self.index.get(term, set())
-        return sorted(list(doc_ids))
+        return self._term_postings(term)[0].tolist()
 
     def get_tf(self, doc_id: int, term: str) -> int:
         tokenized_text = tokenize_text(term)
         if len(tokenized_text) != 1:
             raise ValueError("More than one token")
-        return self.term_frequencies[doc_id][tokenized_text[0]]
+        doc_ids, tfs, _ = self._term_postings(tokenized_text[0])
+        i = int(np.searchsorted(doc_ids, doc_id))
+        if i < len(doc_ids) and doc_ids[i] == doc_id:
+            return int(tfs[i])
+        return 0
     
     def get_idf(self, term: str) -> float:
-        tokens = tokenize_text(term)
-        if len(tokens) != 1:
-            raise ValueError("term must be a single token")
-        token = tokens[0]
-        doc_count = len(self.docmap)
-        term_doc_count = len(self.index[token])
+        token = self._single_token(term)
+        doc_count = self.doc_count
+        term_doc_count = self._doc_frequency(token)
         return math.log((doc_count + 1) / (term_doc_count + 1))
 
     def get_bm25_idf(self, term: str) -> float:
         #OkapiBM25
-        tokens = tokenize_text(term)
-        if len(tokens) != 1:
-            raise ValueError("term must be a single token")
-        token = tokens[0]
-        doc_count = len(self.docmap) #N
-        term_doc_count = len(self.index[token]) #DF
+        token = self._single_token(term)
+        return self._bm25_idf(self._doc_frequency(token))
+
+    def _bm25_idf(self, term_doc_count: int) -> float:
+        doc_count = self.doc_count #N
         #log((N - df + 0.5) / (df + 0.5) + 1)
         return math.log((doc_count - term_doc_count + 0.5) / (term_doc_count + 0.5) + 1)
     
@@ -127,7 +560,11 @@ class InvertedIndex:
         raw_tf = self.get_tf(doc_id, term)
         #Length normalization factor
         avg_doc_length = self.__get_avg_doc_length()
-        length_norm = 1 - b + b * (self.doc_lengths[doc_id] / avg_doc_length)
+        located = self._locate(doc_id)
+        if located is None:
+            raise ValueError(f"Document {doc_id} is not in the index")
+        segment, row = located
+        length_norm = 1 - b + b * (int(segment.doc_lengths[row]) / avg_doc_length)
         tf_component = (raw_tf * (k1 + 1)) / (raw_tf + k1 * length_norm)
         return tf_component
 
@@ -135,20 +572,154 @@ class InvertedIndex:
         bm25_idf = self.get_bm25_idf(term)
         bm25_tf = self.get_bm25_tf(doc_id, term)
         return bm25_tf * bm25_idf
-    
-    def bm25_search(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
-        tokens = tokenize_text(query)
-        scores = defaultdict(float)
-        for doc_id in self.docmap:
-            score = 0.0
-            for token in tokens:
-                score += self.bm25(doc_id, token)
-            scores[doc_id] = score
-        sorted_scores = sorted(scores.items(), key=lambda x: x[1], reverse=True)
 
+    def _term_scores(self, token: str, k1: float = BM25_K1, b: float = BM25_B, fields: bool = False) -> tuple[np.ndarray, np.ndarray]:
+        #bm25 of one term for every live document on its posting lists
+        if fields:
+            #BM25F: length normalization happens per field before the shared saturation
+            doc_ids, pseudo_tfs = self._term_pseudo_tfs(token)
+            idf = self._bm25_idf(self._term_doc_frequency(token, doc_ids))
+            return doc_ids, idf * (pseudo_tfs * (k1 + 1)) / (pseudo_tfs + k1)
+        doc_ids, tfs, lengths = self._term_postings(token)
+        tfs = tfs.astype(np.float64)
+        idf = self._bm25_idf(self._term_doc_frequency(token, doc_ids))
+        length_norm = 1 - b + b * (lengths / self.__get_avg_doc_length())
+        return doc_ids, idf * (tfs * (k1 + 1)) / (tfs + k1 * length_norm)
+
+    def _term_doc_frequency(self, token: str, doc_ids: np.ndarray) -> int:
+        if self.global_doc_frequencies is not None:
+            return self.global_doc_frequencies.get(token, len(doc_ids))
+        return len(doc_ids)
+
+    def _score_terms(self, weights: dict[str, float], k1: float = BM25_K1, b: float = BM25_B, fields: bool = False) -> tuple[np.ndarray, np.ndarray]:
+        #term-at-a-time: only documents on a query term's posting list get an accumulator
+        all_doc_ids, all_scores = [], []
+        for token, query_tf in weights.items():
+            doc_ids, scores = self._term_scores(token, k1, b, fields)
+            all_doc_ids.append(doc_ids)
+            all_scores.append(scores * query_tf)
+        if not all_doc_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        doc_ids, inverse = np.unique(np.concatenate(all_doc_ids), return_inverse=True)
+        return doc_ids, np.bincount(inverse, weights=np.concatenate(all_scores), minlength=len(doc_ids))
+
+    def _top_k(self, doc_ids: np.ndarray, scores: np.ndarray, limit: int) -> list[tuple[int, float]]:
+        if len(scores) > limit:
+            #everything tied with the k-th score survives so the cut below is deterministic
+            kth = -np.partition(-scores, limit - 1)[limit - 1]
+            keep = scores >= kth
+            doc_ids, scores = doc_ids[keep], scores[keep]
+        #highest score first, lower doc id first on ties
+        order = np.lexsort((doc_ids, -scores))[:limit]
+        return list(zip(doc_ids[order].tolist(), scores[order].tolist()))
+
+    def _impact_segment(self) -> IndexSegment | None:
+        #stored impacts were computed from the stats of a lone segment, deltas make them stale
+        if len(self.segments) == 1 and self.live_rows[0] is None and self.segments[0].impacts is not None:
+            return self.segments[0]
+        return None
+
+    def build_impacts(self, quantize_bits: int = 0, k1: float = BM25_K1, b: float = BM25_B):
+        #one precomputed bm25 score per posting so pruned search never touches tf or doc lengths
+        if len(self.segments) != 1 or self.live_rows[0] is not None:
+            raise ValueError("Impacts need a single segment, merge the index first.")
+        segment = self.segments[0]
+        impacts = np.zeros(int(segment.postings_offsets[-1]), dtype=np.float32)
+        for term_id in range(segment.term_count):
+            start, end = segment.postings_offsets[term_id], segment.postings_offsets[term_id + 1]
+            impacts[start:end] = self._term_scores(segment.term(term_id), k1, b)[1]
+        impact_scale = None
+        if quantize_bits:
+            levels = (1 << quantize_bits) - 1
+            highest = float(impacts.max()) if len(impacts) else 0.0
+            impact_scale = highest / levels if highest else 1.0
+            dtype = np.uint8 if quantize_bits <= 8 else np.uint16 if quantize_bits <= 16 else np.uint32
+            impacts = np.maximum(1, np.rint(impacts / impact_scale)).astype(dtype)
+        max_impacts = np.zeros(segment.term_count, dtype=impacts.dtype)
+        if len(impacts):
+            max_impacts = np.maximum.reduceat(impacts, segment.postings_offsets[:-1])
+        segment.set_impacts(impacts, max_impacts, impact_scale)
+
+    def bm25_search_pruned(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT, typo_tolerance: bool = True) -> list[dict]:
+        #MaxScore: terms whose summed max impacts can't beat the current k-th score are only
+        #probed for documents that surface on the remaining (essential) posting lists
+        segment = self._impact_segment()
+        tokens, constraints = parse_query(query)
+        allowed = self._match_constraints(constraints) if constraints else None
+        if allowed is not None:
+            allowed = set(allowed)
+        terms = []
+        for token, query_tf in self._query_weights(tokens, typo_tolerance).items():
+            if segment is not None:
+                term_id = segment.find(token)
+                if term_id is None:
+                    continue
+                doc_ids = segment.doc_ids[segment.term_postings(term_id)[:, 0]].tolist()
+                impacts = segment.term_impacts(term_id).tolist()
+                max_impact = segment.max_impacts[term_id].item()
+            else:
+                #no fresh impacts, score the postings now and prune the traversal only
+                doc_ids, scores = self._term_scores(token)
+                if len(doc_ids) == 0:
+                    continue
+                doc_ids, impacts, max_impact = doc_ids.tolist(), scores.tolist(), float(scores.max())
+            terms.append((max_impact * query_tf, query_tf, doc_ids, impacts))
+        terms.sort(key=lambda x: x[0])
+        upper_bounds = []
+        total = 0
+        for max_impact, _, _, _ in terms:
+            total += max_impact
+            upper_bounds.append(total)
+
+        heap = []
+        threshold = 0
+        first_essential = 0
+        cursors = [0] * len(terms)
+        while first_essential < len(terms):
+            doc_id = None
+            for i in range(first_essential, len(terms)):
+                doc_ids = terms[i][2]
+                if cursors[i] < len(doc_ids) and (doc_id is None or doc_ids[cursors[i]] < doc_id):
+                    doc_id = doc_ids[cursors[i]]
+            if doc_id is None:
+                break
+            score = 0
+            for i in range(first_essential, len(terms)):
+                _, query_tf, doc_ids, impacts = terms[i]
+                if cursors[i] < len(doc_ids) and doc_ids[cursors[i]] == doc_id:
+                    score += impacts[cursors[i]] * query_tf
+                    cursors[i] += 1
+            if allowed is not None and doc_id not in allowed:
+                continue
+            for i in range(first_essential - 1, -1, -1):
+                if score + upper_bounds[i] <= threshold:
+                    break
+                _, query_tf, doc_ids, impacts = terms[i]
+                #non-essential cursors only ever move forward, doc ids arrive ascending
+                cursors[i] = bisect_left(doc_ids, doc_id, cursors[i])
+                if cursors[i] < len(doc_ids) and doc_ids[cursors[i]] == doc_id:
+                    score += impacts[cursors[i]] * query_tf
+            if len(heap) < limit:
+                heapq.heappush(heap, (score, -doc_id))
+            elif score > threshold:
+                heapq.heapreplace(heap, (score, -doc_id))
+            else:
+                continue
+            if len(heap) == limit:
+                threshold = heap[0][0]
+                while first_essential < len(terms) and upper_bounds[first_essential] <= threshold:
+                    first_essential += 1
+
+        scale = 1.0
+        if segment is not None:
+            scale = segment.meta.get("impact_scale") or 1.0
+        top_scores = [(-neg_id, score * scale) for score, neg_id in sorted(heap, reverse=True)]
+        return self._format_results(top_scores)
+
+    def _format_results(self, scored: list[tuple[int, float]]) -> list[dict]:
         results = []
-        for doc_id, score in sorted_scores[:limit]:
-            doc = self.docmap[doc_id]
+        for doc_id, score in scored:
+            doc = self.document(doc_id)
             formatted_result = format_search_result(
                 doc_id=doc["id"],
                 title=doc["title"],
@@ -158,44 +729,215 @@ class InvertedIndex:
             results.append(formatted_result)
         return results
 
+    def bm25_search(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT, typo_tolerance: bool = True, fields: bool = False) -> list[dict]:
+        #fields scores with BM25F over the per field statistics instead of one concatenated text
+        tokens, constraints = parse_query(query)
+        doc_ids, scores = self._score_terms(self._query_weights(tokens, typo_tolerance), fields=fields)
+        if constraints:
+            allowed = self._match_constraints(constraints)
+            if allowed is not None:
+                keep = np.isin(doc_ids, allowed)
+                doc_ids, scores = doc_ids[keep], scores[keep]
+        return self._format_results(self._top_k(doc_ids, scores, limit))
+
+    def bm25_cursor(self, query: str, depth: int = DEFAULT_SEARCH_LIMIT, typo_tolerance: bool = True, fields: bool = False) -> ResultCursor:
+        #bm25_search(query, depth) read a rank at a time, doc ids ascend so ties break the same way
+        tokens, constraints = parse_query(query)
+        doc_ids, scores = self._score_terms(self._query_weights(tokens, typo_tolerance), fields=fields)
+        if constraints:
+            allowed = self._match_constraints(constraints)
+            if allowed is not None:
+                keep = np.isin(doc_ids, allowed)
+                doc_ids, scores = doc_ids[keep], scores[keep]
+        format_rows = lambda rows: self._format_results(list(zip(doc_ids[rows].tolist(), scores[rows].tolist())))
+        return ResultCursor(scores, doc_ids, depth, format_rows, lambda score: round(score, SCORE_PRECISION))
+
+    def bm25_matrix(self, k1: float = BM25_K1, b: float = BM25_B) -> BM25Matrix:
+        #built once per set of segments with the length normalization of every document precomputed
+        if self._matrix is not None:
+            return self._matrix
+        columns = {}
+        for segment in self.segments:
+            for term_id in range(segment.term_count):
+                columns.setdefault(segment.term(term_id), len(columns))
+        live_ids, live_lengths = [], []
+        for segment, live in zip(self.segments, self.live_rows):
+            live_ids.append(segment.doc_ids if live is None else segment.doc_ids[live])
+            live_lengths.append(segment.doc_lengths if live is None else segment.doc_lengths[live])
+        doc_ids = np.concatenate(live_ids) if live_ids else np.empty(0, dtype=np.int64)
+        order = np.argsort(doc_ids, kind="stable")
+        doc_ids = doc_ids[order]
+        lengths = np.concatenate(live_lengths)[order] if live_lengths else np.empty(0, dtype=np.uint32)
+        length_norm = 1 - b + b * (lengths / self.__get_avg_doc_length()) if len(lengths) else lengths
+        indptr = np.zeros(len(columns) + 1, dtype=np.int64)
+        row_parts, tf_parts, idf = [], [], np.zeros(len(columns))
+        for token, column in columns.items():
+            term_doc_ids, tfs, _ = self._term_postings(token)
+            row_parts.append(np.searchsorted(doc_ids, term_doc_ids))
+            tf_parts.append(tfs)
+            indptr[column + 1] = len(term_doc_ids)
+            idf[column] = self._bm25_idf(len(term_doc_ids))
+        indptr = np.cumsum(indptr)
+        rows = np.concatenate(row_parts).astype(np.int64) if row_parts else np.empty(0, dtype=np.int64)
+        tfs = np.concatenate(tf_parts).astype(np.float64) if tf_parts else np.empty(0)
+        posting_idf = np.repeat(idf, np.diff(indptr))
+        weights = posting_idf * (tfs * (k1 + 1)) / (tfs + k1 * length_norm[rows])
+        self._matrix = BM25Matrix(doc_ids, columns, indptr, rows, weights)
+        return self._matrix
+
+    def bm25_search_batch(self, queries: list[str], limit: int = DEFAULT_SEARCH_LIMIT, typo_tolerance: bool = True) -> list[list[dict]]:
+        #same results as bm25_search per query, scored BATCH_SCORE_CELLS dense accumulators at a time
+        matrix = self.bm25_matrix()
+        parsed = [parse_query(query) for query in queries]
+        query_weights = [self._query_weights(tokens, typo_tolerance, matrix.doc_frequency) for tokens, _ in parsed]
+        chunk = max(1, BATCH_SCORE_CELLS // max(len(matrix.doc_ids), 1))
+        results = []
+        for start in range(0, len(queries), chunk):
+            scores = matrix.score_batch(query_weights[start:start + chunk])
+            for (_, constraints), row in zip(parsed[start:start + chunk], scores):
+                hits = np.flatnonzero(row)
+                if constraints:
+                    allowed = self._match_constraints(constraints)
+                    if allowed is not None:
+                        hits = hits[np.isin(matrix.doc_ids[hits], allowed)]
+                results.append(self._format_results(self._top_k(matrix.doc_ids[hits], row[hits], limit)))
+        return results
+
     def get_tf_idf(self, doc_id: int, term: str) -> float:
         tf = self.get_tf(doc_id, term)
         idf = self.get_idf(term)
         return tf * idf
     
-    def build(self):
-        movies = load_movies()
-        for movie in movies:
-            doc_id = movie["id"]
-            doc_description = f"{movie['title']} {movie['description']}"
-            self.docmap[movie["id"]] = movie
-            self.__add_document(doc_id, doc_description)
+    def build(self, impacts: bool = False, quantize_bits: int = 0, compress: bool = False, workers: int = 1, positions: bool = False, fields: bool = False,
+              movies: list[dict] | None = None):
+        if movies is None:
+            movies = load_movies()
+        segment = build_segment(movies, workers, compress, positions, fields)
+        segment.build_deletes(TYPO_MAX_DISTANCE, TYPO_PREFIX_LENGTH)
+        self._name_segment(segment, 0)
+        self._documents = {segment.meta["name"]: DocumentStore.from_documents(sorted(movies, key=lambda movie: movie["id"]))}
+        self.tombstones = {}
+        self.next_generation = 1
+        self._set_segments([segment])
+        if impacts:
+            self.build_impacts(quantize_bits)
+
+    def _name_segment(self, segment: IndexSegment, generation: int):
+        #names are unique so a rebuild never overwrites files another process has mapped
+        segment.meta["generation"] = generation
+        segment.meta["name"] = f"seg_{generation:06d}_{secrets.token_hex(4)}"
+
+    def _write_segment(self, segment: IndexSegment, documents: DocumentStore):
+        #documents are in segment row order, so a located row indexes them directly
+        directory = os.path.join(self.index_dir, segment.meta["name"])
+        os.makedirs(directory, exist_ok=True)
+        documents.save(os.path.join(directory, DOCUMENTS_DIR))
+        segment.save(directory)
+
+    def _write_manifest(self):
+        manifest = {
+            "segments": [segment.meta["name"] for segment in self.segments],
+            "tombstones": {str(doc_id): generation for doc_id, generation in self.tombstones.items()},
+            "next_generation": self.next_generation,
+        }
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.index_path)
+        #segments the manifest no longer references are dropped, open mappings stay valid
+        listed = set(manifest["segments"])
+        for entry in os.scandir(self.index_dir):
+            if entry.is_dir() and entry.name.startswith("seg_") and entry.name not in listed:
+                shutil.rmtree(entry.path)
             
     def save(self):
-        os.makedirs(CACHE_DIR, exist_ok=True)
-        with open(self.index_path, "wb") as f_index:
-            pickle.dump(self.index, f_index)
-        with open(self.docmap_path, "wb") as f_docmap:
-            pickle.dump(self.docmap, f_docmap)
-        with open(self.term_frequencies_path, "wb") as f_term_frequencies:
-            pickle.dump(self.term_frequencies, f_term_frequencies)
-        with open(self.doc_lengths_path, "wb") as f_doc_lengths:
-            pickle.dump(self.doc_lengths, f_doc_lengths)
+        os.makedirs(self.index_dir, exist_ok=True)
+        for segment in self.segments:
+            directory = os.path.join(self.index_dir, segment.meta["name"])
+            if not os.path.exists(os.path.join(directory, SEGMENT_META)):
+                self._write_segment(segment, self._documents[segment.meta["name"]])
+        self._write_manifest()
 
     def load(self):
-        with open(self.index_path, "rb") as f_index:
-            self.index = pickle.load(f_index)
-        with open(self.docmap_path, "rb") as f_docmap:
-            self.docmap = pickle.load(f_docmap)
-        with open(self.term_frequencies_path, "rb") as f_term_termfrequencies:
-            self.term_frequencies = pickle.load(f_term_termfrequencies)
-        with open(self.doc_lengths_path, "rb") as f_doc_lengths:
-            self.doc_lengths = pickle.load(f_doc_lengths)
-
-def build_command():
+        with open(self.index_path, "r") as f:
+            manifest = json.load(f)
+        self.tombstones = {int(doc_id): generation for doc_id, generation in manifest["tombstones"].items()}
+        self.next_generation = manifest["next_generation"]
+        segments = [IndexSegment.open(os.path.join(self.index_dir, name)) for name in manifest["segments"]]
+        self._set_segments(segments)
+        self._documents = {}
+
+    def upsert(self, movies: list[dict]):
+        #new versions land in one small immutable delta segment, older versions are tombstoned
+        movies = list({movie["id"]: movie for movie in movies}.values())
+        if not movies:
+            return
+        generation = self.next_generation
+        #deltas follow the base segment so phrase queries keep working until the next merge
+        with_positions = bool(self.segments) and self.segments[0].has_positions
+        with_fields = bool(self.segments) and self.segments[0].fields is not None
+        postings, doc_lengths, positions, fields = collect_postings(movies, with_positions, with_fields)
+        segment = IndexSegment.from_postings(postings, doc_lengths, positions=positions, fields=fields)
+        segment.build_deletes(TYPO_MAX_DISTANCE, TYPO_PREFIX_LENGTH)
+        self._name_segment(segment, generation)
+        documents = DocumentStore.from_documents(sorted(movies, key=lambda movie: movie["id"]))
+        self._documents[segment.meta["name"]] = documents
+        self._write_segment(segment, documents)
+        self.next_generation += 1
+        for movie in movies:
+            self.tombstones[movie["id"]] = generation
+        self._commit(self.segments + [segment])
+
+    def delete(self, doc_ids: list[int]) -> int:
+        deleted = 0
+        for doc_id in doc_ids:
+            if self._locate(doc_id) is not None:
+                #dead in every existing segment, a later upsert gets this generation and is live again
+                self.tombstones[doc_id] = self.next_generation
+                deleted += 1
+        if deleted:
+            self._commit(self.segments)
+        return deleted
+
+    def _commit(self, segments: list[IndexSegment]):
+        self._set_segments(segments)
+        self._write_manifest()
+        if len(self.segments) - 1 > MAX_DELTA_SEGMENTS:
+            self.merge()
+
+    def merge(self, compress: bool | None = None, impacts: bool = False, quantize_bits: int = 0):
+        #fold every segment into a new base without dead rows, tombstones are no longer needed
+        if compress is None:
+            compress = bool(self.segments) and self.segments[0].compressed
+        segment = IndexSegment.merge(self.segments, self.live_rows, compress)
+        documents = DocumentStore.from_documents(self.document(doc_id) for doc_id in segment.doc_ids.tolist())
+        segment.build_deletes(TYPO_MAX_DISTANCE, TYPO_PREFIX_LENGTH)
+        self._name_segment(segment, self.next_generation)
+        self.next_generation += 1
+        self.tombstones = {}
+        self._set_segments([segment])
+        if impacts:
+            self.build_impacts(quantize_bits)
+        self._documents = {segment.meta["name"]: documents}
+        self._write_segment(segment, documents)
+        self._write_manifest()
+
+def build_command(impacts: bool = False, quantize_bits: int = 0, compress: bool = False, workers: int = DEFAULT_BUILD_WORKERS, positions: bool = False, fields: bool = False) -> dict:
+    start = time.perf_counter()
     idx = InvertedIndex()
-    idx.build()
+    idx.build(impacts, quantize_bits, compress, workers, positions, fields)
     idx.save()
+    TitleCompleter.from_movies(idx.segment_documents(idx.segments[0])).save()
+    elapsed = time.perf_counter() - start
+    #ru_maxrss is reported in KiB on linux
+    return {
+        "docs": idx.doc_count,
+        "workers": workers,
+        "seconds": elapsed,
+        "docs_per_sec": idx.doc_count / elapsed if elapsed else 0.0,
+        "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "peak_worker_rss_kib": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    }
 
 def tf_command(doc_id: int, term: str) -> int:
     idx = InvertedIndex()
@@ -222,8 +964,137 @@ def bm25_tf_command(doc_id: int, term: str, k1: float = BM25_K1, b: float = BM25
     idx.load()
     return idx.get_bm25_tf(doc_id, term, k1, b)
 
-def bm25search_command(query: str, limit: int = DEFAULT_SEARCH_LIMIT):
+def bm25search_command(query: str, limit: int = DEFAULT_SEARCH_LIMIT, typo_tolerance: bool = True, fields: bool = False):
+    idx = InvertedIndex()
+    idx.load()
+    scores = idx.bm25_search(query, limit, typo_tolerance, fields)
+    return scores
+
+def bm25search_pruned_command(query: str, limit: int = DEFAULT_SEARCH_LIMIT, typo_tolerance: bool = True):
+    idx = InvertedIndex()
+    idx.load()
+    return idx.bm25_search_pruned(query, limit, typo_tolerance)
+
+def bm25search_batch_command(path: str, limit: int = DEFAULT_SEARCH_LIMIT) -> tuple[list[str], list[list[dict]], float]:
+    #path holds one query per line
+    with open(path, "r") as f:
+        queries = [line.strip() for line in f if line.strip()]
+    idx = InvertedIndex()
+    idx.load()
+    start = time.perf_counter()
+    results = idx.bm25_search_batch(queries, limit)
+    return queries, results, (time.perf_counter() - start) * 1000
+
+def spell_command(word: str) -> list[tuple[str, int]]:
+    idx = InvertedIndex()
+    idx.load()
+    expansions = []
+    for token in tokenize_text(word):
+        expansions.extend(idx.expand_term(token))
+    return expansions
+
+def bench_bm25_command(limits: tuple[int, ...] = BENCHMARK_LIMITS, repeat: int = 3) -> list[dict]:
+    idx = InvertedIndex()
+    idx.load()
+    queries = [case["query"] for case in load_golden_dataset()["test_cases"]]
+    report = []
+    for limit in limits:
+        timings = {"exhaustive": 0.0, "pruned": 0.0}
+        overlap = 0
+        for query in queries:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                exhaustive = idx.bm25_search(query, limit)
+                timings["exhaustive"] += time.perf_counter() - start
+                start = time.perf_counter()
+                pruned = idx.bm25_search_pruned(query, limit)
+                timings["pruned"] += time.perf_counter() - start
+            expected = {res["id"] for res in exhaustive}
+            if expected:
+                overlap += len(expected & {res["id"] for res in pruned}) / len(expected)
+            else:
+                overlap += 1
+        runs = len(queries) * repeat
+        report.append({
+            "limit": limit,
+            "queries": len(queries),
+            "exhaustive_ms": timings["exhaustive"] / runs * 1000,
+            "pruned_ms": timings["pruned"] / runs * 1000,
+            "overlap": overlap / len(queries),
+        })
+    return report
+
+def index_report_command(limit: int = DEFAULT_SEARCH_LIMIT, repeat: int = 3) -> list[dict]:
+    #footprint and latency of the legacy pickles against raw and compressed segments
+    movies = load_movies()
+    postings, doc_lengths, _, _ = collect_postings(movies)
+    queries = [tokenize_text(case["query"]) for case in load_golden_dataset()["test_cases"]]
+    report = []
+
+    index = defaultdict(set)
+    term_frequencies = defaultdict(Counter)
+    for token, docs in postings.items():
+        for doc_id, tf in docs.items():
+            index[token].add(doc_id)
+            term_frequencies[doc_id][token] = tf
+    pickled = pickle.dumps((index, term_frequencies, dict(doc_lengths)))
+    start = time.perf_counter()
+    pickle.loads(pickled)
+    load_ms = (time.perf_counter() - start) * 1000
+    #traced separately, tracemalloc slows every allocation down
+    tracemalloc.start()
+    pickle.loads(pickled)
+    memory_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    report.append({"format": "pickle", "disk_bytes": len(pickled), "load_ms": load_ms, "memory_bytes": memory_bytes, "query_ms": None})
+
+    for name, compress in (("segment", False), ("segment+packed", True)):
+        segment = IndexSegment.from_postings(postings, doc_lengths, compress)
+        with tempfile.TemporaryDirectory() as directory:
+            segment.save(directory)
+            disk_bytes = sum(entry.stat().st_size for entry in os.scandir(directory))
+            start = time.perf_counter()
+            idx = InvertedIndex()
+            idx._set_segments([IndexSegment.open(directory)])
+            load_ms = (time.perf_counter() - start) * 1000
+            tracemalloc.start()
+            IndexSegment.open(directory)
+            memory_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            start = time.perf_counter()
+            for _ in range(repeat):
+                for tokens in queries:
+                    idx._top_k(*idx._score_terms(Counter(tokens)), limit)
+            query_ms = (time.perf_counter() - start) / (repeat * len(queries)) * 1000
+            del idx
+        report.append({"format": name, "disk_bytes": disk_bytes, "load_ms": load_ms, "memory_bytes": memory_bytes, "query_ms": query_ms})
+    return report
+
+def upsert_command(path: str) -> tuple[int, float]:
+    #path holds one movie, a list of movies or {"movies": [...]} like movies.json
+    with open(path, "r") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("movies", [data])
+    start = time.perf_counter()
+    idx = InvertedIndex()
+    idx.load()
+    idx.upsert(data)
+    TitleCompleter.load().updated(movies=data).save()
+    return len(data), (time.perf_counter() - start) * 1000
+
+def delete_command(doc_ids: list[int]) -> tuple[int, float]:
+    start = time.perf_counter()
+    idx = InvertedIndex()
+    idx.load()
+    deleted = idx.delete(doc_ids)
+    if deleted:
+        TitleCompleter.load().updated(deleted=doc_ids).save()
+    return deleted, (time.perf_counter() - start) * 1000
+
+def merge_command(compress: bool | None = None, impacts: bool = False, quantize_bits: int = 0) -> int:
     idx = InvertedIndex()
     idx.load()
-    scores = idx.bm25_search(query, limit)
-    return scores
\ No newline at end of file
+    merged = len(idx.segments)
+    idx.merge(compress, impacts, quantize_bits)
+    return merged
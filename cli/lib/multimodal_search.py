@@ -1,16 +1,14 @@
 from PIL import Image
 from sentence_transformers import SentenceTransformer
 from .semantic_search import cosine_similarity
-from .search_utils import load_movies
+from .document_store import load_documents
 
 class MultimodalSearch:
     def __init__(self, documents: list[dict], model_name="clip-ViT-B-32"):
         self.model = SentenceTransformer(model_name)
         self.documents = documents
-        self.texts = []
-        for doc in documents:
-            self.texts.append(f"{doc['title']}: {doc['description']}")
-        self.text_embeddings = self.model.encode(self.texts, show_progress_bar=True)
+        texts = [f"{doc['title']}: {doc['description']}" for doc in documents]
+        self.text_embeddings = self.model.encode(texts, show_progress_bar=True)
 
 
     def embed_image(self, path: str):
@@ -20,17 +18,20 @@ class MultimodalSearch:
     
     def search_with_image(self, path: str):
         image_embedding = self.embed_image(path)
-        result = []
+        scores = []
         for i, text_embedding in enumerate(self.text_embeddings):
-            cos_sim = cosine_similarity(image_embedding, text_embedding)
+            scores.append((cosine_similarity(image_embedding, text_embedding), i))
+        result = []
+        #only the top documents are read from the store
+        for cos_sim, i in sorted(scores, key=lambda item: item[0], reverse=True)[:5]:
+            doc = self.documents[i]
             result.append({
-                "doc_id": self.documents[i]["id"],
-                "title": self.documents[i]["title"],
-                "description": self.documents[i]["description"],
+                "doc_id": doc["id"],
+                "title": doc["title"],
+                "description": doc["description"],
                 "score": cos_sim
             })
-        sorted_doc = sorted(result, key=lambda item: item['score'], reverse=True)[:5]
-        return sorted_doc
+        return result
 
     
 def verify_image_embedding(path: str):
@@ -39,7 +40,7 @@ def verify_image_embedding(path: str):
     print(f"Embedding shape: {embedding.shape[0]} dimensions")
 
 def image_search_command(path: str):
-    movies = load_movies()
+    movies = load_documents()
     search = MultimodalSearch(movies)
     result = search.search_with_image(path)
     return result
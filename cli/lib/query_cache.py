@@ -0,0 +1,135 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from .search_utils import (
+    CACHE_DIR,
+    QUERY_CACHE_SIZE,
+    QUERY_DISK_CACHE,
+    QUERY_DISK_CACHE_SIZE,
+    QUERY_CACHE_PRUNE_EVERY,
+)
+
+
+def normalize_query(query: str) -> str:
+    #only whitespace is folded, anything else may change what the encoder sees
+    return " ".join(query.split())
+
+
+class QueryEmbeddingCache:
+    #LRU of query embeddings keyed by (model, normalized query), optionally backed by one .npy per key on disk
+    def __init__(self, capacity: int = QUERY_CACHE_SIZE, directory: str | None = None, disk_capacity: int = QUERY_DISK_CACHE_SIZE):
+        self.capacity = capacity
+        self.directory = directory
+        self.disk_capacity = disk_capacity
+        self.entries: OrderedDict[str, np.ndarray] = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_writes = 0
+        #hybrid legs look queries up from pool threads, timed out ones alongside new ones
+        self.lock = threading.Lock()
+
+    def key(self, model_name: str, query: str) -> str:
+        return hashlib.blake2b(f"{model_name}\n{normalize_query(query)}".encode(), digest_size=16).hexdigest()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npy")
+
+    def get(self, model_name: str, query: str) -> np.ndarray | None:
+        key = self.key(model_name, query)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+        if self.directory is not None and os.path.exists(self._disk_path(key)):
+            try:
+                embedding = np.load(self._disk_path(key))
+                #the file's mtime is its last use, pruning drops the oldest
+                os.utime(self._disk_path(key))
+            except (OSError, ValueError):
+                embedding = None
+            if embedding is not None:
+                with self.lock:
+                    self.disk_hits += 1
+                return self._remember(key, embedding)
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, model_name: str, query: str, embedding: np.ndarray) -> np.ndarray:
+        key = self.key(model_name, query)
+        embedding = self._remember(key, embedding)
+        if self.directory is not None:
+            #written beside and renamed, a concurrent reader never loads a partial file,
+            #named per thread as well so two legs writing one key don't share a staging file
+            os.makedirs(self.directory, exist_ok=True)
+            staging = os.path.join(self.directory, f"{key}.{os.getpid()}.{threading.get_ident()}.tmp.npy")
+            np.save(staging, embedding)
+            os.replace(staging, self._disk_path(key))
+            with self.lock:
+                self.disk_writes += 1
+                prune = self.disk_writes % QUERY_CACHE_PRUNE_EVERY == 0
+            if prune:
+                self.prune()
+        return embedding
+
+    def _remember(self, key: str, embedding: np.ndarray) -> np.ndarray:
+        embedding = np.array(embedding, dtype=np.float32)
+        embedding.flags.writeable = False
+        with self.lock:
+            self.entries[key] = embedding
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+        return embedding
+
+    def get_or_compute(self, model_name: str, query: str, encode) -> np.ndarray:
+        embedding = self.get(model_name, query)
+        if embedding is None:
+            embedding = self.put(model_name, query, encode())
+        return embedding
+
+    def prune(self):
+        #least recently used files go first once the directory holds more than disk_capacity
+        if self.directory is None or not os.path.isdir(self.directory):
+            return
+        paths = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".npy") and ".tmp" not in entry.name]
+        if len(paths) <= self.disk_capacity:
+            return
+        paths.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in paths[:len(paths) - self.disk_capacity]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        with self.lock:
+            return self._stats()
+
+    def _stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+        }
+
+
+_default_cache = None
+
+def default_query_cache() -> QueryEmbeddingCache:
+    #one cache per process, shared by every search object so hybrid and evaluation runs hit each other's entries
+    global _default_cache
+    if _default_cache is None:
+        #in process only unless the disk store is turned on
+        directory = os.path.join(CACHE_DIR, "query_embeddings") if QUERY_DISK_CACHE else None
+        _default_cache = QueryEmbeddingCache(directory=directory)
+        _default_cache.prune()
+    return _default_cache
@@ -0,0 +1,68 @@
+import numpy as np
+
+
+def top_k_indices(scores: np.ndarray, limit: int) -> np.ndarray:
+    #highest score first, lower index first on ties
+    if limit <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.arange(len(scores))
+    if len(scores) > limit:
+        kth = scores[np.argpartition(-scores, limit - 1)[limit - 1]]
+        candidates = np.flatnonzero(scores >= kth)
+    order = np.lexsort((candidates, -scores[candidates]))[:limit]
+    return candidates[order]
+
+
+class ResultCursor:
+    #one search leg read in rank order: scored once, ordered a doubling block at a time and only
+    #formatted for the ranks asked for, ranks from depth on are cut off like the tail of a top depth list
+    def __init__(self, scores: np.ndarray, keys: np.ndarray, depth: int, format_rows=None, value=float):
+        self.scores = scores
+        self.keys = keys #doc id of every score
+        self.depth = max(min(depth, len(scores)), 0)
+        self.format_rows = format_rows #score rows -> result dicts, in the leg's own format
+        self.value = value #python float -> the score the leg's result dicts carry
+        self.order = np.empty(0, dtype=np.int64)
+        self.ids = [] #doc ids of the ranks read so far
+        self.values = []
+        self.rank_of = {}
+
+    @classmethod
+    def empty(cls) -> "ResultCursor":
+        return cls(np.empty(0), np.empty(0, dtype=np.int64), 0)
+
+    def ranked(self, count: int) -> np.ndarray:
+        #score rows of the first count ranks
+        count = min(count, self.depth)
+        if count > len(self.order):
+            self.order = top_k_indices(self.scores, min(max(count, 2 * len(self.order)), self.depth))
+        return self.order[:count]
+
+    @property
+    def exhausted(self) -> bool:
+        return len(self.ids) == self.depth
+
+    def advance(self, count: int):
+        #reads ranks up to count
+        start = len(self.ids)
+        rows = self.ranked(count)[start:]
+        for rank, (doc_id, score) in enumerate(zip(self.keys[rows].tolist(), self.scores[rows].tolist()), start):
+            self.ids.append(doc_id)
+            self.values.append(self.value(score))
+            self.rank_of[doc_id] = rank
+
+    def value_at(self, rank: int) -> float:
+        return self.value(self.scores[self.ranked(rank + 1)[rank]].item())
+
+    def lowest(self) -> float:
+        #score of the last rank, found without ordering the ranks above it
+        kth = np.partition(-self.scores, self.depth - 1)[self.depth - 1]
+        return self.value(-kth.item())
+
+    def result(self, rank: int) -> dict:
+        return self.format_rows(self.ranked(rank + 1)[rank:rank + 1])[0]
+
+    def results(self) -> list[dict]:
+        #every rank down to depth, what the exhaustive search returns
+        self.advance(self.depth)
+        return self.format_rows(self.ranked(self.depth)) if self.depth else []
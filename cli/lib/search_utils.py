@@ -1,5 +1,6 @@
 import json
 import os
+import string
 from dotenv import load_dotenv
 from typing import Any
 
@@ -14,6 +15,51 @@ MAX_CHUNK_SIZE = 4
 SCORE_PRECISION = 3
 BM25_K1 = 1.5 #k1 - tunable saturation parameter
 BM25_B = 0.75 #B - normalization strength
+DEFAULT_IMPACT_BITS = 8 #quantization levels for precomputed BM25 impacts, 0 keeps floats
+BENCHMARK_LIMITS = (10, 5000) #small k for direct search, large k for hybrid over-fetch
+DEFAULT_BUILD_WORKERS = os.cpu_count() or 1
+MAX_DELTA_SEGMENTS = 8 #upserts merge every segment back into one past this many deltas
+TYPO_MAX_DISTANCE = 2 #edit distance searched for unknown query tokens
+TYPO_PREFIX_LENGTH = 7 #deletion variants are only generated for this many leading characters
+TYPO_MIN_LENGTH = 3 #shorter unknown tokens are never expanded
+TYPO_MAX_EXPANSIONS = 3 #in-vocabulary terms an unknown token expands to
+SUGGEST_PREFIX_LENGTH = 2 #title prefixes up to this many bytes keep a precomputed top list
+SUGGEST_TOP_K = 10 #suggestions stored per precomputed prefix
+BATCH_SCORE_CELLS = 1 << 22 #query x document accumulators a batch search holds at once
+INDEX_FIELDS = ("title", "description") #indexed in this order, as one text and per field for BM25F
+BM25F_BOOSTS = {"title": 2.0, "description": 1.0} #BM25F weight of a match in each field
+BM25F_B = {"title": 0.5, "description": 0.75} #BM25F length normalization strength per field
+DEFAULT_SHARDS = 4 #keyword index shards, each searched by its own process
+SEMANTIC_BENCHMARK_SIZES = (1_000, 10_000, 100_000) #chunk counts timed by the semantic benchmark
+SEMANTIC_BENCHMARK_LOOP_LIMIT = 10_000 #largest chunk count the old per-chunk loop is timed on
+DEFAULT_IVF_NPROBE = 8 #IVF lists scored per query, more lists means higher recall and latency
+IVF_KMEANS_ITERATIONS = 20 #k-means rounds when training the IVF centroids
+IVF_TRAIN_PER_LIST = 256 #k-means trains on at most this many sampled vectors per list
+IVF_ASSIGN_BLOCK = 8192 #vectors assigned to centroids per matrix product
+IVF_REPORT_NPROBES = (1, 2, 4, 8, 16, 32) #nprobe values compared by the recall report
+EMBEDDING_QUANTIZATIONS = ("float16", "int8", "pq") #compressed embedding storage modes
+PQ_SUBVECTORS = 48 #product quantization splits, one byte code per split
+PQ_CENTROIDS = 256 #codebook entries per split, fits a uint8 code
+PQ_TRAIN_SIZE = 16384 #sampled vectors each split's codebook is trained on
+QUANTIZED_SCORE_BLOCK = 65536 #rows decoded per block when scoring quantized codes
+QUANTIZED_RESCORE_FACTOR = 4 #quantized searches rescore this many times limit candidates in float32
+DEFAULT_SEARCH_WORKERS = 4 #query worker processes sharing one published copy of the embeddings
+QUERY_CACHE_SIZE = 1024 #query embeddings kept in process
+QUERY_DISK_CACHE = os.environ.get("QUERY_DISK_CACHE", "0") == "1" #also keep query embeddings under cache/query_embeddings across runs, off by default
+QUERY_DISK_CACHE_SIZE = 100_000 #query embeddings kept on disk before the least recently used are pruned
+QUERY_CACHE_PRUNE_EVERY = 1000 #disk writes between prunes of the on-disk query cache
+DEFAULT_ENCODE_WORKERS = 1 #encoder processes for embedding builds, 1 encodes in process
+BULK_BATCH_TOKENS = 8192 #padded tokens per encoder batch, short texts get larger batches
+BULK_MAX_BATCH = 256 #texts per encoder batch at most
+BULK_CHECKPOINT_EVERY = 16 #encoded batches between flushes of a resumable build
+BULK_STREAM_WINDOW = 4096 #streamed texts length sorted and batched together
+ENCODER_BACKENDS = ("torch", "onnx", "onnx-int8") #sentence encoder runtimes
+DEFAULT_ENCODER_BACKEND = os.environ.get("ENCODER_BACKEND", "torch")
+ONNX_QUANTIZATION_CONFIG = os.environ.get("ONNX_QUANTIZATION_CONFIG", "avx2") #int8 kernels: arm64, avx2, avx512 or avx512_vnni
+ENCODER_PARITY_DOCUMENTS = 1000 #movies encoded by the backend parity check and benchmark
+HYBRID_WARMUP_QUERY = "movie" #query a resident hybrid engine runs once before serving
+HYBRID_LEG_TIMEOUT = None #seconds a concurrent hybrid leg may take before the other answers alone, None waits for both
+HYBRID_LEG_WORKERS = 4 #threads running hybrid legs
 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 DATA_PATH = os.path.join(PROJECT_ROOT, "data", "movies.json")
@@ -35,6 +81,13 @@ def load_stop_words() -> list[str]:
     with open(STOP_WORDS_PATH, "r") as f: 
         return f.read().splitlines()
 
+PUNCTUATION_TABLE = str.maketrans("", "", string.punctuation)
+
+def process_text(text: str) -> list[str]:
+    text = text.lower()
+    text = text.translate(PUNCTUATION_TABLE)
+    return text
+
 def load_image(path: str) -> bytes:
     with open(path, "rb") as f:
         return f.read()
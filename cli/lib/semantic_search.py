@@ -1,8 +1,10 @@
 import os
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import regex as re
 import json
-from sentence_transformers import SentenceTransformer
 from .search_utils import (
     DEFAULT_SEARCH_LIMIT,
     DEFAULT_CHUNK_SIZE,
@@ -10,64 +12,179 @@ from .search_utils import (
     DEFAULT_SEMANTIC_CHUNK_OVERLAP,
     MAX_CHUNK_SIZE,
     CACHE_DIR,
-    load_movies,
+    SEMANTIC_BENCHMARK_SIZES,
+    SEMANTIC_BENCHMARK_LOOP_LIMIT,
+    IVF_REPORT_NPROBES,
+    QUANTIZED_RESCORE_FACTOR,
+    EMBEDDING_QUANTIZATIONS,
+    DEFAULT_SEARCH_WORKERS,
+    DEFAULT_ENCODE_WORKERS,
+    ENCODER_BACKENDS,
+    ENCODER_PARITY_DOCUMENTS,
     format_embedded_search_result,
+    load_golden_dataset,
 )
+from .document_store import DocumentStore, load_documents
+from .index_segment import load_array
+from .vector_index import IVFIndex, QuantizedVectors, normalize_embeddings, save_arrays
+from .bulk_encoder import BulkEncoder, open_output, close_output
+from .shared_arrays import SharedArrays
+from .query_cache import QueryEmbeddingCache, default_query_cache
+from .result_cursor import ResultCursor, top_k_indices
+from .encoders import SentenceTransformer, load_encoder, encoder_id, default_encoder_backend
+
+CHUNK_METADATA_META = "chunks.json"
+#  movie_idx: document row of every chunk, chunks of a movie are contiguous
+#  chunk_idx: position of the chunk in its movie
+#  total_chunks: chunk count of its movie
+CHUNK_METADATA_ARRAYS = ("movie_idx", "chunk_idx", "total_chunks")
 
 class SemanticSearch:
-    def __init__(self, model_name='all-MiniLM-L6-v2'):
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name='all-MiniLM-L6-v2', quantization: str | None = None, rescore: bool = True, query_cache: QueryEmbeddingCache | None = None, backend: str | None = None):
+        self.model_name = model_name
+        self.backend = backend or default_encoder_backend()
+        self.encoder_id = encoder_id(model_name, self.backend)
+        self._model = None
         self.embeddings = None
-        self.documents = None
-        self.document_map = {}
+        self.documents = None #DocumentStore or list of movie dicts, indexed by embedding row
         self.embeddings_path = os.path.join(CACHE_DIR, "movie_embeddings.npy")
+        #with a quantization the codes are searched and the float32 matrix stays mmap'd for rescoring
+        self.quantization = quantization
+        self.rescore = rescore
+        self.codes = None
+        self.encoded = 0 #texts the last build ran through the model
+        self.encode_workers = DEFAULT_ENCODE_WORKERS #encoder processes for builds, 1 encodes in process
+        self.query_cache = query_cache or default_query_cache()
+
+    @property
+    def model(self) -> SentenceTransformer:
+        #loaded on first use, workers scoring precomputed query embeddings never pay for it
+        if self._model is None:
+            self._model = load_encoder(self.model_name, self.backend)
+        return self._model
 
     def generate_embedding(self, text: str):
         if text == "" or text.isspace():
             raise ValueError("No text to embed")
-        encode = self.model.encode([text])
-        return encode[0]
+        #repeated queries skip the encoder, the cache is shared by every search in the process
+        return self.query_cache.get_or_compute(self.encoder_id, text, lambda: self.model.encode([text])[0])
     
     def build_embeddings(self, documents):
+        #documents whose text is already in the cache keep their row, only the rest are encoded
         self.documents = documents
-        self.document_map = {}
         doc_list = []
         for doc in documents:
-            self.document_map[doc['id']] = doc
             doc_list.append(f"{doc['title']}: {doc['description']}")
-        self.embeddings = self.model.encode(doc_list, show_progress_bar=True)
-        os.makedirs(os.path.dirname(self.embeddings_path), exist_ok=True)
-        np.save(self.embeddings_path, self.embeddings)
+        hashes = [content_hash(text) for text in doc_list]
+        old, cached = None, {}
+        manifest = load_manifest(self.embeddings_path, self._manifest_key())
+        if manifest is not None:
+            old = load_cached_embeddings(self.embeddings_path, manifest)
+            cached = {text_hash: row for row, text_hash in enumerate(load_hashes(self.embeddings_path, manifest, "hashes").tolist())}
+        self.encode_missing(enumerate(doc_list), hashes, old, cached, self.embeddings_path)
+        manifest = {**self._manifest_key(), "documents_version": documents_version(documents)}
+        swap_in_embeddings(self.embeddings_path, manifest, {"hashes": hashes})
+        self.embeddings = load_embeddings(self.embeddings_path)
+        self.codes = self.load_or_create_codes(self.embeddings_path, self.embeddings)
         return self.embeddings
 
     
     def load_or_create_embeddings(self, documents):
         self.documents = documents
-        doc_list = []
-        for doc in documents:
-            self.document_map[doc['id']] = doc
-            doc_list.append(f"{doc['title']}: {doc['description']}")
-        if os.path.exists(self.embeddings_path):
-                self.embeddings = np.load(self.embeddings_path)
-                if len(self.embeddings) == len(doc_list):
-                    return self.embeddings
+        manifest = load_manifest(self.embeddings_path, self._manifest_key())
+        if manifest is not None and manifest.get("normalized") and "hash_mtimes" in manifest:
+            texts = (f"{doc['title']}: {doc['description']}" for doc in documents)
+            if same_documents(self.embeddings_path, manifest, "hashes", documents, texts):
+                self.embeddings = load_embeddings(self.embeddings_path)
+                self.codes = self.load_or_create_codes(self.embeddings_path, self.embeddings)
+                return self.embeddings
         return self.build_embeddings(documents)
 
+    def _manifest_key(self) -> dict:
+        #a cache made by another model or backend is never reused
+        return {"model": self.encoder_id}
+
+    def encode_missing(self, items, hashes: list[str], old: np.ndarray | None, cached: dict[str, int], path: str):
+        #writes the matrix for hashes into the staging file of path, rows of cached hashes are copied
+        #from old and the rest bulk encoded from the (row, text) pairs of items, which may be a generator
+        #an interrupted build of the same texts resumes from the rows it already wrote
+        staging = staging_path(path)
+        job = hashlib.blake2b(self.encoder_id.encode() + np.asarray(hashes, dtype=np.uint64).tobytes(), digest_size=8).hexdigest()
+        model = self.model if self.encode_workers <= 1 else None
+        with BulkEncoder(self.model_name, model, self.encode_workers, backend=self.backend) as encoder:
+            dimensions = old.shape[1] if old is not None else encoder.dimensions()
+            output, done = open_output(staging, len(hashes), dimensions, job)
+            reused = [i for i, text_hash in enumerate(hashes) if text_hash in cached and not done[i]]
+            if reused:
+                output[reused] = old[[cached[hashes[i]] for i in reused]]
+                done[reused] = True
+            self.encoded = encoder.encode_stream(items, output, done)
+        close_output(staging, output)
+
+    def load_or_create_codes(self, embeddings_path: str, embeddings: np.ndarray) -> QuantizedVectors | None:
+        #kept next to the matrix, rebuilt whenever the matrix file is rewritten
+        if self.quantization is None:
+            return None
+        directory = f"{os.path.splitext(embeddings_path)[0]}_{self.quantization}"
+        source_mtime = os.path.getmtime(embeddings_path)
+        if os.path.exists(directory):
+            codes = QuantizedVectors.load(directory)
+            if codes.meta.get("source_mtime") == source_mtime and len(codes) == len(embeddings):
+                return codes
+        codes = QuantizedVectors.from_vectors(embeddings, self.quantization)
+        codes.meta["source_mtime"] = source_mtime
+        codes.save(directory)
+        return QuantizedVectors.load(directory)
+
+    def shared_arrays(self) -> tuple[dict[str, np.ndarray], dict]:
+        #everything a worker needs to search, as arrays plus a json-able meta
+        arrays, meta = {}, {}
+        if self.embeddings is not None:
+            arrays["embeddings"] = self.embeddings
+        if self.codes is not None:
+            arrays.update({f"codes.{name}": array for name, array in self.codes.arrays.items()})
+            meta["codes"] = self.codes.meta
+        return arrays, meta
+
+    def attach_arrays(self, arrays: dict[str, np.ndarray], meta: dict):
+        self.embeddings = arrays.get("embeddings")
+        self.codes = None
+        if "codes" in meta:
+            self.codes = QuantizedVectors(meta["codes"]["kind"], prefixed_arrays(arrays, "codes"), meta["codes"])
+
+    def publish(self) -> SharedArrays:
+        #one physical copy for a pool, workers call attach with publish().descriptor
+        return SharedArrays.publish(*self.shared_arrays())
+
+    def attach(self, descriptor: dict, documents) -> SharedArrays:
+        #the caller keeps the returned block alive for as long as it searches
+        shared = SharedArrays.attach(descriptor)
+        self.attach_arrays(shared.arrays, shared.meta)
+        self.documents = documents
+        return shared
+
     def search(self, query, limit):
-        score = []
         if self.embeddings is None or self.embeddings.size == 0:
             raise ValueError("No embeddings loaded. Call `load_or_create_embeddings` first.")
         if self.documents is None or len(self.documents) == 0:
             raise ValueError("No documents loaded. Call `load_or_create_embeddings` first.")
-        query_embedding = self.generate_embedding(query)
-        for i, doc_embedding in enumerate(self.embeddings):
-            cosigne = cosine_similarity(query_embedding, doc_embedding)
-            score.append((cosigne, self.documents[i]))
-        sorted_scores = sorted(score, key=lambda x: x[0], reverse=True)
+        #rows are unit length, so one matrix-vector product gives every cosine similarity
+        query_embedding = normalize_embeddings(self.generate_embedding(query))
+        rows = None
+        if self.codes is None:
+            scores = self.embeddings @ query_embedding
+        else:
+            scores = self.codes.score(query_embedding)
+            if self.rescore:
+                #the codes pick the candidates, full precision orders them
+                rows = np.sort(top_k_indices(scores, limit * QUANTIZED_RESCORE_FACTOR))
+                scores = full_precision_scores(self.embeddings, rows, query_embedding)
         results = []
-        for score, doc in sorted_scores[:limit]:
+        for i in top_k_indices(scores, limit).tolist():
+            doc = self.documents[i if rows is None else int(rows[i])]
             formatted_result = format_embedded_search_result(
-                score,
+                float(scores[i]),
+                doc["id"],
                 doc["title"],
                 doc["description"]
             )
@@ -89,7 +206,7 @@ def embed_text(text: str):
 
 def verify_embeddings():
     search = SemanticSearch()
-    documents = load_movies()
+    documents = load_documents()
     embeddings = search.load_or_create_embeddings(documents)
     print(f"Number of docs: {len(documents)}")
     print(f"Embeddings shape: {embeddings.shape[0]} vectors in {embeddings.shape[1]} dimensions")
@@ -101,6 +218,106 @@ def embed_query_text(query):
     print(f"First 5 dimensions: {embedding[:5]}")
     print(f"Shape: {embedding.shape}")
 
+def prefixed_arrays(arrays: dict[str, np.ndarray], prefix: str) -> dict[str, np.ndarray]:
+    #"codes.scale" -> "scale" for every array published under prefix
+    return {name[len(prefix) + 1:]: array for name, array in arrays.items() if name.startswith(f"{prefix}.")}
+
+def full_precision_scores(embeddings: np.ndarray, rows: np.ndarray, query_embedding: np.ndarray) -> np.ndarray:
+    #only the rescored rows of a mapped matrix are read
+    return embeddings[rows] @ query_embedding
+
+def content_hash(text: str) -> int:
+    #64 bit digest, stored as uint64 arrays beside the matrix, big endian so it equals the hex digests older manifests listed
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "big")
+
+def hash_array(texts) -> np.ndarray:
+    return np.fromiter((content_hash(text) for text in texts), dtype=np.uint64)
+
+def hashes_path(embeddings_path: str, name: str) -> str:
+    return f"{os.path.splitext(embeddings_path)[0]}_{name}.npy"
+
+def load_hashes(embeddings_path: str, manifest: dict, name: str) -> np.ndarray:
+    #mapped, manifests from before the arrays listed the digests as hex strings
+    if name in manifest:
+        return np.array([int(text_hash, 16) for text_hash in manifest[name]], dtype=np.uint64)
+    return load_array(hashes_path(embeddings_path, name))
+
+def documents_version(documents) -> float | None:
+    #movies.json mtime a DocumentStore was built from, None for plain lists
+    meta = getattr(documents, "meta", None)
+    return meta.get("source_mtime") if meta is not None else None
+
+def same_documents(embeddings_path: str, manifest: dict, name: str, documents, texts) -> bool:
+    #a store of the movies.json version the cache was built from holds the same texts, so nothing is hashed,
+    #anything else is hashed and compared against the stored digests in one vectorized pass
+    version = documents_version(documents)
+    if version is not None and manifest.get("documents_version") == version:
+        return True
+    return np.array_equal(load_hashes(embeddings_path, manifest, name), hash_array(texts))
+
+def manifest_path(embeddings_path: str) -> str:
+    return f"{os.path.splitext(embeddings_path)[0]}_manifest.json"
+
+def load_manifest(embeddings_path: str, key: dict) -> dict | None:
+    #None unless the manifest was written for this matrix file under the same key
+    path = manifest_path(embeddings_path)
+    if not os.path.exists(path) or not os.path.exists(embeddings_path):
+        return None
+    with open(path, "r") as f:
+        manifest = json.load(f)
+    if any(manifest.get(name) != value for name, value in key.items()):
+        return None
+    if manifest.get("matrix_mtime") != os.path.getmtime(embeddings_path):
+        return None
+    for name, mtime in manifest.get("hash_mtimes", {}).items():
+        hash_path = hashes_path(embeddings_path, name)
+        if not os.path.exists(hash_path) or os.path.getmtime(hash_path) != mtime:
+            return None
+    return manifest
+
+def chunk_metadata_arrays(chunk_counts: list[int]) -> dict[str, np.ndarray]:
+    #CHUNK_METADATA_ARRAYS from the chunk count of every document row
+    counts = np.asarray(chunk_counts, dtype=np.int32)
+    movie_idx = np.repeat(np.arange(len(counts), dtype=np.int32), counts)
+    first = np.repeat(np.cumsum(counts, dtype=np.int32) - counts, counts)
+    return {
+        "movie_idx": movie_idx,
+        "chunk_idx": np.arange(len(movie_idx), dtype=np.int32) - first,
+        "total_chunks": np.repeat(counts, counts),
+    }
+
+def save_chunk_metadata(directory: str, metadata: dict[str, np.ndarray]):
+    save_arrays(directory, metadata, {"total_chunks": len(metadata["movie_idx"])}, CHUNK_METADATA_META)
+
+def staging_path(embeddings_path: str) -> str:
+    return f"{os.path.splitext(embeddings_path)[0]}.tmp.npy"
+
+def swap_in_embeddings(path: str, manifest: dict, hashes: dict[str, list[int]]):
+    #the staged matrix replaces the live one since other processes map it, the hash arrays are swapped in
+    #the same way and the manifest written last pins the files it describes
+    manifest["hash_mtimes"] = {}
+    for name, values in hashes.items():
+        hash_path = hashes_path(path, name)
+        np.save(staging_path(hash_path), np.asarray(values, dtype=np.uint64))
+        os.replace(staging_path(hash_path), hash_path)
+        manifest["hash_mtimes"][name] = os.path.getmtime(hash_path)
+    os.replace(staging_path(path), path)
+    manifest["matrix_mtime"] = os.path.getmtime(path)
+    manifest["normalized"] = True #every build writes unit length rows
+    with open(manifest_path(path), "w") as f:
+        json.dump(manifest, f)
+
+def load_embeddings(path: str) -> np.ndarray:
+    #mapped read only, so cold start doesn't grow with the matrix and processes share the page cache
+    return load_array(path)
+
+def load_cached_embeddings(path: str, manifest: dict) -> np.ndarray:
+    #rows reused by a build, a manifest without the normalized flag is from before rows were normalized
+    #so its rows are normalized here once and the rebuilt cache is written with the flag
+    if manifest.get("normalized"):
+        return load_embeddings(path)
+    return normalize_embeddings(np.load(path))
+
 def cosine_similarity(vec1, vec2):
     dot_product = np.dot(vec1, vec2)
     norm1 = np.linalg.norm(vec1) #magnitude
@@ -110,9 +327,9 @@ def cosine_similarity(vec1, vec2):
         return 0.0
     return dot_product / (norm1 * norm2)
 
-def semantic_search(query: str, limit: int = DEFAULT_SEARCH_LIMIT):
-    search = SemanticSearch()
-    movies = load_movies()
+def semantic_search(query: str, limit: int = DEFAULT_SEARCH_LIMIT, quantization: str | None = None, rescore: bool = True):
+    search = SemanticSearch(quantization=quantization, rescore=rescore)
+    movies = load_documents()
     search.load_or_create_embeddings(movies)
     results = search.search(query, limit)
     return results
@@ -163,72 +380,208 @@ def semantic_chunks_command(text: str, chunk_size: int = MAX_CHUNK_SIZE, overlap
 
 
 class ChunkedSemanticSearch(SemanticSearch):
-    def __init__(self, model_name = "all-MiniLM-L6-v2") -> None:
-        super().__init__(model_name)
+    def __init__(self, model_name = "all-MiniLM-L6-v2", quantization: str | None = None, rescore: bool = True, query_cache: QueryEmbeddingCache | None = None, backend: str | None = None) -> None:
+        super().__init__(model_name, quantization, rescore, query_cache, backend)
         self.chunk_embeddings = None
-        self.chunk_metadata = None
+        self.chunk_codes = None
+        self.chunk_metadata = None #CHUNK_METADATA_ARRAYS by name
+        self.movie_starts = None #first chunk row of every movie, chunks of a movie are contiguous
+        self.movie_indices = None #document row of every movie in movie_starts
+        self.chunk_movies = None #document row of every chunk
+        self.vector_index = None
         self.chunk_embeddings_path = os.path.join(CACHE_DIR, "chunk_embeddings.npy")
-        self.chunk_metadata_path = os.path.join(CACHE_DIR, "chunk_metadata.json")
+        self.chunk_metadata_dir = os.path.join(CACHE_DIR, "chunk_metadata")
+        self.vector_index_dir = os.path.join(CACHE_DIR, "chunk_ivf")
     
+    def _chunk_manifest_key(self) -> dict:
+        return {"model": self.encoder_id, "chunk_size": MAX_CHUNK_SIZE, "overlap": DEFAULT_SEMANTIC_CHUNK_OVERLAP}
+
+    def _load_chunk_metadata(self) -> dict[str, np.ndarray] | None:
+        #mapped, nothing is parsed, caches from before the arrays have no manifest and are rebuilt
+        if not os.path.exists(os.path.join(self.chunk_metadata_dir, CHUNK_METADATA_META)):
+            return None
+        return {name: load_array(os.path.join(self.chunk_metadata_dir, f"{name}.npy")) for name in CHUNK_METADATA_ARRAYS}
+
+    def _cached_chunks(self) -> tuple[np.ndarray | None, dict[int, np.ndarray], dict[int, int], list[int]]:
+        #old matrix, chunk rows by description hash, row by chunk hash, and the hash of every old chunk row
+        manifest = load_manifest(self.chunk_embeddings_path, self._chunk_manifest_key())
+        metadata = self._load_chunk_metadata() if manifest is not None else None
+        if metadata is None:
+            return None, {}, {}, []
+        old = load_cached_embeddings(self.chunk_embeddings_path, manifest)
+        movie_hashes = load_hashes(self.chunk_embeddings_path, manifest, "movies").tolist()
+        chunk_hashes = load_hashes(self.chunk_embeddings_path, manifest, "chunks").tolist()
+        if not len(old) == len(metadata["movie_idx"]) == len(chunk_hashes):
+            return None, {}, {}, []
+        order = np.argsort(metadata["movie_idx"], kind="stable")
+        movie_idx = metadata["movie_idx"][order]
+        starts = np.flatnonzero(np.diff(movie_idx, prepend=-1))
+        ends = np.append(starts[1:], len(order))
+        described = {}
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            described.setdefault(movie_hashes[int(movie_idx[start])], order[start:end])
+        cached = {chunk_hash: row for row, chunk_hash in enumerate(chunk_hashes)}
+        return old, described, cached, chunk_hashes
+
     def build_chunk_embeddings(self, documents):
+        #streamed in two passes so memory doesn't grow with chunk text or vectors: the first chunks and
+        #hashes every movie to size the matrix, unchanged descriptions reuse their cached chunk hashes,
+        #the second rechunks only changed movies and encodes their uncached chunks batch by batch
+        #straight into the mapped output
         self.documents = documents
-        self.document_map = {i: doc for i, doc in enumerate(documents)}
-        chunk_list = []
-        chunk_metadata = []
+        old, described, cached, old_chunk_hashes = self._cached_chunks()
+        movie_hashes = []
+        chunk_hashes = []
+        chunk_counts = []
+        rechunked = [] #(document row, first chunk row) of every changed movie
         for i, doc in enumerate(self.documents):
+            movie_hashes.append(content_hash(doc['description']))
             if doc['description'] == "":
+                chunk_counts.append(0)
                 continue
-            chunks = semantic_chunk(doc['description'], 4, 1)
-            chunk_list.extend(chunks)
-            for j, _ in enumerate(chunks):
-                chunk_metadata.append({
-                    "movie_idx": i,
-                    "chunk_idx": j,
-                    "total_chunks": len(chunks)
-                })
-        self.chunk_embeddings = self.model.encode(chunk_list, show_progress_bar=True)
-        self.chunk_metadata = chunk_metadata
-        os.makedirs(os.path.dirname(self.chunk_embeddings_path), exist_ok=True)
-        np.save(self.chunk_embeddings_path, self.chunk_embeddings)
-        with open(self.chunk_metadata_path, "w") as f:
-            json.dump({"chunks": chunk_metadata, "total_chunks": len(chunk_list)}, f, indent=2)
+            if movie_hashes[-1] in described:
+                hashes = [old_chunk_hashes[row] for row in described[movie_hashes[-1]].tolist()]
+            else:
+                rechunked.append((i, len(chunk_hashes)))
+                hashes = [content_hash(chunk) for chunk in semantic_chunk(doc['description'], MAX_CHUNK_SIZE, DEFAULT_SEMANTIC_CHUNK_OVERLAP)]
+            chunk_hashes.extend(hashes)
+            chunk_counts.append(len(hashes))
+
+        def changed_chunks():
+            for i, first in rechunked:
+                for j, chunk in enumerate(semantic_chunk(self.documents[i]['description'], MAX_CHUNK_SIZE, DEFAULT_SEMANTIC_CHUNK_OVERLAP)):
+                    yield first + j, chunk
+
+        self.encode_missing(changed_chunks(), chunk_hashes, old, cached, self.chunk_embeddings_path)
+        save_chunk_metadata(self.chunk_metadata_dir, chunk_metadata_arrays(chunk_counts))
+        manifest = {**self._chunk_manifest_key(), "documents_version": documents_version(documents)}
+        swap_in_embeddings(self.chunk_embeddings_path, manifest, {"movies": movie_hashes, "chunks": chunk_hashes})
+        self.chunk_embeddings = load_embeddings(self.chunk_embeddings_path)
+        self.chunk_metadata = self._load_chunk_metadata()
+        self._group_chunks()
+        self.chunk_codes = self.load_or_create_codes(self.chunk_embeddings_path, self.chunk_embeddings)
         return self.chunk_embeddings
     
     def load_or_create_chunk_embeddings(self, documents: list[dict]) -> np.ndarray:
         self.documents = documents
-        self.document_map = {i: doc for i, doc in enumerate(documents)}
-        if os.path.exists(self.chunk_embeddings_path) and os.path.exists(self.chunk_metadata_path):
-            self.chunk_embeddings = np.load(self.chunk_embeddings_path)
-            with open(self.chunk_metadata_path, 'r') as f:
-                self.chunk_metadata = json.load(f)
-            return self.chunk_embeddings
+        manifest = load_manifest(self.chunk_embeddings_path, self._chunk_manifest_key())
+        if (manifest is not None and manifest.get("normalized") and "hash_mtimes" in manifest
+                and same_documents(self.chunk_embeddings_path, manifest, "movies", documents, (doc['description'] for doc in documents))):
+            self.chunk_metadata = self._load_chunk_metadata()
+            chunk_count = len(load_hashes(self.chunk_embeddings_path, manifest, "chunks"))
+            if self.chunk_metadata is not None and len(self.chunk_metadata["movie_idx"]) == chunk_count:
+                self.chunk_embeddings = load_embeddings(self.chunk_embeddings_path)
+                self._group_chunks()
+                self.chunk_codes = self.load_or_create_codes(self.chunk_embeddings_path, self.chunk_embeddings)
+                return self.chunk_embeddings
         results = self.build_chunk_embeddings(documents)
         return results
     
-    def search_chunks(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
-        chunks_scores = []
-        movie_scores = {}
-        query_embedding = self.generate_embedding(query)
-        for i, chunk_embedding in enumerate(self.chunk_embeddings):
-            sim_score = cosine_similarity(query_embedding, chunk_embedding)
-            chunk_data = self.chunk_metadata["chunks"]
-            chunk_idx = chunk_data[i]["chunk_idx"]
-            movie_idx = chunk_data[i]["movie_idx"]
-
-            chunks_scores.append({
-                "chunk_idx": chunk_idx,
-                "movie_idx": movie_idx,
-                "score": sim_score,
-            })
-
-            if movie_idx not in movie_scores or sim_score > movie_scores[movie_idx]:
-                movie_scores[movie_idx] = sim_score 
- 
-        sorted_scores = sorted(movie_scores.items(), key=lambda x: x[1], reverse=True)[:limit]
-        
+    def _group_chunks(self):
+        #chunks are embedded movie by movie, older caches are put in that order in memory here
+        movie_idx = self.chunk_metadata["movie_idx"]
+        if np.any(np.diff(movie_idx) < 0):
+            order = np.argsort(movie_idx, kind="stable")
+            movie_idx = movie_idx[order]
+            self.chunk_embeddings = self.chunk_embeddings[order]
+            self.chunk_metadata = {name: array[order] for name, array in self.chunk_metadata.items()}
+        self.chunk_movies = movie_idx
+        self.movie_starts = np.flatnonzero(np.diff(movie_idx, prepend=-1))
+        self.movie_indices = movie_idx[self.movie_starts]
+        self.vector_index = None
+
+    def shared_arrays(self) -> tuple[dict[str, np.ndarray], dict]:
+        arrays, meta = super().shared_arrays()
+        arrays.update({
+            "chunk_embeddings": self.chunk_embeddings,
+            "chunk_movies": self.chunk_movies,
+            "movie_starts": self.movie_starts,
+            "movie_indices": self.movie_indices,
+        })
+        if self.chunk_codes is not None:
+            arrays.update({f"chunk_codes.{name}": array for name, array in self.chunk_codes.arrays.items()})
+            meta["chunk_codes"] = self.chunk_codes.meta
+        if self.vector_index is not None:
+            arrays.update({f"ivf.{name}": array for name, array in self.vector_index.arrays.items()})
+            meta["ivf"] = self.vector_index.meta
+        return arrays, meta
+
+    def attach_arrays(self, arrays: dict[str, np.ndarray], meta: dict):
+        super().attach_arrays(arrays, meta)
+        self.chunk_embeddings = arrays["chunk_embeddings"]
+        self.chunk_movies = arrays["chunk_movies"]
+        self.movie_starts = arrays["movie_starts"]
+        self.movie_indices = arrays["movie_indices"]
+        self.chunk_metadata = None
+        self.chunk_codes = None
+        if "chunk_codes" in meta:
+            self.chunk_codes = QuantizedVectors(meta["chunk_codes"]["kind"], prefixed_arrays(arrays, "chunk_codes"), meta["chunk_codes"])
+        self.vector_index = IVFIndex(prefixed_arrays(arrays, "ivf"), meta["ivf"]) if "ivf" in meta else None
+
+    def build_vector_index(self) -> IVFIndex:
+        self.vector_index = IVFIndex.build(self.chunk_embeddings)
+        self.vector_index.meta["source_mtime"] = os.path.getmtime(self.chunk_embeddings_path)
+        self.vector_index.save(self.vector_index_dir)
+        return self.vector_index
+
+    def load_or_create_vector_index(self) -> IVFIndex:
+        #rebuilt whenever chunk_embeddings.npy is rewritten
+        if self.vector_index is not None:
+            return self.vector_index
+        if os.path.exists(os.path.join(self.vector_index_dir, "ivf.json")):
+            index = IVFIndex.load(self.vector_index_dir)
+            if index.meta.get("source_mtime") == os.path.getmtime(self.chunk_embeddings_path) and index.meta["rows"] == len(self.chunk_embeddings):
+                self.vector_index = index
+                return index
+        return self.build_vector_index()
+
+    def _chunk_scores(self, query_embedding: np.ndarray, rows: np.ndarray | None = None) -> np.ndarray:
+        if self.chunk_codes is not None:
+            return self.chunk_codes.score(query_embedding, rows)
+        if rows is None:
+            return self.chunk_embeddings @ query_embedding
+        return self.chunk_embeddings[rows] @ query_embedding
+
+    def _movie_max(self, chunk_scores: np.ndarray, rows: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        #document rows and scores for every chunk or for ascending chunk rows, a movie scores as its best chunk
+        if rows is None:
+            return self.movie_indices, np.maximum.reduceat(chunk_scores, self.movie_starts)
+        if len(rows) == 0:
+            return rows, np.empty(0, dtype=np.float32)
+        chunk_movies = self.chunk_movies[rows]
+        starts = np.flatnonzero(np.diff(chunk_movies, prepend=-1))
+        return chunk_movies[starts], np.maximum.reduceat(chunk_scores, starts)
+
+    def score_movies(self, query_embedding: np.ndarray, nprobe: int | None = None, limit: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        #nprobe only scores chunks listed under the nprobe closest IVF centroids, limit lets
+        #quantized searches rescore their best limit * QUANTIZED_RESCORE_FACTOR movies
+        rows = None
+        if nprobe is not None:
+            rows = self.load_or_create_vector_index().candidates(query_embedding, nprobe)
+        movie_rows, movie_scores = self._movie_max(self._chunk_scores(query_embedding, rows), rows)
+        if self.chunk_codes is None or not self.rescore or limit is None:
+            return movie_rows, movie_scores
+        keep = np.sort(top_k_indices(movie_scores, limit * QUANTIZED_RESCORE_FACTOR))
+        chunk_movies = self.chunk_movies if rows is None else self.chunk_movies[rows]
+        selected = np.flatnonzero(np.isin(chunk_movies, movie_rows[keep]))
+        if rows is not None:
+            selected = rows[selected]
+        return self._movie_max(full_precision_scores(self.chunk_embeddings, selected, query_embedding), selected)
+
+    def search_chunks(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT, nprobe: int | None = None) -> list[dict]:
+        #nprobe None scans every chunk, otherwise the IVF index trades recall for latency
+        if len(self.chunk_embeddings) == 0:
+            return []
+        query_embedding = normalize_embeddings(self.generate_embedding(query))
+        movie_rows, movie_scores = self.score_movies(query_embedding, nprobe, limit)
+
+        return self._format_movies(movie_rows, movie_scores, top_k_indices(movie_scores, limit))
+
+    def _format_movies(self, movie_rows: np.ndarray, movie_scores: np.ndarray, indices: np.ndarray) -> list[dict]:
         results = []
-        for movie_idx, score in sorted_scores:
-            doc = self.document_map[movie_idx]
+        for i in indices.tolist():
+            score = float(movie_scores[i])
+            doc = self.documents[int(movie_rows[i])]
             results.append(format_embedded_search_result(
                 score,
                 doc["id"],
@@ -237,18 +590,224 @@ class ChunkedSemanticSearch(SemanticSearch):
             ))
         
         return results
+
+    def chunk_cursor(self, query: str, depth: int = DEFAULT_SEARCH_LIMIT, nprobe: int | None = None) -> ResultCursor:
+        #search_chunks(query, depth) read a rank at a time, a movie is only formatted when it's read
+        if len(self.chunk_embeddings) == 0:
+            return ResultCursor.empty()
+        query_embedding = normalize_embeddings(self.generate_embedding(query))
+        movie_rows, movie_scores = self.score_movies(query_embedding, nprobe, depth)
+        if isinstance(self.documents, DocumentStore):
+            keys = self.documents.ids[movie_rows]
+        else:
+            keys = np.array([self.documents[row]["id"] for row in movie_rows.tolist()], dtype=np.int64)
+        return ResultCursor(movie_scores, keys, depth, lambda indices: self._format_movies(movie_rows, movie_scores, indices))
     
-def embed_chunks_command():
-    movies = load_movies()
+def bench_chunks_command(sizes: tuple[int, ...] = SEMANTIC_BENCHMARK_SIZES, dimensions: int = 384, limit: int = DEFAULT_SEARCH_LIMIT, repeat: int = 5) -> list[dict]:
+    #search latency against chunk count on random unit vectors, the per-chunk python loop is only
+    #timed up to SEMANTIC_BENCHMARK_LOOP_LIMIT chunks
+    rng = np.random.default_rng(0)
+    report = []
+    for size in sizes:
+        chunk_embeddings = normalize_embeddings(rng.standard_normal((size, dimensions), dtype=np.float32))
+        movie_idx = np.sort(rng.integers(0, max(size // 3, 1), size))
+        movie_starts = np.flatnonzero(np.diff(movie_idx, prepend=-1))
+        query_embedding = normalize_embeddings(rng.standard_normal(dimensions, dtype=np.float32))
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            movie_scores = np.maximum.reduceat(chunk_embeddings @ query_embedding, movie_starts)
+            top_k_indices(movie_scores, limit)
+        vectorized_ms = (time.perf_counter() - start) / repeat * 1000
+
+        loop_ms = None
+        if size <= SEMANTIC_BENCHMARK_LOOP_LIMIT:
+            start = time.perf_counter()
+            movie_scores = {}
+            for i, chunk_embedding in enumerate(chunk_embeddings):
+                sim_score = cosine_similarity(query_embedding, chunk_embedding)
+                if movie_idx[i] not in movie_scores or sim_score > movie_scores[movie_idx[i]]:
+                    movie_scores[movie_idx[i]] = sim_score
+            sorted(movie_scores.items(), key=lambda x: x[1], reverse=True)[:limit]
+            loop_ms = (time.perf_counter() - start) * 1000
+        report.append({"chunks": size, "vectorized_ms": vectorized_ms, "loop_ms": loop_ms})
+    return report
+
+def top_movies(search: "ChunkedSemanticSearch", query_embedding: np.ndarray, limit: int, nprobe: int | None = None) -> list[int]:
+    #document rows of the best movies, for reports and workers that skip result formatting
+    movie_rows, movie_scores = search.score_movies(query_embedding, nprobe, limit)
+    return movie_rows[top_k_indices(movie_scores, limit)].tolist()
+
+def ann_report_command(limit: int = DEFAULT_SEARCH_LIMIT, nprobes: tuple[int, ...] = IVF_REPORT_NPROBES) -> list[dict]:
+    #recall@limit of IVF movie results against the exact scan, over the golden dataset queries
     search = ChunkedSemanticSearch()
-    embeddings = search.load_or_create_chunk_embeddings(movies)
-    print(f"Generated {len(embeddings)} chunked embeddings")
+    search.load_or_create_chunk_embeddings(load_documents())
+    index = search.load_or_create_vector_index()
+    queries = [normalize_embeddings(search.generate_embedding(case["query"])) for case in load_golden_dataset()["test_cases"]]
+
+    def run(nprobe):
+        found, elapsed = [], 0.0
+        for query_embedding in queries:
+            start = time.perf_counter()
+            top = top_movies(search, query_embedding, limit, nprobe)
+            elapsed += time.perf_counter() - start
+            found.append(set(top))
+        return found, elapsed / max(len(queries), 1) * 1000
+
+    exact, exact_ms = run(None)
+    report = [{"nprobe": None, "lists": index.meta["lists"], "recall": 1.0, "ms": exact_ms}]
+    for nprobe in nprobes:
+        found, ms = run(nprobe)
+        report.append({"nprobe": nprobe, "lists": index.meta["lists"], "recall": recall(found, exact), "ms": ms})
+    return report
 
-def search_chunked(query: str, limit: int = DEFAULT_SEARCH_LIMIT):
-    movies = load_movies()
+def recall(found: list[set], exact: list[set]) -> float:
+    hits = sum(len(a & e) for a, e in zip(found, exact))
+    return hits / max(sum(len(e) for e in exact), 1)
+
+def quantization_report_command(limit: int = DEFAULT_SEARCH_LIMIT, quantizations: tuple[str, ...] = EMBEDDING_QUANTIZATIONS) -> list[dict]:
+    #chunk code size and recall@limit against float32, with and without rescoring, over the golden dataset queries
+    documents = load_documents()
+    search = ChunkedSemanticSearch()
+    search.load_or_create_chunk_embeddings(documents)
+    queries = [normalize_embeddings(search.generate_embedding(case["query"])) for case in load_golden_dataset()["test_cases"]]
+
+    def run(search):
+        found = []
+        for query_embedding in queries:
+            found.append(set(top_movies(search, query_embedding, limit)))
+        return found
+
+    exact = run(search)
+    report = [{"quantization": "float32", "bytes": search.chunk_embeddings.nbytes, "recall": 1.0, "rescored_recall": 1.0}]
+    for quantization in quantizations:
+        #same model, the matrices are reloaded for each mode
+        search.quantization, search.rescore = quantization, False
+        search.load_or_create_chunk_embeddings(documents)
+        approximate = recall(run(search), exact)
+        search.rescore = True
+        report.append({"quantization": quantization, "bytes": search.chunk_codes.nbytes, "recall": approximate, "rescored_recall": recall(run(search), exact)})
+    return report
+
+_worker_search = None
+_worker_shared = None
+
+def _attach_search_worker(descriptor: dict):
+    #pool initializer, every worker maps the published block instead of loading its own copy
+    global _worker_search, _worker_shared
+    _worker_search = ChunkedSemanticSearch()
+    _worker_shared = _worker_search.attach(descriptor, load_documents())
+
+def _search_worker_query(query_embedding: np.ndarray, limit: int) -> list[int]:
+    return top_movies(_worker_search, query_embedding, limit)
+
+def load_report_command(workers: int = DEFAULT_SEARCH_WORKERS, limit: int = DEFAULT_SEARCH_LIMIT, queries: int = 32) -> dict:
+    #cold start of a private np.load copy against the mapped load, then a worker pool searching one published copy
+    documents = load_documents()
     search = ChunkedSemanticSearch()
+    search.load_or_create_chunk_embeddings(documents)
+
+    start = time.perf_counter()
+    np.load(search.chunk_embeddings_path)
+    copy_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    ChunkedSemanticSearch().load_or_create_chunk_embeddings(documents)
+    mapped_ms = (time.perf_counter() - start) * 1000
+
+    #random unit queries, the pool is measured without loading the model
+    rng = np.random.default_rng(0)
+    query_embeddings = normalize_embeddings(rng.standard_normal((queries, search.chunk_embeddings.shape[1]), dtype=np.float32))
+    expected = [top_movies(search, query_embedding, limit) for query_embedding in query_embeddings]
+    with search.publish() as shared:
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach_search_worker, initargs=(shared.descriptor,)) as pool:
+            found = list(pool.map(_search_worker_query, query_embeddings, [limit] * queries))
+        pool_ms = (time.perf_counter() - start) * 1000
+    return {
+        "chunks": len(search.chunk_embeddings),
+        "copy_load_ms": copy_ms,
+        "mapped_load_ms": mapped_ms,
+        "shared_bytes": shared.nbytes,
+        "workers": workers,
+        "pool_ms": pool_ms,
+        "matches": found == expected,
+    }
+
+def encoder_parity_command(backend: str, limit: int = DEFAULT_SEARCH_LIMIT, documents: int = ENCODER_PARITY_DOCUMENTS) -> dict:
+    #cosine agreement of backend vectors with torch vectors, and recall@limit of both over the golden dataset
+    #on the first documents movies plus every relevant one, so the relevant titles can be found
+    movies = load_documents()
+    test_cases = load_golden_dataset()["test_cases"]
+    relevant = {title for case in test_cases for title in case["relevant_docs"]}
+    rows = [row for row in range(len(movies)) if row < documents or movies[row]["title"] in relevant]
+    texts = [f"{movies[row]['title']}: {movies[row]['description']}" for row in rows]
+    queries = [case["query"] for case in test_cases]
+
+    def encode(model_backend):
+        model = load_encoder(SemanticSearch().model_name, model_backend)
+        return normalize_embeddings(model.encode(texts)), normalize_embeddings(model.encode(queries))
+
+    reference_docs, reference_queries = encode("torch")
+    backend_docs, backend_queries = encode(backend)
+    cosines = np.concatenate((np.sum(reference_docs * backend_docs, axis=1), np.sum(reference_queries * backend_queries, axis=1)))
+
+    def golden_recall(doc_embeddings, query_embeddings):
+        found, hits = [], 0
+        for case, query_embedding in zip(test_cases, query_embeddings):
+            top = top_k_indices(doc_embeddings @ query_embedding, limit)
+            titles = {movies[rows[i]]["title"] for i in top.tolist()}
+            hits += len(titles & set(case["relevant_docs"]))
+            found.append(set(top.tolist()))
+        return found, hits / max(sum(len(case["relevant_docs"]) for case in test_cases), 1)
+
+    reference_found, reference_recall = golden_recall(reference_docs, reference_queries)
+    backend_found, backend_recall = golden_recall(backend_docs, backend_queries)
+    return {
+        "backend": backend,
+        "texts": len(cosines),
+        "mean_cosine": float(np.mean(cosines)),
+        "min_cosine": float(np.min(cosines)),
+        "torch_recall": reference_recall,
+        "backend_recall": backend_recall,
+        "top_k_agreement": recall(backend_found, reference_found),
+    }
+
+def encoder_bench_command(backends: tuple[str, ...] = ENCODER_BACKENDS, documents: int = ENCODER_PARITY_DOCUMENTS, queries: int = 100) -> list[dict]:
+    #bulk documents per second and single query latency of every backend
+    movies = load_documents()
+    texts = [f"{movies[row]['title']}: {movies[row]['description']}" for row in range(min(documents, len(movies)))]
+    query_texts = [case["query"] for case in load_golden_dataset()["test_cases"]]
+    query_texts = [query_texts[i % len(query_texts)] for i in range(queries)]
+    report = []
+    for backend in backends:
+        model = load_encoder(SemanticSearch().model_name, backend)
+        model.encode(query_texts[:1])
+        start = time.perf_counter()
+        model.encode(texts, show_progress_bar=False)
+        bulk_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        for text in query_texts:
+            model.encode([text])
+        query_ms = (time.perf_counter() - start) / len(query_texts) * 1000
+        report.append({"backend": backend, "documents_per_second": len(texts) / bulk_seconds, "query_ms": query_ms})
+    return report
+
+def embed_chunks_command(quantization: str | None = None, workers: int = DEFAULT_ENCODE_WORKERS):
+    movies = load_documents()
+    search = ChunkedSemanticSearch(quantization=quantization)
+    search.encode_workers = workers
+    embeddings = search.load_or_create_chunk_embeddings(movies)
+    index = search.load_or_create_vector_index()
+    print(f"Generated {len(embeddings)} chunked embeddings, encoded {search.encoded}")
+    print(f"IVF index: {index.meta['lists']} lists")
+    if search.chunk_codes is not None:
+        print(f"{quantization} codes: {search.chunk_codes.nbytes / 2**20:.1f} MiB, float32: {embeddings.nbytes / 2**20:.1f} MiB")
+
+def search_chunked(query: str, limit: int = DEFAULT_SEARCH_LIMIT, nprobe: int | None = None, quantization: str | None = None, rescore: bool = True):
+    movies = load_documents()
+    search = ChunkedSemanticSearch(quantization=quantization, rescore=rescore)
     search.load_or_create_chunk_embeddings(movies)
-    results = search.search_chunks(query, limit)
+    results = search.search_chunks(query, limit, nprobe)
     for i, result in enumerate(results):
         print(f"\n{i + 1}. {result["title"]} (score: {result["score"]:.4f})")
         print(f"   {result["description"]}...")
\ No newline at end of file
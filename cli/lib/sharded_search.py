@@ -0,0 +1,170 @@
+import os
+import json
+import shutil
+import heapq
+from multiprocessing import Pipe, Process
+import numpy as np
+
+from .keyword_search import InvertedIndex, parse_query, closest_terms, weigh_query
+from .search_utils import (
+    CACHE_DIR,
+    DEFAULT_SEARCH_LIMIT,
+    DEFAULT_SHARDS,
+    TYPO_MIN_LENGTH,
+    load_movies,
+    format_search_result,
+)
+
+SHARDS_MANIFEST = "shards.json"
+
+
+def _serve_shard(index_dir: str, connection):
+    #one worker per shard, answers ("stats", tokens) and ("search", ...) until it gets None
+    idx = InvertedIndex(index_dir)
+    idx.load()
+    local_doc_count, local_total_length = idx.doc_count, idx.total_length
+    local_field_totals = idx.field_totals if idx.fields is not None else None
+    field_stats = None #global (N, field totals) the cached BM25F field weights were computed for
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        kind, payload = message
+        match kind:
+            case "stats":
+                #local df of every query token, plus typo candidates and their df for tokens unknown here
+                doc_frequencies, candidates = {}, {}
+                for token in payload:
+                    doc_frequencies[token] = idx._doc_frequency(token)
+                    if doc_frequencies[token] == 0 and len(token) >= TYPO_MIN_LENGTH:
+                        candidates[token] = {term: idx._doc_frequency(term) for term in idx.typo_candidates(token)}
+                connection.send({
+                    "doc_count": local_doc_count,
+                    "total_length": local_total_length,
+                    "field_totals": local_field_totals,
+                    "doc_frequencies": doc_frequencies,
+                    "candidates": candidates,
+                })
+            case "search":
+                weights, constraints, limit, fields, stats = payload
+                #score with the collection wide N, avgdl and df so shard scores equal single index scores
+                idx.doc_count, idx.total_length, idx.avg_doc_length = stats["doc_count"], stats["total_length"], None
+                idx.global_doc_frequencies = stats["doc_frequencies"]
+                if fields and field_stats != (stats["doc_count"], stats["field_totals"].tolist()):
+                    #weights only depend on the global field averages, recomputed when they change
+                    field_stats = (stats["doc_count"], stats["field_totals"].tolist())
+                    idx.field_totals, idx._field_weights = stats["field_totals"], None
+                doc_ids, scores = idx._score_terms(weights, fields=fields)
+                if constraints:
+                    allowed = idx._match_constraints(constraints)
+                    if allowed is not None:
+                        keep = np.isin(doc_ids, allowed)
+                        doc_ids, scores = doc_ids[keep], scores[keep]
+                top = idx._top_k(doc_ids, scores, limit)
+                connection.send([(doc_id, score, idx.document(doc_id)) for doc_id, score in top])
+    connection.close()
+
+
+class ShardedIndex:
+    #N InvertedIndex shards split by doc id, each served by its own process and queried scatter-gather
+    def __init__(self):
+        self.shards_dir = os.path.join(CACHE_DIR, "shards")
+        self.shard_count = 0
+        self.processes: list[Process] = []
+        self.connections = []
+
+    def shard_dir(self, shard: int) -> str:
+        return os.path.join(self.shards_dir, f"shard_{shard:03d}")
+
+    def build(self, shard_count: int = DEFAULT_SHARDS, **build_options):
+        #build_options go to InvertedIndex.build (impacts, compress, workers, positions, fields, ...)
+        movies = load_movies()
+        shutil.rmtree(self.shards_dir, ignore_errors=True)
+        for shard in range(shard_count):
+            idx = InvertedIndex(self.shard_dir(shard))
+            idx.build(movies=[movie for movie in movies if movie["id"] % shard_count == shard], **build_options)
+            idx.save()
+        with open(os.path.join(self.shards_dir, SHARDS_MANIFEST), "w") as f:
+            json.dump({"shards": shard_count}, f)
+        self.shard_count = shard_count
+
+    def start(self):
+        with open(os.path.join(self.shards_dir, SHARDS_MANIFEST), "r") as f:
+            self.shard_count = json.load(f)["shards"]
+        for shard in range(self.shard_count):
+            connection, worker_connection = Pipe()
+            process = Process(target=_serve_shard, args=(self.shard_dir(shard), worker_connection), daemon=True)
+            process.start()
+            self.processes.append(process)
+            self.connections.append(connection)
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(None)
+        for process in self.processes:
+            process.join()
+        self.processes, self.connections = [], []
+
+    def __enter__(self) -> "ShardedIndex":
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _broadcast(self, message) -> list:
+        #every shard works on the message before any reply is read
+        for connection in self.connections:
+            connection.send(message)
+        return [connection.recv() for connection in self.connections]
+
+    def _collection_stats(self, tokens: list[str], typo_tolerance: bool) -> tuple[dict, dict[str, float]]:
+        replies = self._broadcast(("stats", sorted(set(tokens))))
+        doc_frequencies, candidates = {}, {}
+        for reply in replies:
+            for token, doc_frequency in reply["doc_frequencies"].items():
+                doc_frequencies[token] = doc_frequencies.get(token, 0) + doc_frequency
+            for token, terms in reply["candidates"].items():
+                token_candidates = candidates.setdefault(token, {})
+                for term, doc_frequency in terms.items():
+                    token_candidates[term] = token_candidates.get(term, 0) + doc_frequency
+        #a shard only reports candidates from its own vocabulary, so the sums are global dfs
+        candidate_frequencies = {term: df for terms in candidates.values() for term, df in terms.items()}
+        doc_frequency = lambda term: doc_frequencies.get(term, candidate_frequencies.get(term, 0))
+        expand = lambda token: closest_terms(token, set(candidates.get(token, ())), doc_frequency)
+        weights = weigh_query(tokens, doc_frequency, expand if typo_tolerance else None)
+        field_totals = None
+        if all(reply["field_totals"] is not None for reply in replies):
+            field_totals = sum(reply["field_totals"] for reply in replies)
+        stats = {
+            "doc_count": sum(reply["doc_count"] for reply in replies),
+            "total_length": sum(reply["total_length"] for reply in replies),
+            "field_totals": field_totals,
+            "doc_frequencies": {term: doc_frequency(term) for term in weights},
+        }
+        return stats, weights
+
+    def bm25_search(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT, typo_tolerance: bool = True, fields: bool = False) -> list[dict]:
+        tokens, constraints = parse_query(query)
+        stats, weights = self._collection_stats(tokens, typo_tolerance)
+        if fields and stats["field_totals"] is None:
+            raise ValueError("Shards have no field statistics, rebuild them with --fields.")
+        replies = self._broadcast(("search", (dict(weights), constraints, limit, fields, stats)))
+        #each shard's list is sorted by (-score, doc id), so a k-way merge gives the global order
+        merged = heapq.merge(*replies, key=lambda entry: (-entry[1], entry[0]))
+        results = []
+        for doc_id, score, doc in merged:
+            if len(results) == limit:
+                break
+            results.append(format_search_result(doc_id=doc_id, title=doc["title"], desription=doc["description"], score=score))
+        return results
+
+
+def build_shards_command(shard_count: int = DEFAULT_SHARDS, workers: int = 1, positions: bool = False, fields: bool = False) -> int:
+    ShardedIndex().build(shard_count, workers=workers, positions=positions, fields=fields)
+    return shard_count
+
+
+def sharded_search_command(query: str, limit: int = DEFAULT_SEARCH_LIMIT, typo_tolerance: bool = True, fields: bool = False) -> list[dict]:
+    with ShardedIndex() as sharded:
+        return sharded.bm25_search(query, limit, typo_tolerance, fields)
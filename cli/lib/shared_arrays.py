@@ -0,0 +1,62 @@
+from multiprocessing import shared_memory
+import numpy as np
+
+SHARED_ALIGNMENT = 64 #byte alignment of every array in the block
+
+
+def open_shared_memory(name: str) -> shared_memory.SharedMemory:
+    #attaching must not register the block for cleanup, the publisher owns it
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedArrays:
+    #numpy arrays packed into one shared memory block, published once and attached read only by workers
+    def __init__(self, memory: shared_memory.SharedMemory, descriptor: dict, owner: bool):
+        self.memory = memory
+        self.descriptor = descriptor
+        self.meta = descriptor["meta"]
+        self.owner = owner
+        self.arrays = {}
+        for name, (offset, shape, dtype) in descriptor["layout"].items():
+            array = np.ndarray(tuple(shape), dtype=np.dtype(dtype), buffer=memory.buf, offset=offset)
+            array.flags.writeable = owner
+            self.arrays[name] = array
+
+    @classmethod
+    def publish(cls, arrays: dict[str, np.ndarray], meta: dict | None = None) -> "SharedArrays":
+        layout, size = {}, 0
+        for name, array in arrays.items():
+            size = -(-size // SHARED_ALIGNMENT) * SHARED_ALIGNMENT
+            layout[name] = (size, list(array.shape), np.asarray(array).dtype.str)
+            size += array.nbytes
+        memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        shared = cls(memory, {"name": memory.name, "layout": layout, "meta": meta or {}}, owner=True)
+        for name, array in arrays.items():
+            shared.arrays[name][...] = array
+            shared.arrays[name].flags.writeable = False
+        return shared
+
+    @classmethod
+    def attach(cls, descriptor: dict) -> "SharedArrays":
+        #descriptor is the picklable dict of the published block
+        return cls(open_shared_memory(descriptor["name"]), descriptor, owner=False)
+
+    @property
+    def nbytes(self) -> int:
+        return self.memory.size
+
+    def close(self):
+        #views must be dropped before the mapping goes, the publisher also frees the block
+        self.arrays = {}
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+    def __enter__(self) -> "SharedArrays":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
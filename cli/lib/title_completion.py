@@ -0,0 +1,171 @@
+import os
+import json
+import shutil
+import numpy as np
+
+from .index_segment import load_array, string_at, string_table, find_string, lower_bound, swap_directory
+from .search_utils import (
+    CACHE_DIR,
+    DEFAULT_SEARCH_LIMIT,
+    SUGGEST_PREFIX_LENGTH,
+    SUGGEST_TOP_K,
+    process_text,
+)
+
+TITLES_META = "titles.json"
+#every array is row aligned with doc_ids unless noted
+#  titles / title_offsets: string table of the original titles
+#  popularity: optional "popularity" field of the movie, 0 when missing
+#  ranks: position of the row in suggestion order, by_rank is the inverse
+#  keys / key_offsets: sorted string table of normalized title suffixes, key_rows maps them back
+#  prefixes / prefix_offsets: sorted string table of every key prefix up to SUGGEST_PREFIX_LENGTH bytes
+#  prefix_top: best SUGGEST_TOP_K rows per prefix, padded with -1
+TITLE_ARRAYS = (
+    "doc_ids",
+    "titles",
+    "title_offsets",
+    "popularity",
+    "ranks",
+    "by_rank",
+    "keys",
+    "key_offsets",
+    "key_rows",
+    "prefixes",
+    "prefix_offsets",
+    "prefix_top",
+)
+
+
+def title_keys(title: str) -> list[str]:
+    #the whole title and every word suffix, so "knig" also finds "The Dark Knight"
+    words = process_text(title).split()
+    return [" ".join(words[i:]) for i in range(len(words))]
+
+
+def normalize_prefix(prefix: str) -> str:
+    #a trailing space is kept so "dark " only completes the next word
+    text = process_text(prefix)
+    words = text.split()
+    if words and text[-1].isspace():
+        return " ".join(words) + " "
+    return " ".join(words)
+
+
+class TitleCompleter:
+    def __init__(self, arrays: dict[str, np.ndarray], meta: dict):
+        self.arrays = arrays
+        self.meta = meta
+        self.doc_ids = arrays["doc_ids"]
+        self.ranks = arrays["ranks"]
+        self.by_rank = arrays["by_rank"]
+        self.key_rows = arrays["key_rows"]
+        self.directory = os.path.join(CACHE_DIR, "titles")
+
+    @classmethod
+    def from_movies(cls, movies: list[dict], prefix_length: int = SUGGEST_PREFIX_LENGTH, top_k: int = SUGGEST_TOP_K) -> "TitleCompleter":
+        doc_ids = [movie["id"] for movie in movies]
+        titles = [movie["title"] for movie in movies]
+        popularity = [float(movie.get("popularity", 0.0)) for movie in movies]
+        return cls.from_titles(doc_ids, titles, popularity, prefix_length, top_k)
+
+    @classmethod
+    def from_titles(cls, doc_ids: list[int], titles: list[str], popularity: list[float], prefix_length: int = SUGGEST_PREFIX_LENGTH, top_k: int = SUGGEST_TOP_K) -> "TitleCompleter":
+        arrays = {}
+        arrays["doc_ids"] = np.array(doc_ids, dtype=np.int64)
+        arrays["titles"], arrays["title_offsets"] = string_table([title.encode() for title in titles])
+        arrays["popularity"] = np.array(popularity, dtype=np.float64)
+        #most popular first, then the shortest title, then the lowest doc id
+        by_rank = np.lexsort((arrays["doc_ids"], np.diff(arrays["title_offsets"]), -arrays["popularity"]))
+        arrays["by_rank"] = by_rank.astype(np.int32)
+        arrays["ranks"] = np.empty(len(by_rank), dtype=np.int32)
+        arrays["ranks"][by_rank] = np.arange(len(by_rank), dtype=np.int32)
+
+        entries = sorted((key.encode(), row) for row, title in enumerate(titles) for key in title_keys(title))
+        keys = [key for key, _ in entries]
+        arrays["keys"], arrays["key_offsets"] = string_table(keys)
+        arrays["key_rows"] = np.array([row for _, row in entries], dtype=np.int32)
+        completer = cls(arrays, {"prefix_length": prefix_length, "top_k": top_k})
+
+        #keys are sorted, so every prefix covers one contiguous run of them
+        prefixes, starts = [], []
+        for length in range(1, prefix_length + 1):
+            previous = None
+            for i, key in enumerate(keys):
+                if len(key) >= length and key[:length] != previous:
+                    previous = key[:length]
+                    prefixes.append(previous)
+                    starts.append(i)
+        order = sorted(range(len(prefixes)), key=prefixes.__getitem__)
+        prefix_top = np.full((len(prefixes), top_k), -1, dtype=np.int32)
+        for slot, i in enumerate(order):
+            end = completer._key_range(prefixes[i])[1]
+            rows = completer._top_rows(starts[i], end, top_k)
+            prefix_top[slot, :len(rows)] = rows
+        arrays["prefixes"], arrays["prefix_offsets"] = string_table([prefixes[i] for i in order])
+        arrays["prefix_top"] = prefix_top
+        return completer
+
+    @classmethod
+    def load(cls) -> "TitleCompleter":
+        directory = os.path.join(CACHE_DIR, "titles")
+        with open(os.path.join(directory, TITLES_META), "r") as f:
+            meta = json.load(f)
+        arrays = {name: load_array(os.path.join(directory, f"{name}.npy")) for name in TITLE_ARRAYS}
+        return cls(arrays, meta)
+
+    def save(self):
+        #written next to the live copy and swapped in, readers never map a half written set
+        staging = f"{self.directory}.tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        for name in TITLE_ARRAYS:
+            np.save(os.path.join(staging, f"{name}.npy"), np.ascontiguousarray(self.arrays[name]))
+        with open(os.path.join(staging, TITLES_META), "w") as f:
+            json.dump(self.meta, f)
+        swap_directory(staging, self.directory)
+
+    def title(self, row: int) -> str:
+        return string_at(self.arrays["titles"], self.arrays["title_offsets"], row).decode()
+
+    def updated(self, movies: list[dict] = (), deleted: list[int] = ()) -> "TitleCompleter":
+        #rebuilt from its own columns, so upserts and deletes never need the docmap
+        replaced = {movie["id"] for movie in movies} | set(deleted)
+        doc_ids, titles, popularity = [], [], []
+        for row, doc_id in enumerate(self.doc_ids.tolist()):
+            if doc_id not in replaced:
+                doc_ids.append(doc_id)
+                titles.append(self.title(row))
+                popularity.append(float(self.arrays["popularity"][row]))
+        for movie in movies:
+            doc_ids.append(movie["id"])
+            titles.append(movie["title"])
+            popularity.append(float(movie.get("popularity", 0.0)))
+        return TitleCompleter.from_titles(doc_ids, titles, popularity, self.meta["prefix_length"], self.meta["top_k"])
+
+    def _key_range(self, prefix: bytes) -> tuple[int, int]:
+        #utf-8 never contains 0xff, so it sorts after every key sharing the prefix
+        keys, key_offsets = self.arrays["keys"], self.arrays["key_offsets"]
+        return lower_bound(keys, key_offsets, prefix), lower_bound(keys, key_offsets, prefix + b"\xff")
+
+    def _top_rows(self, start: int, end: int, limit: int) -> np.ndarray:
+        #ranks are unique per row, so np.unique both dedupes suffixes of one title and sorts
+        ranks = np.unique(self.ranks[self.key_rows[start:end]])
+        return self.by_rank[ranks[:limit]]
+
+    def suggest(self, prefix: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
+        encoded = normalize_prefix(prefix).encode()
+        if not encoded or limit <= 0:
+            return []
+        if len(encoded) <= self.meta["prefix_length"] and limit <= self.meta["top_k"]:
+            slot = find_string(self.arrays["prefixes"], self.arrays["prefix_offsets"], encoded)
+            if slot is None:
+                return []
+            rows = self.arrays["prefix_top"][slot, :limit]
+            rows = rows[rows >= 0]
+        else:
+            rows = self._top_rows(*self._key_range(encoded), limit)
+        return [{"id": int(self.doc_ids[row]), "title": self.title(row)} for row in rows.tolist()]
+
+
+def suggest_command(prefix: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
+    return TitleCompleter.load().suggest(prefix, limit)
@@ -0,0 +1,228 @@
+import os
+import json
+import shutil
+import numpy as np
+
+from .index_segment import load_array, swap_directory
+from .search_utils import (
+    IVF_KMEANS_ITERATIONS,
+    IVF_TRAIN_PER_LIST,
+    IVF_ASSIGN_BLOCK,
+    PQ_SUBVECTORS,
+    PQ_CENTROIDS,
+    PQ_TRAIN_SIZE,
+    QUANTIZED_SCORE_BLOCK,
+)
+
+IVF_META = "ivf.json"
+#  centroids: unit length k-means centroid of every list
+#  list_offsets: rows of list l are list_rows[list_offsets[l]:list_offsets[l + 1]], ascending
+IVF_ARRAYS = ("centroids", "list_offsets", "list_rows")
+
+QUANTIZED_META = "quantized.json"
+#  float16: codes, the vectors as float16
+#  int8: codes, scale, offset, vector ~ offset + scale * codes per dimension
+#  pq: codes (rows x subvectors, uint8), codebooks (subvectors x centroids x subvector dims)
+QUANTIZED_ARRAYS = {
+    "float16": ("codes",),
+    "int8": ("codes", "scale", "offset"),
+    "pq": ("codes", "codebooks"),
+}
+
+
+def normalize_embeddings(embeddings: np.ndarray) -> np.ndarray:
+    #unit length rows turn cosine similarity into a dot product, all zero rows stay zero
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    return embeddings / np.where(norms == 0, 1, norms)
+
+
+def nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    #argmin |x - c|^2 is argmax x.c - |c|^2 / 2, in blocks so the score matrix stays small
+    bias = 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), IVF_ASSIGN_BLOCK):
+        block = vectors[start:start + IVF_ASSIGN_BLOCK] @ centroids.T - bias
+        assignment[start:start + IVF_ASSIGN_BLOCK] = np.argmax(block, axis=1)
+    return assignment
+
+
+def kmeans(vectors: np.ndarray, k: int, max_train: int, iterations: int = IVF_KMEANS_ITERATIONS, seed: int = 0, spherical: bool = False) -> np.ndarray:
+    #spherical renormalizes the centroids, so nearest also means highest dot product
+    rng = np.random.default_rng(seed)
+    train = vectors
+    if len(vectors) > max_train:
+        train = vectors[np.sort(rng.choice(len(vectors), max_train, replace=False))]
+    train = np.asarray(train, dtype=np.float32)
+    centroids = train[rng.choice(len(train), k, replace=False)]
+    for _ in range(iterations):
+        assignment = nearest_centroids(train, centroids)
+        order = np.argsort(assignment, kind="stable")
+        counts = np.bincount(assignment, minlength=k)
+        used = np.flatnonzero(counts)
+        sums = np.zeros_like(centroids)
+        sums[used] = np.add.reduceat(train[order], np.concatenate(([0], np.cumsum(counts[used])[:-1])))
+        #an empty cluster restarts from a random training vector
+        empty = np.flatnonzero(counts == 0)
+        centroids = np.empty_like(centroids)
+        centroids[used] = sums[used] / counts[used, None]
+        centroids[empty] = train[rng.choice(len(train), len(empty), replace=False)]
+        if spherical:
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            centroids = centroids / np.where(norms == 0, 1, norms)
+    return centroids
+
+
+def save_arrays(directory: str, arrays: dict[str, np.ndarray], meta: dict, meta_name: str):
+    #staged and swapped in like the other caches, a reader never maps a half written set
+    staging = f"{directory}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    for name, array in arrays.items():
+        np.save(os.path.join(staging, f"{name}.npy"), np.ascontiguousarray(array))
+    with open(os.path.join(staging, meta_name), "w") as f:
+        json.dump(meta, f)
+    swap_directory(staging, directory)
+
+
+class IVFIndex:
+    #inverted file over unit vectors, a query only scores the rows listed under its nprobe nearest centroids
+    def __init__(self, arrays: dict[str, np.ndarray], meta: dict):
+        self.arrays = arrays
+        self.meta = meta
+        self.centroids = arrays["centroids"]
+        self.list_offsets = arrays["list_offsets"]
+        self.list_rows = arrays["list_rows"]
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, n_lists: int | None = None, seed: int = 0) -> "IVFIndex":
+        #sqrt(rows) lists keeps probing one list about as cheap as ranking the centroids
+        if n_lists is None:
+            n_lists = int(round(np.sqrt(len(vectors))))
+        n_lists = max(min(n_lists, len(vectors)), 0)
+        arrays = {}
+        if n_lists == 0:
+            arrays["centroids"] = np.zeros((0, vectors.shape[1] if vectors.ndim == 2 else 0), dtype=np.float32)
+            assignment = np.zeros(0, dtype=np.int32)
+        else:
+            arrays["centroids"] = kmeans(vectors, n_lists, IVF_TRAIN_PER_LIST * n_lists, seed=seed, spherical=True)
+            assignment = nearest_centroids(vectors, arrays["centroids"])
+        #a stable sort keeps the rows of every list ascending
+        arrays["list_rows"] = np.argsort(assignment, kind="stable").astype(np.int64)
+        arrays["list_offsets"] = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=n_lists)))).astype(np.int64)
+        return cls(arrays, {"lists": n_lists, "rows": len(vectors)})
+
+    @classmethod
+    def load(cls, directory: str) -> "IVFIndex":
+        with open(os.path.join(directory, IVF_META), "r") as f:
+            meta = json.load(f)
+        return cls({name: load_array(os.path.join(directory, f"{name}.npy")) for name in IVF_ARRAYS}, meta)
+
+    def save(self, directory: str):
+        save_arrays(directory, {name: self.arrays[name] for name in IVF_ARRAYS}, self.meta, IVF_META)
+
+    def probe(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        #highest centroid scores first, lower list first on ties
+        scores = self.centroids @ query
+        nprobe = min(nprobe, len(scores))
+        if nprobe <= 0:
+            return np.empty(0, dtype=np.int64)
+        lists = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        return lists[np.lexsort((lists, -scores[lists]))]
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        #ascending rows of the probed lists, so callers can group them like the full matrix
+        lists = self.probe(query, nprobe)
+        if len(lists) == 0:
+            return np.empty(0, dtype=np.int64)
+        rows = np.concatenate([self.list_rows[self.list_offsets[l]:self.list_offsets[l + 1]] for l in lists.tolist()])
+        return np.sort(rows)
+
+
+class QuantizedVectors:
+    #compressed copy of an embedding matrix, scored asymmetrically: the query stays float32
+    def __init__(self, kind: str, arrays: dict[str, np.ndarray], meta: dict):
+        self.kind = kind
+        self.arrays = arrays
+        self.meta = meta
+        self.codes = arrays["codes"]
+
+    @classmethod
+    def from_vectors(cls, vectors: np.ndarray, kind: str, seed: int = 0) -> "QuantizedVectors":
+        vectors = np.asarray(vectors, dtype=np.float32)
+        arrays = {}
+        match kind:
+            case "float16":
+                arrays["codes"] = vectors.astype(np.float16)
+            case "int8":
+                #per dimension affine range, so narrow dimensions keep all 256 levels
+                low = vectors.min(axis=0) if len(vectors) else np.zeros(vectors.shape[1], dtype=np.float32)
+                high = vectors.max(axis=0) if len(vectors) else low
+                arrays["scale"] = np.where(high > low, (high - low) / 255, 1).astype(np.float32)
+                arrays["offset"] = ((high + low) / 2).astype(np.float32)
+                codes = np.rint((vectors - arrays["offset"]) / arrays["scale"])
+                arrays["codes"] = np.clip(codes, -128, 127).astype(np.int8)
+            case "pq":
+                subvectors = pq_subvectors(vectors.shape[1])
+                parts = vectors.reshape(len(vectors), subvectors, -1)
+                centroids = max(min(PQ_CENTROIDS, len(vectors)), 1)
+                codebooks = np.zeros((subvectors, centroids, parts.shape[2]), dtype=np.float32)
+                codes = np.zeros((len(vectors), subvectors), dtype=np.uint8)
+                if len(vectors):
+                    for m in range(subvectors):
+                        codebooks[m] = kmeans(parts[:, m], centroids, PQ_TRAIN_SIZE, seed=seed + m)
+                        codes[:, m] = nearest_centroids(parts[:, m], codebooks[m])
+                arrays["codes"], arrays["codebooks"] = codes, codebooks
+            case _:
+                raise ValueError(f"Unknown quantization {kind}")
+        return cls(kind, arrays, {"kind": kind, "rows": len(vectors)})
+
+    @classmethod
+    def load(cls, directory: str) -> "QuantizedVectors":
+        with open(os.path.join(directory, QUANTIZED_META), "r") as f:
+            meta = json.load(f)
+        arrays = {name: load_array(os.path.join(directory, f"{name}.npy")) for name in QUANTIZED_ARRAYS[meta["kind"]]}
+        return cls(meta["kind"], arrays, meta)
+
+    def save(self, directory: str):
+        save_arrays(directory, self.arrays, self.meta, QUANTIZED_META)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def score(self, query: np.ndarray, rows: np.ndarray | None = None) -> np.ndarray:
+        #approximate dot products with every row, or only with rows, in blocks so the
+        #decoded temporaries stay at QUANTIZED_SCORE_BLOCK rows
+        query = np.asarray(query, dtype=np.float32)
+        count = len(self.codes) if rows is None else len(rows)
+        scores = np.empty(count, dtype=np.float32)
+        match self.kind:
+            case "float16":
+                weights, bias = query, 0.0
+            case "int8":
+                weights, bias = query * self.arrays["scale"], float(query @ self.arrays["offset"])
+            case "pq":
+                codebooks = self.arrays["codebooks"]
+                #one table of subvector dot products per query, a row's score is a sum of lookups
+                table = np.einsum("mkd,md->mk", codebooks, query.reshape(codebooks.shape[0], -1))
+                subvectors = np.arange(codebooks.shape[0])
+        for start in range(0, count, QUANTIZED_SCORE_BLOCK):
+            block = slice(start, start + QUANTIZED_SCORE_BLOCK)
+            codes = self.codes[block] if rows is None else self.codes[rows[block]]
+            if self.kind == "pq":
+                scores[block] = table[subvectors, codes].sum(axis=1)
+            else:
+                scores[block] = codes.astype(np.float32) @ weights + bias
+        return scores
+
+
+def pq_subvectors(dimensions: int) -> int:
+    #the largest count up to PQ_SUBVECTORS that splits the dimensions evenly
+    for subvectors in range(min(PQ_SUBVECTORS, dimensions), 0, -1):
+        if dimensions % subvectors == 0:
+            return subvectors
+    return 1
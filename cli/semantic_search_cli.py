@@ -11,18 +11,34 @@ from lib.semantic_search import (
     semantic_chunks_command,
     embed_chunks_command,
     search_chunked,
+    bench_chunks_command,
+    ann_report_command,
+    quantization_report_command,
+    load_report_command,
+    encoder_parity_command,
+    encoder_bench_command,
 )
+from lib.encoders import set_default_encoder_backend
 from lib.search_utils import (
     DEFAULT_SEARCH_LIMIT,
     DEFAULT_CHUNK_SIZE,
     DEFAULT_CHUNK_OVERLAP,
     MAX_CHUNK_SIZE,
     DEFAULT_SEMANTIC_CHUNK_OVERLAP, 
+    SEMANTIC_BENCHMARK_SIZES,
+    DEFAULT_IVF_NPROBE,
+    IVF_REPORT_NPROBES,
+    EMBEDDING_QUANTIZATIONS,
+    DEFAULT_SEARCH_WORKERS,
+    DEFAULT_ENCODE_WORKERS,
+    ENCODER_BACKENDS,
+    DEFAULT_ENCODER_BACKEND,
 )
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Semantic Search CLI")
+    parser.add_argument("--backend", choices=ENCODER_BACKENDS, default=DEFAULT_ENCODER_BACKEND, help="Runtime of the sentence encoder, defaults to $ENCODER_BACKEND or torch")
     subparsers = parser.add_subparsers(dest="command", required=True, help="Available commands")
 
     subparsers.add_parser("verify", help="Verify Language Model")
@@ -37,6 +53,8 @@ def main() -> None:
     search_parser = subparsers.add_parser("search", help="Search the movie database")
     search_parser.add_argument("query", type=str, help="Query to search movie database")
     search_parser.add_argument("--limit", type=int, nargs="?", default=DEFAULT_SEARCH_LIMIT, help="Set the limit of search results")
+    search_parser.add_argument("--quantization", choices=EMBEDDING_QUANTIZATIONS, help="Search compressed embedding codes")
+    search_parser.add_argument("--no-rescore", action="store_true", help="Keep the approximate scores of --quantization")
 
     chunk_parser = subparsers.add_parser("chunk", help="Split text into smaller pierces")
     chunk_parser.add_argument("text", type=str, help="Text to be split")
@@ -48,13 +66,40 @@ def main() -> None:
     semantic_chunk_parser.add_argument("--max-chunk-size", type=int, nargs="?", default=DEFAULT_CHUNK_SIZE, help="Maximum size of a chunk")
     semantic_chunk_parser.add_argument("--overlap", type=int, nargs="?", default=DEFAULT_CHUNK_OVERLAP)
 
-    subparsers.add_parser("embed_chunks", help="Embed chunks of data")
+    embed_chunks_parser = subparsers.add_parser("embed_chunks", help="Embed chunks of data")
+    embed_chunks_parser.add_argument("--quantization", choices=EMBEDDING_QUANTIZATIONS, help="Also build compressed embedding codes")
+    embed_chunks_parser.add_argument("--workers", type=int, default=DEFAULT_ENCODE_WORKERS, help="Encoder processes, each gets an equal share of the cores")
 
     search_chunked_parser = subparsers.add_parser("search_chunked", help="Search chunked scores of movies to find the most similiar result")
     search_chunked_parser.add_argument("query", type=str, help="Query to be chunk searched")
     search_chunked_parser.add_argument("--limit", type=int, nargs="?", default=DEFAULT_SEARCH_LIMIT, help="Limit the size of your search results")
+    search_chunked_parser.add_argument("--ann", action="store_true", help="Search the IVF index instead of scanning every chunk")
+    search_chunked_parser.add_argument("--nprobe", type=int, default=DEFAULT_IVF_NPROBE, help="IVF lists to score with --ann, higher is slower with better recall")
+    search_chunked_parser.add_argument("--quantization", choices=EMBEDDING_QUANTIZATIONS, help="Search compressed embedding codes")
+    search_chunked_parser.add_argument("--no-rescore", action="store_true", help="Keep the approximate scores of --quantization")
+
+    bench_parser = subparsers.add_parser("bench", help="Time chunked search against the number of chunks")
+    bench_parser.add_argument("--sizes", type=int, nargs="*", default=list(SEMANTIC_BENCHMARK_SIZES), help="Chunk counts to benchmark")
+
+    ann_report_parser = subparsers.add_parser("ann_report", help="Report IVF recall@k and latency against exact chunk search")
+    ann_report_parser.add_argument("--limit", type=int, default=DEFAULT_SEARCH_LIMIT, help="k for recall@k")
+    ann_report_parser.add_argument("--nprobe", type=int, nargs="*", default=list(IVF_REPORT_NPROBES), help="nprobe values to compare")
+
+    quantization_report_parser = subparsers.add_parser("quantization_report", help="Report code size and recall@k of every quantization")
+    quantization_report_parser.add_argument("--limit", type=int, default=DEFAULT_SEARCH_LIMIT, help="k for recall@k")
+
+    load_report_parser = subparsers.add_parser("load_report", help="Time cold start loading and a worker pool sharing one copy of the chunk embeddings")
+    load_report_parser.add_argument("--workers", type=int, default=DEFAULT_SEARCH_WORKERS, help="Worker processes attaching the shared embeddings")
+
+    encoder_parity_parser = subparsers.add_parser("encoder_parity", help="Compare a backend's embeddings and golden recall@k with torch")
+    encoder_parity_parser.add_argument("--against", choices=ENCODER_BACKENDS, default="onnx-int8", help="Backend to compare with torch")
+    encoder_parity_parser.add_argument("--limit", type=int, default=DEFAULT_SEARCH_LIMIT, help="k for recall@k")
+
+    encoder_bench_parser = subparsers.add_parser("encoder_bench", help="Time bulk and single query encoding of every backend")
+    encoder_bench_parser.add_argument("--backends", choices=ENCODER_BACKENDS, nargs="*", default=list(ENCODER_BACKENDS), help="Backends to benchmark")
 
     args = parser.parse_args()
+    set_default_encoder_backend(args.backend)
 
 
 
@@ -66,13 +111,13 @@ def main() -> None:
         case "embedquery":
             embed_query_text(args.query)
         case "embed_chunks":
-            embed_chunks_command()
+            embed_chunks_command(args.quantization, args.workers)
         case "verify":
             verify_model()
         case "verify_embeddings":
             verify_embeddings()
         case "search":
-            results = semantic_search(args.query, args.limit)
+            results = semantic_search(args.query, args.limit, args.quantization, not args.no_rescore)
             for i, res in enumerate(results, 1):
                 print(f"{i}. {res['title']} (score: {res['score']:.4f})\n{res['description']}") 
         case "chunk":
@@ -80,7 +125,29 @@ def main() -> None:
         case "semantic_chunk":
             semantic_chunks_command(args.text, args.max_chunk_size, args.overlap)
         case "search_chunked":
-            search_chunked(args.query, args.limit)
+            search_chunked(args.query, args.limit, args.nprobe if args.ann else None, args.quantization, not args.no_rescore)
+        case "bench":
+            for row in bench_chunks_command(tuple(args.sizes)):
+                loop = "skipped" if row["loop_ms"] is None else f"{row['loop_ms']:.2f}ms"
+                print(f"{row['chunks']} chunks: vectorized {row['vectorized_ms']:.2f}ms, per-chunk loop {loop}")
+        case "ann_report":
+            for row in ann_report_command(args.limit, tuple(args.nprobe)):
+                nprobe = "exact" if row["nprobe"] is None else f"nprobe {row['nprobe']}/{row['lists']}"
+                print(f"{nprobe}: recall@{args.limit} {row['recall']:.3f}, {row['ms']:.2f}ms per query")
+        case "quantization_report":
+            for row in quantization_report_command(args.limit):
+                print(f"{row['quantization']}: {row['bytes'] / 2**20:.1f} MiB, recall@{args.limit} {row['recall']:.3f}, rescored {row['rescored_recall']:.3f}")
+        case "load_report":
+            report = load_report_command(args.workers)
+            print(f"{report['chunks']} chunks: np.load copy {report['copy_load_ms']:.2f}ms, mapped load {report['mapped_load_ms']:.2f}ms")
+            print(f"{report['workers']} workers on {report['shared_bytes'] / 2**20:.1f} MiB shared: {report['pool_ms']:.2f}ms, results match: {report['matches']}")
+        case "encoder_parity":
+            report = encoder_parity_command(args.against, args.limit)
+            print(f"{report['backend']} on {report['texts']} texts: cosine to torch mean {report['mean_cosine']:.5f}, min {report['min_cosine']:.5f}")
+            print(f"recall@{args.limit} torch {report['torch_recall']:.3f}, {report['backend']} {report['backend_recall']:.3f}, top {args.limit} agreement {report['top_k_agreement']:.3f}")
+        case "encoder_bench":
+            for row in encoder_bench_command(tuple(args.backends)):
+                print(f"{row['backend']}: {row['documents_per_second']:.1f} documents/s bulk, {row['query_ms']:.2f}ms per query")
         case _:
             parser.print_help()
 
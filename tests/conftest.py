@@ -0,0 +1,47 @@
+import random
+
+import pytest
+
+from lib import keyword_search
+from lib.keyword_search import Analyzer
+
+#a fixed stop list, so the tests don't depend on data/stopwords.txt
+STOP_WORDS = ["a", "an", "and", "the", "of", "in", "on", "to", "is", "was", "with"]
+
+WORDS = [
+    "knight", "dark", "city", "river", "space", "station", "love", "story", "paris", "bear",
+    "attack", "forest", "ghost", "ship", "island", "robot", "war", "desert", "queen", "thief",
+    "train", "storm", "mountain", "secret", "garden", "hunter", "dragon", "winter", "ocean", "detective",
+]
+
+
+def make_movies(count: int, seed: int = 0, first_id: int = 1) -> list[dict]:
+    #short made up titles and descriptions over a small vocabulary, so queries hit many documents
+    rng = random.Random(seed)
+    movies = []
+    for doc_id in range(first_id, first_id + count):
+        title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).title()
+        sentences = []
+        for _ in range(rng.randint(1, 4)):
+            words = [rng.choice(WORDS + STOP_WORDS) for _ in range(rng.randint(3, 12))]
+            sentences.append(" ".join(words).capitalize() + ".")
+        movies.append({"id": doc_id, "title": title, "description": " ".join(sentences)})
+    return movies
+
+
+@pytest.fixture(autouse=True)
+def analyzer(monkeypatch):
+    monkeypatch.setattr(keyword_search, "_analyzer", Analyzer(STOP_WORDS))
+
+
+@pytest.fixture
+def movies() -> list[dict]:
+    return make_movies(300)
+
+
+@pytest.fixture
+def queries() -> list[str]:
+    rng = random.Random(1)
+    return ["dark knight", "the ghost ship", "love story in paris", "zzz"] + [
+        " ".join(rng.sample(WORDS, rng.randint(1, 4))) for _ in range(20)
+    ]
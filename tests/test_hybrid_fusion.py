@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("google.genai")
+
+from lib.hybrid_search import adaptive_rrf_fusion, adaptive_weighted_fusion, rrf_fusion, weighted_fusion
+from lib.result_cursor import ResultCursor
+
+
+def make_legs(seed: int, decimals: int | None = None):
+    #two legs over overlapping doc ids, bm25 results round their scores like bm25_cursor, decimals forces ties
+    rng = np.random.default_rng(seed)
+    universe = int(rng.integers(5, 400))
+    legs = []
+    for name in ("bm25", "semantic"):
+        keys = rng.choice(universe, size=int(rng.integers(0, universe + 1)), replace=False).astype(np.int64)
+        scores = rng.random(len(keys)) * (10 if name == "bm25" else 1)
+        if decimals is not None:
+            scores = np.round(scores, decimals)
+        legs.append((name, keys, scores))
+    depth = int(rng.integers(1, 600))
+    return legs, depth
+
+
+def cursors(legs, depth) -> tuple[ResultCursor, ResultCursor]:
+    made = []
+    for name, keys, scores in legs:
+        value = (lambda score: round(score, 3)) if name == "bm25" else float
+        format_rows = lambda rows, keys=keys, scores=scores, value=value: [
+            {"id": int(keys[row]), "title": f"movie {keys[row]}", "description": f"about {keys[row]}", "score": value(float(scores[row]))}
+            for row in rows.tolist()
+        ]
+        made.append(ResultCursor(scores, keys, depth, format_rows, value))
+    return made[0], made[1]
+
+
+@pytest.mark.parametrize("decimals", [None, 1])
+def test_adaptive_rrf_matches_exhaustive(decimals):
+    for seed in range(100):
+        legs, depth = make_legs(seed, decimals)
+        for limit in (1, 5, 25):
+            bm25, semantic = cursors(legs, depth)
+            expected = rrf_fusion(bm25.results(), semantic.results(), 60, limit)
+            bm25, semantic = cursors(legs, depth)
+            fused = adaptive_rrf_fusion(bm25, semantic, 60, limit)
+            #read out legs are fused from what was read, only limit <= 0 needs the exhaustive fusion
+            assert fused is not None, (seed, limit)
+            assert fused == expected and list(fused) == list(expected), (seed, limit)
+
+
+@pytest.mark.parametrize("decimals", [None, 1])
+def test_adaptive_weighted_matches_exhaustive(decimals):
+    answered = 0
+    for seed in range(100):
+        legs, depth = make_legs(seed, decimals)
+        for limit in (1, 5, 25):
+            for alpha in (0.0, 0.3, 0.5, 1.0):
+                bm25, semantic = cursors(legs, depth)
+                fused = adaptive_weighted_fusion(bm25, semantic, alpha, limit)
+                if fused is None:
+                    continue
+                bm25, semantic = cursors(legs, depth)
+                assert fused == weighted_fusion(bm25.results(), semantic.results(), alpha, limit), (seed, limit, alpha)
+                answered += 1
+    assert answered > 0
+
+
+def test_adaptive_fusion_reads_less_than_exhaustive():
+    #legs that mostly agree on the best documents, as real queries do
+    rng = np.random.default_rng(0)
+    keys = np.arange(5000, dtype=np.int64)
+    relevance = rng.random(5000)
+    legs = [("bm25", keys, relevance * 10 + rng.random(5000)), ("semantic", keys, relevance + rng.random(5000) * 0.1)]
+    for fuse, argument in ((adaptive_rrf_fusion, 60), (adaptive_weighted_fusion, 0.5)):
+        bm25, semantic = cursors(legs, 2500)
+        assert fuse(bm25, semantic, argument, 5) is not None
+        assert len(bm25.ids) + len(semantic.ids) < 5000
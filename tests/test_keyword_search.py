@@ -0,0 +1,87 @@
+import math
+import multiprocessing
+from collections import Counter
+
+import pytest
+
+from lib.keyword_search import InvertedIndex, get_analyzer
+from lib.search_utils import BM25_B, BM25_K1, INDEX_FIELDS
+
+from conftest import make_movies
+
+
+def reference_bm25(movies: list[dict], query: str, k1: float = BM25_K1, b: float = BM25_B) -> dict[int, float]:
+    #Okapi BM25 of every matching movie, straight from the texts
+    analyzer = get_analyzer()
+    documents = {movie["id"]: Counter(analyzer.tokenize(" ".join(movie[field] for field in INDEX_FIELDS))) for movie in movies}
+    lengths = {doc_id: sum(tfs.values()) for doc_id, tfs in documents.items()}
+    avg_length = sum(lengths.values()) / len(lengths)
+    scores = {}
+    for token, query_tf in Counter(analyzer.tokenize(query)).items():
+        matching = [doc_id for doc_id, tfs in documents.items() if token in tfs]
+        idf = math.log((len(documents) - len(matching) + 0.5) / (len(matching) + 0.5) + 1)
+        for doc_id in matching:
+            tf = documents[doc_id][token]
+            length_norm = 1 - b + b * lengths[doc_id] / avg_length
+            scores[doc_id] = scores.get(doc_id, 0.0) + query_tf * idf * tf * (k1 + 1) / (tf + k1 * length_norm)
+    return scores
+
+
+def all_scores(idx: InvertedIndex, query: str, count: int) -> dict[int, float]:
+    return {result["id"]: result["score"] for result in idx.bm25_search(query, count, typo_tolerance=False)}
+
+
+def build_index(directory, movies: list[dict], **options) -> InvertedIndex:
+    idx = InvertedIndex(str(directory))
+    idx.build(movies=movies, **options)
+    idx.save()
+    return idx
+
+
+@pytest.mark.parametrize("options", [{}, {"compress": True}, {"positions": True}, {"positions": True, "fields": True, "compress": True}])
+def test_segments_match_reference_bm25(tmp_path, movies, queries, options):
+    idx = build_index(tmp_path / "index", movies, **options)
+    loaded = InvertedIndex(str(tmp_path / "index"))
+    loaded.load()
+    for query in queries:
+        expected = reference_bm25(movies, query)
+        for search in (idx, loaded):
+            scores = all_scores(search, query, len(movies))
+            assert scores.keys() == expected.keys(), query
+            for doc_id, score in scores.items():
+                assert score == pytest.approx(expected[doc_id], abs=1e-3), (query, doc_id)
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork", reason="build workers only share the test analyzer when forked")
+def test_parallel_build_matches_single_process(tmp_path, movies, queries):
+    single = build_index(tmp_path / "single", movies, positions=True)
+    parallel = build_index(tmp_path / "parallel", movies, positions=True, workers=3)
+    for query in queries + ['"dark knight"', '"ghost ship"~2']:
+        assert parallel.bm25_search(query, 20) == single.bm25_search(query, 20), query
+
+
+def test_upsert_delete_and_merge_match_a_fresh_build(tmp_path, movies, queries):
+    idx = build_index(tmp_path / "index", movies[:200], positions=True)
+    current = {movie["id"]: movie for movie in movies[:200]}
+
+    changed = [dict(movie, description=movie["description"] + " Dragon winter storm.") for movie in movies[10:30]]
+    idx.upsert(changed + movies[200:260])
+    current.update({movie["id"]: movie for movie in changed + movies[200:260]})
+    deleted = [movie["id"] for movie in movies[40:60]] + [changed[0]["id"], 10_000]
+    assert idx.delete(deleted) == len(deleted) - 1
+    for doc_id in deleted:
+        current.pop(doc_id, None)
+    idx.upsert(make_movies(5, seed=7, first_id=movies[45]["id"]))
+    current.update({movie["id"]: movie for movie in make_movies(5, seed=7, first_id=movies[45]["id"])})
+
+    fresh = build_index(tmp_path / "fresh", sorted(current.values(), key=lambda movie: movie["id"]), positions=True)
+    reloaded = InvertedIndex(str(tmp_path / "index"))
+    reloaded.load()
+    for search in (idx, reloaded):
+        for query in queries + ['"dark knight"']:
+            assert all_scores(search, query, len(current)) == all_scores(fresh, query, len(current)), query
+
+    idx.merge()
+    assert len(idx.segments) == 1 and idx.tombstones == {}
+    for query in queries:
+        assert idx.bm25_search(query, 20) == fresh.bm25_search(query, 20), query
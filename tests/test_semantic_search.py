@@ -0,0 +1,121 @@
+import hashlib
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+from lib.bulk_encoder import BulkEncoder, close_output, open_output
+from lib.query_cache import QueryEmbeddingCache
+from lib.semantic_search import ChunkedSemanticSearch, cosine_similarity
+from lib.vector_index import IVFIndex, normalize_embeddings
+
+from conftest import make_movies
+
+
+class HashingModel:
+    #deterministic stand in for a sentence transformer, fail_after interrupts a build after that many batches
+    def __init__(self, dimensions: int = 16, fail_after: int | None = None):
+        self.dimensions = dimensions
+        self.fail_after = fail_after
+        self.texts = 0
+        self.batches = 0
+
+    def encode(self, texts, batch_size=None, show_progress_bar=False):
+        if self.fail_after is not None and self.batches == self.fail_after:
+            raise KeyboardInterrupt
+        self.batches += 1
+        self.texts += len(texts)
+        return np.stack([self.vector(text) for text in texts])
+
+    def vector(self, text: str) -> np.ndarray:
+        digest = hashlib.blake2b(text.encode(), digest_size=self.dimensions).digest()
+        return np.frombuffer(digest, dtype=np.uint8).astype(np.float32) - 127.5
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimensions
+
+
+def looped_search(query_embedding: np.ndarray, chunk_embeddings: np.ndarray, movie_idx: np.ndarray, documents: list[dict], limit: int) -> list[tuple[int, float]]:
+    #the per chunk loop the vectorized scoring replaced
+    movie_scores = {}
+    for i, chunk_embedding in enumerate(chunk_embeddings):
+        score = cosine_similarity(query_embedding, chunk_embedding)
+        if movie_idx[i] not in movie_scores or score > movie_scores[movie_idx[i]]:
+            movie_scores[movie_idx[i]] = score
+    ranked = sorted(movie_scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+    return [(documents[int(row)]["id"], float(score)) for row, score in ranked]
+
+
+@pytest.fixture
+def chunk_search() -> tuple[ChunkedSemanticSearch, np.ndarray, np.ndarray]:
+    #chunks stored out of movie order like older caches, some movies without any chunk
+    rng = np.random.default_rng(0)
+    documents = make_movies(200)
+    chunk_counts = rng.integers(0, 5, len(documents))
+    movie_idx = np.repeat(np.arange(len(documents), dtype=np.int32), chunk_counts)
+    order = rng.permutation(len(movie_idx))
+    movie_idx = movie_idx[order]
+    chunk_embeddings = normalize_embeddings(rng.standard_normal((len(movie_idx), 32), dtype=np.float32))
+    search = ChunkedSemanticSearch(query_cache=QueryEmbeddingCache())
+    search.documents = documents
+    search.chunk_embeddings = chunk_embeddings
+    search.chunk_metadata = {"movie_idx": movie_idx, "chunk_idx": np.zeros_like(movie_idx), "total_chunks": chunk_counts[movie_idx]}
+    search._group_chunks()
+    return search, chunk_embeddings, movie_idx
+
+
+def test_vectorized_chunk_scoring_matches_loop(chunk_search):
+    search, chunk_embeddings, movie_idx = chunk_search
+    rng = np.random.default_rng(1)
+    for i in range(10):
+        query_embedding = normalize_embeddings(rng.standard_normal(32, dtype=np.float32))
+        search.query_cache.put(search.encoder_id, f"query {i}", query_embedding)
+        for limit in (1, 10, 1000):
+            expected = looped_search(query_embedding, chunk_embeddings, movie_idx, search.documents, limit)
+            results = search.search_chunks(f"query {i}", limit)
+            assert [result["id"] for result in results] == [doc_id for doc_id, _ in expected]
+            assert [result["score"] for result in results] == pytest.approx([score for _, score in expected], abs=1e-5)
+
+
+def test_probing_every_ivf_list_matches_exhaustive_search(chunk_search):
+    search, _, _ = chunk_search
+    search.vector_index = IVFIndex.build(search.chunk_embeddings, n_lists=8)
+    rng = np.random.default_rng(2)
+    for i in range(10):
+        search.query_cache.put(search.encoder_id, f"query {i}", rng.standard_normal(32, dtype=np.float32))
+        assert search.search_chunks(f"query {i}", 10, nprobe=8) == search.search_chunks(f"query {i}", 10)
+
+
+def test_interrupted_bulk_encode_resumes(tmp_path):
+    texts = [" ".join(movie["description"].split()[:20]) for movie in make_movies(300)]
+    path = str(tmp_path / "embeddings.npy")
+    expected = normalize_embeddings(np.stack([HashingModel().vector(text) for text in texts]))
+
+    output, done = open_output(path, len(texts), 16, "job")
+    with BulkEncoder("hashing", HashingModel(fail_after=5), batch_tokens=64, max_batch=8) as encoder:
+        with pytest.raises(KeyboardInterrupt):
+            encoder.encode_into(texts, output, done)
+    del output, done
+
+    output, done = open_output(path, len(texts), 16, "job")
+    finished = int(done.sum())
+    assert 0 < finished < len(texts)
+    model = HashingModel()
+    with BulkEncoder("hashing", model, batch_tokens=64, max_batch=8) as encoder:
+        assert encoder.encode_into(texts, output, done) == len(texts) - finished
+    assert model.texts == len(texts) - finished
+    close_output(path, output)
+    np.testing.assert_allclose(np.load(path), expected, atol=1e-6)
+    assert not os.path.exists(f"{path}.checkpoint.json") and not os.path.exists(f"{path}.done.npy")
+
+
+def test_another_job_does_not_resume(tmp_path):
+    path = str(tmp_path / "embeddings.npy")
+    output, done = open_output(path, 10, 16, "job")
+    done[:5] = True
+    done.flush()
+    del output, done
+    _, done = open_output(path, 10, 16, "other job")
+    assert not done.any()
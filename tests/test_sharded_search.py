@@ -0,0 +1,20 @@
+import pytest
+
+from lib import sharded_search
+from lib.keyword_search import InvertedIndex
+from lib.sharded_search import ShardedIndex
+
+
+@pytest.mark.parametrize("shard_count", [1, 3])
+def test_sharded_scores_match_a_single_index(tmp_path, monkeypatch, movies, queries, shard_count):
+    monkeypatch.setattr(sharded_search, "load_movies", lambda: movies)
+    idx = InvertedIndex(str(tmp_path / "index"))
+    idx.build(movies=movies, positions=True, fields=True)
+    sharded = ShardedIndex()
+    sharded.shards_dir = str(tmp_path / "shards")
+    sharded.build(shard_count, positions=True, fields=True)
+    typos = ["knigth dark", "ghots ship", '"dark knight"']
+    with sharded:
+        for query in queries + typos:
+            for limit, fields in ((5, False), (50, False), (10, True)):
+                assert sharded.bm25_search(query, limit, fields=fields) == idx.bm25_search(query, limit, fields=fields), (query, limit, fields)